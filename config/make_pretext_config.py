@@ -37,6 +37,8 @@ configuration = {
     "negative_samples": 10, # Number of negative samples to be used for training
     "subsample": True, # Boolean to decide whether to subsample from the total sequence lengh within intermediate layers
     "calc_accuracy": True,
+    "negative_queue_size": 0, # Number of latents from previous steps kept as extra negatives (0: current batch only)
+    "negative_queue_staleness": None, # Maximum age (steps) of queued latents used as negatives (None: no limit)
     # tensorboard
     "tensorboard_writer_name": "./runs/{}".format(name),
     # checkpoint
@@ -0,0 +1,139 @@
+import argparse
+import json
+import hashlib
+import numpy as np
+import torch
+from torch.utils import data
+from tqdm import tqdm
+import src.data.dataset as dataset
+import src.models.model as model_pack
+import src.utils.interface_device as device_pack
+import src.utils.interface_embedding_store as embedding_store
+
+
+# frozen pretext model을 filelist에 한번만 실행해서 embedding store entry를 만듦
+# layer: get_projection (projection), get_representation (encoder output), context (CPC의 context c)
+LAYERS = ['get_projection', 'get_representation', 'context']
+
+
+def crop_offsets(length, audio_window, num_crops):
+    # 결정적인 crop 위치: 1개면 가운데, 여러개면 처음부터 끝까지 같은 간격
+    if num_crops == 1:
+        return [(length - audio_window) // 2]
+    return [int(offset) for offset in np.linspace(0, length - audio_window, num_crops).round()]
+
+
+def layer_output(pretext_model, x, layer):
+    # downstream trainer가 pretext model에서 받는 tensor와 같은 shape (batch, ...)
+    if layer == 'context':
+        return pretext_model(x)[3]
+    if layer == 'get_projection':
+        return pretext_model.get_projection(x)[0]
+    return pretext_model.get_representation(x)
+
+
+def get_label_attribute(waveform_dataset):
+    return 'acoustic_dict' if hasattr(waveform_dataset, 'acoustic_dict') else 'speaker_dict'
+
+
+def get_waveform_dataset(config, mode):
+    # 전체 audio를 augmentation 없이 읽고 crop은 여기서 정함
+    waveform_config = dict(config, full_audio=True, **{'{}_augmentation'.format(mode): False,
+                                                       '{}_embedding_store'.format(mode): None})
+    _, waveform_dataset = dataset.get_dataloader(config=waveform_config, mode=mode)
+    return waveform_dataset
+
+
+def get_store_key(config, mode, layer, num_crops):
+    entry = model_pack.MODEL_REGISTRY[config['pretext_model_name']]
+    config_keys = entry.config_keys.values() if isinstance(entry.config_keys, dict) else entry.config_keys
+    with open(config['{}_dataset'.format(mode)], 'r') as filelist:
+        filelist_sha256 = hashlib.sha256(filelist.read().encode('utf-8')).hexdigest()
+    description = {
+        'pretext_model_name': config['pretext_model_name'],
+        'model_config': {key: config[key] for key in config_keys},
+        'dataset_type': config['dataset_type'],
+        'filelist_sha256': filelist_sha256,
+        'audio_window': config['audio_window'],
+        'sampling_rate': config['sampling_rate'],
+        'layer': layer,
+        'num_crops': num_crops,
+    }
+    return embedding_store.make_key(config['pretext_checkpoint'], description), description
+
+
+def extract_embeddings(config, mode, layer='get_projection', num_crops=1, root=None, format_logger=print):
+    key, description = get_store_key(config, mode, layer, num_crops)
+    if embedding_store.has_entry(key, root):
+        format_logger("{} embedding store entry exists: {}".format(mode, embedding_store.get_entry_path(key, root)))
+        return embedding_store.get_entry_path(key, root)
+
+    device_context = device_pack.get_device_context(config)
+    pretext_model = model_pack.load_model(config, config['pretext_model_name'], config['pretext_checkpoint'])
+    pretext_model = device_context.to_module(pretext_model).eval()
+    waveform_dataset = get_waveform_dataset(config, mode)
+    label_attribute = get_label_attribute(waveform_dataset)
+    label_dict = getattr(waveform_dataset, label_attribute)
+    label_list = sorted(label_dict.keys(), key=lambda label: label_dict[label])
+    # item별로 길이가 달라서 batch 없이 읽고, crop을 모아서 batch_size 단위로 실행
+    data_loader = data.DataLoader(waveform_dataset, batch_size=None, shuffle=False,
+                                  num_workers=config['num_workers'])
+    writer = embedding_store.EmbeddingWriter(key, len(waveform_dataset) * num_crops, root)
+    filenames = []
+    crops, labels, file_index = [], [], []
+
+    def flush():
+        with torch.no_grad(), device_context.autocast():
+            output = layer_output(pretext_model, device_context.to(torch.stack(crops)), layer)
+        writer.write(output.float().cpu().numpy(), np.array(labels), np.array(file_index))
+        crops.clear()
+        labels.clear()
+        file_index.clear()
+
+    try:
+        for index, item in enumerate(tqdm(data_loader, desc='{} embeddings'.format(mode))):
+            waveform, label = item[0], item[-1]
+            if len(item) == 3:
+                filenames.append(item[1])
+            for offset in crop_offsets(waveform.size(1), config['audio_window'], num_crops):
+                crops.append(waveform[:, offset:offset + config['audio_window']])
+                labels.append(label_dict[label])
+                file_index.append(index)
+            if len(crops) >= config['batch_size']:
+                flush()
+        if len(crops) > 0:
+            flush()
+    except BaseException:
+        writer.abort()
+        raise
+    metadata = dict(description, mode=mode, label_list=label_list, label_attribute=label_attribute,
+                    file_list=waveform_dataset.file_list)
+    if len(filenames) > 0:
+        metadata['filenames'] = filenames
+    entry_path = writer.close(metadata)
+    format_logger("{} embedding store entry: {}".format(mode, entry_path))
+    return entry_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='waverdeep - extract pretext embeddings into the embedding store')
+    parser.add_argument('--configuration', required=False,
+                        default='./config/config-pretext-WaveBYOLEfficientB7-UrbanSound8K-64000.json')
+    parser.add_argument('--layer', default='get_projection', choices=LAYERS)
+    parser.add_argument('--num_crops', default=1, type=int)
+    parser.add_argument('--modes', default=['train', 'test'], nargs='+')
+    parser.add_argument('--root', default=None, help='embedding store directory (default: $EMBEDDING_STORE_DIR)')
+    args = parser.parse_args()
+    with open(args.configuration, 'r') as configuration:
+        config = json.load(configuration)
+
+    entry_paths = {}
+    for mode in args.modes:
+        entry_paths['{}_embedding_store'.format(mode)] = extract_embeddings(config, mode, layer=args.layer,
+                                                                           num_crops=args.num_crops, root=args.root)
+    # downstream config에 그대로 넣으면 trainer가 store에서 학습함
+    print(json.dumps(entry_paths, indent=2))
+
+
+if __name__ == '__main__':
+    main()
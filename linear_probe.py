@@ -0,0 +1,53 @@
+import argparse
+import json
+import time
+import src.models.model_linear_probe as linear_probe
+import src.utils.interface_device as device_pack
+import src.utils.interface_embedding_store as embedding_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='waverdeep - linear probe on stored embeddings')
+    parser.add_argument('--configuration', required=False,
+                        default='./config/config-pretext-WaveBYOLEfficientB7-UrbanSound8K-64000.json')
+    parser.add_argument('--alphas', default=[0.0, 1e-2, 1e-1, 1.0, 10.0, 100.0, 1000.0], nargs='+', type=float)
+    parser.add_argument('--learning_rates', default=[1e-4, 3e-4, 1e-3], nargs='+', type=float)
+    parser.add_argument('--weight_decays', default=[0.0, 1e-5, 1e-4], nargs='+', type=float)
+    parser.add_argument('--hidden_sizes', default=[0, 256, 512], nargs='+', type=int)
+    parser.add_argument('--epochs', default=50, type=int)
+    parser.add_argument('--batch_size', default=256, type=int)
+    args = parser.parse_args()
+    with open(args.configuration, 'r') as configuration:
+        config = json.load(configuration)
+    device_context = device_pack.get_device_context(config)
+
+    train_x, train_y, label_list = embedding_store.load_tensors(config['train_embedding_store'])
+    test_x, test_y, _ = embedding_store.load_tensors(config['test_embedding_store'], label_list)
+    train_x, test_x = linear_probe.standardize(train_x, test_x)
+    num_classes = len(label_list)
+    print("train {} / test {} embeddings, dim {}, {} classes".format(
+        len(train_x), len(test_x), train_x.size(1), num_classes))
+
+    start = time.perf_counter()
+    classifiers = linear_probe.ridge_classifiers(train_x, train_y, num_classes, args.alphas)
+    for alpha, (weight, bias) in zip(args.alphas, classifiers):
+        test_accuracy = linear_probe.accuracy(test_x @ weight + bias, test_y).item()
+        print("{:>14s} | alpha {:>8g} | test accuracy {:.2f}%".format(
+            'least squares' if alpha == 0 else 'ridge', alpha, test_accuracy * 100))
+    print("closed form: {} classifiers in {:.2f} sec".format(len(args.alphas), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    grid = linear_probe.probe_grid(args.learning_rates, args.weight_decays, args.hidden_sizes)
+    train_x, train_y, test_x, test_y = [device_context.to_tensor(tensor) for tensor in [train_x, train_y, test_x, test_y]]
+    results = linear_probe.train_stacked_heads(train_x, train_y, test_x, test_y, num_classes, grid,
+                                               epochs=args.epochs, batch_size=args.batch_size)
+    for setting, (final_accuracy, best_accuracy) in zip(grid, results):
+        print("{:>14s} | lr {:>8g} | weight decay {:>8g} | hidden {:>4d} | test accuracy {:.2f}% (best {:.2f}%)".format(
+            'stacked head', setting['learning_rate'], setting['weight_decay'], setting['hidden_size'],
+            final_accuracy * 100, best_accuracy * 100))
+    print("stacked heads: {} heads x {} epochs in {:.2f} sec".format(
+        len(grid), args.epochs, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
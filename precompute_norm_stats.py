@@ -0,0 +1,63 @@
+import argparse
+import json
+import multiprocessing
+import functools
+import numpy as np
+import torch
+from tqdm import tqdm
+import src.utils.interface_file_io as file_io
+import src.utils.interface_audio_io as audio_io
+import src.utils.interface_audio_augmentation as audio_augmentation
+
+
+def compute_partial_norm_stats(file_list, config):
+    # (count, mean, M2) of the log mel spectrogram values of one chunk of the filelist
+    to_melspectrogram = audio_io.MelSpectrogramLibrosa(
+        fs=config['sampling_rate'],
+        n_fft=config['n_fft'],
+        shift=config['hop_length'],
+        n_mels=config['n_mels'],
+        fmin=config['f_min'],
+        fmax=config['f_max'],
+    )
+    stats = (0, 0.0, 0.0)
+    for audio_file in file_list:
+        waveform, sampling_rate = audio_io.audio_loader(audio_file[4:])  # audio file 위치에 따른 수정 코드
+        waveform = audio_io.audio_adjust_length(waveform, config['audio_window'])[0]
+        log_mel_spectrogram = (to_melspectrogram(waveform) + torch.finfo().eps).log().double()
+        mean = log_mel_spectrogram.mean().item()
+        m2 = ((log_mel_spectrogram - mean) ** 2).sum().item()
+        stats = audio_augmentation.merge_norm_stats(stats, (log_mel_spectrogram.numel(), mean, m2))
+    return stats
+
+
+def precompute_norm_stats(config, file_list, num_workers, chunk_size=64):
+    chunks = [file_list[i:i + chunk_size] for i in range(0, len(file_list), chunk_size)]
+    stats = (0, 0.0, 0.0)
+    with multiprocessing.Pool(num_workers) as pool:
+        partial_stats = pool.imap_unordered(functools.partial(compute_partial_norm_stats, config=config), chunks)
+        for partial in tqdm(partial_stats, total=len(chunks), desc='norm stats'):
+            stats = audio_augmentation.merge_norm_stats(stats, partial)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='waverdeep - precompute log mel normalization statistics')
+    parser.add_argument('--configuration', required=False,
+                        default='./config/config_pretext-BYOLA-urbansound-training01-batch256.json')
+    parser.add_argument('--num_workers', default=multiprocessing.cpu_count() - 1, type=int)
+    args = parser.parse_args()
+
+    with open(args.configuration, 'r') as configuration:
+        config = json.load(configuration)
+
+    file_list = file_io.read_txt2list(config['train_dataset'])
+    stats = precompute_norm_stats(config, file_list, args.num_workers)
+    audio_augmentation.save_norm_stats(config['norm_stats'], stats)
+    count, mean, m2 = stats
+    print("files: {} values: {} mean: {} std: {}".format(len(file_list), count, mean, np.sqrt(m2 / count)))
+    print("saved {}".format(config['norm_stats']))
+
+
+if __name__ == '__main__':
+    main()
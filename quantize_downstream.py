@@ -0,0 +1,93 @@
+import argparse
+import copy
+import json
+import time
+import itertools
+import torch
+import src.data.dataset as dataset
+import src.models.model as model_pack
+import src.models.model_inference as inference_pack
+import src.models.model_quantization as quantization
+
+
+def make_target(label, label_dict):
+    return torch.tensor([label_dict[item] for item in label], dtype=torch.long)
+
+
+def get_label_dict(label_dataset):
+    # urbansound8k: acoustic_dict, voxceleb / librispeech: speaker_dict
+    if hasattr(label_dataset, 'acoustic_dict'):
+        return label_dataset.acoustic_dict
+    return label_dataset.speaker_dict
+
+
+def calibration_batches(config, num_batches):
+    # train filelist에서 섞어서 몇 batch만 사용 (augmentation은 test와 동일하게)
+    calibration_config = dict(config, dataset_shuffle=True, train_augmentation=config.get('test_augmentation', False))
+    calibration_loader, _ = dataset.get_dataloader(config=calibration_config, mode='train')
+    return [batch[0] for batch in itertools.islice(calibration_loader, num_batches)]
+
+
+def measure_latency(branch, downstream_model, x, method, steps=10, warmup=3):
+    # batch 하나의 CPU latency (ms)
+    for _ in range(warmup):
+        quantization.predict(branch, downstream_model, x, method)
+    start = time.perf_counter()
+    for _ in range(steps):
+        quantization.predict(branch, downstream_model, x, method)
+    return (time.perf_counter() - start) / steps * 1000
+
+
+def measure_accuracy(branch, downstream_model, data_loader, label_dict, method):
+    correct, total = 0, 0
+    for batch in data_loader:
+        targets = make_target(batch[-1], label_dict)
+        predictions = quantization.predict(branch, downstream_model, batch[0].float(), method)
+        correct += (predictions.argmax(dim=1) == targets).sum().item()
+        total += targets.size(0)
+    return correct / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='waverdeep - post-training quantization of pretext/downstream models')
+    parser.add_argument('--configuration', required=False,
+                        default='./config/config-pretext-WaveBYOLEfficientB7-UrbanSound8K-64000.json')
+    parser.add_argument('--method', default='get_projection', choices=inference_pack.METHODS)
+    parser.add_argument('--static_conv', action='store_true', help='static int8 quantization of the PreNetwork Conv1d')
+    parser.add_argument('--calibration_batches', default=8, type=int)
+    parser.add_argument('--output', default=None, help='quantized checkpoint (default: <downstream_checkpoint>-int8.pt)')
+    parser.add_argument('--num_threads', default=None, type=int)
+    args = parser.parse_args()
+    with open(args.configuration, 'r') as configuration:
+        config = json.load(configuration)
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    pretext_model = model_pack.load_model(config, config['pretext_model_name'], config['pretext_checkpoint'])
+    downstream_model = model_pack.load_model(config, config['downstream_model_name'], config['downstream_checkpoint'])
+    calibration_inputs = calibration_batches(config, args.calibration_batches) if args.static_conv else []
+    branch, quantized_downstream_model, metadata = quantization.quantize_models(
+        pretext_model, downstream_model, method=args.method, static_conv=args.static_conv,
+        calibration_inputs=calibration_inputs)
+    output = args.output if args.output is not None else "{}-int8.pt".format(config['downstream_checkpoint'])
+    quantization.save_quantized_checkpoint(output, branch, quantized_downstream_model, metadata)
+    print("saved {} ({})".format(output, metadata))
+
+    # fp32 (같은 online branch)와 int8 비교: state_dict 크기, batch latency, test accuracy
+    float_branch = copy.deepcopy(inference_pack.OnlineBranch(pretext_model, method=args.method)).float().cpu().eval()
+    float_downstream_model = downstream_model.float().cpu().eval()
+    test_loader, test_dataset = dataset.get_dataloader(config=config, mode='test')
+    train_loader, train_dataset = dataset.get_dataloader(config=config, mode='train')
+    label_dict = get_label_dict(train_dataset)
+    x = torch.rand(config['batch_size'], 1, config['audio_window'])
+    for name, (model_branch, model_downstream) in [('fp32', (float_branch, float_downstream_model)),
+                                                   ('int8', (branch, quantized_downstream_model))]:
+        size = quantization.state_dict_size(model_branch, model_downstream)
+        latency = measure_latency(model_branch, model_downstream, x, args.method)
+        accuracy = measure_accuracy(model_branch, model_downstream, test_loader, label_dict, args.method)
+        print("{} | size {:.1f} MB | latency {:.2f} ms / batch {} | test accuracy {:.2f}%".format(
+            name, size, latency, config['batch_size'], accuracy * 100))
+
+
+if __name__ == '__main__':
+    main()
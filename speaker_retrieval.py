@@ -0,0 +1,60 @@
+import os
+import argparse
+import json
+import time
+import src.utils.interface_embedding_store as embedding_store
+import src.utils.interface_vector_index as vector_index
+
+
+def main():
+    # train embedding (gallery)으로 IVF-PQ index를 만들고 test embedding (query)으로 kNN accuracy / recall@k 측정
+    parser = argparse.ArgumentParser(description='waverdeep - speaker retrieval / kNN evaluation on stored embeddings')
+    parser.add_argument('--configuration', required=False,
+                        default='./config/config-downstream-WaveBYOL-VoxCeleb.json')
+    parser.add_argument('--index', default=None, help='saved index (.npz), built from train embeddings if missing')
+    parser.add_argument('--num_lists', default=1024, type=int)
+    parser.add_argument('--num_subquantizers', default=16, type=int)
+    parser.add_argument('--nprobe', default=[1, 4, 16, 64], nargs='+', type=int)
+    parser.add_argument('--k', default=10, type=int)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+    with open(args.configuration, 'r') as configuration:
+        config = json.load(configuration)
+
+    gallery_x, gallery_y, label_list = embedding_store.load_tensors(config['train_embedding_store'])
+    query_x, query_y, _ = embedding_store.load_tensors(config['test_embedding_store'], label_list)
+    gallery_x, gallery_y = gallery_x.to(args.device), gallery_y.to(args.device)
+    query_x, query_y = query_x.to(args.device), query_y.to(args.device)
+    print("gallery {} / query {} embeddings, dim {}".format(len(gallery_x), len(query_x), gallery_x.size(1)))
+
+    if args.index is not None and os.path.exists(args.index):
+        index = vector_index.IVFPQIndex.load(args.index, device=args.device)
+    else:
+        start = time.perf_counter()
+        index = vector_index.IVFPQIndex(gallery_x.size(1), num_lists=args.num_lists,
+                                        num_subquantizers=args.num_subquantizers, device=args.device)
+        index.train(gallery_x).add(gallery_x)
+        print("build: {:.2f} sec".format(time.perf_counter() - start))
+        if args.index is not None:
+            index.save(args.index)
+    flat_bytes = gallery_x.numel() * gallery_x.element_size()
+    print("index {:.1f} MB (flat float32 {:.1f} MB)".format(index.nbytes() / 2 ** 20, flat_bytes / 2 ** 20))
+
+    start = time.perf_counter()
+    exact_scores, exact_ids = vector_index.exact_search(query_x, gallery_x, args.k)
+    exact_time = time.perf_counter() - start
+    exact_accuracy = vector_index.knn_accuracy(exact_ids, exact_scores, gallery_y, query_y, len(label_list))
+    print("{:>8s} | {:.3f} ms / query | {}-NN accuracy {:.2f}%".format(
+        'exact', exact_time / len(query_x) * 1000, args.k, exact_accuracy * 100))
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        scores, ids = index.search(query_x, k=args.k, nprobe=nprobe)
+        search_time = time.perf_counter() - start
+        accuracy = vector_index.knn_accuracy(ids, scores, gallery_y, query_y, len(label_list))
+        print("{:>8s} | {:.3f} ms / query ({:.1f}x exact) | {}-NN accuracy {:.2f}% | recall@{} {:.3f}".format(
+            'nprobe {}'.format(nprobe), search_time / len(query_x) * 1000, exact_time / search_time, args.k,
+            accuracy * 100, args.k, vector_index.recall_at_k(ids, exact_ids)))
+
+
+if __name__ == '__main__':
+    main()
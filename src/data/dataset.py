@@ -1,3 +1,4 @@
+import torch
 import torchaudio
 from torch.utils import data
 import src.data.dataset_librispeech as dataset_librispeech
@@ -7,13 +8,57 @@ import src.data.dataset_baseline as dataset_baseline
 import src.data.dataset_urbansound8k as dataset_urbansound8k
 import src.data.dataset_speech_command as dataset_speech_command
 import src.data.dataset_byol_light as dataset_byol_light
+import src.data.dataset_embedding as dataset_embedding
 torchaudio.set_audio_backend("sox_io")
 
 
+def get_augmentation_profile(config, mode):
+    # only the training augmentation is profiled
+    if mode != 'train':
+        return None
+    return config.get('augmentation_profile_directory', None)
+
+
+def fused_view_collate(batch):
+    # (x01, x02, ...) item들을 (x01 batch, x02 batch) 순서로 batch 축에 이어 붙여서 넘겨줌 -> model(views)로 바로 실행
+    views = torch.stack([item[0] for item in batch] + [item[1] for item in batch])
+    others = data.dataloader.default_collate([item[2:] for item in batch]) if len(batch[0]) > 2 else []
+    return (views, None, *others)
+
+
+def get_collate_fn(config):
+    # pre_concatenated_views: 두 view를 미리 이어 붙인 batch를 넘겨주는 옵션 (fused view 모델 전용)
+    if config.get('pre_concatenated_views', False):
+        return fused_view_collate
+    return None
+
+
+def use_embedding_store(config):
+    # trainer는 store mode에서 pretext model을 만들지 않으므로 train / test 둘 다 store가 있어야 함
+    train_store = config.get('train_embedding_store', None) is not None
+    test_store = config.get('test_embedding_store', None) is not None
+    assert (train_store == test_store), \
+        "train_embedding_store and test_embedding_store must be set together (train: {}, test: {})".format(
+            config.get('train_embedding_store', None), config.get('test_embedding_store', None))
+    return train_store
+
+
 def get_dataloader(config, mode='train'):
     dataset_type = config['dataset_type']
     waveform_dataset = None
 
+    # <mode>_embedding_store: extract_embeddings.py로 만든 entry가 있으면 waveform 대신 저장된 embedding을 읽음
+    if config.get('{}_embedding_store'.format(mode), None) is not None:
+        dataset = dataset_embedding.EmbeddingStoreDataset(entry_path=config['{}_embedding_store'.format(mode)])
+        dataloader = data.DataLoader(
+            dataset=dataset,
+            batch_size=config['batch_size'],
+            shuffle=config['dataset_shuffle'],
+            num_workers=config['num_workers'],
+            pin_memory=config['pin_memory'],
+        )
+        return dataloader, dataset
+
 
 
     if dataset_type == 'BYOLAudioDataset':
@@ -41,7 +86,8 @@ def get_dataloader(config, mode='train'):
             file_path=config['{}_dataset'.format(mode)],
             audio_window=config['audio_window'],
             sampling_rate=config['sampling_rate'],
-            augmentation=config['{}_augmentation'.format(mode)]
+            augmentation=config['{}_augmentation'.format(mode)],
+            augmentation_profile=get_augmentation_profile(config, mode),
         )
 
         dataloader = data.DataLoader(
@@ -50,6 +96,7 @@ def get_dataloader(config, mode='train'):
             shuffle=config['dataset_shuffle'],
             num_workers=config['num_workers'],
             pin_memory=config['pin_memory'],
+            collate_fn=get_collate_fn(config),
         )
 
         return dataloader, waveform_dataset
@@ -70,12 +117,19 @@ def get_dataloader(config, mode='train'):
     elif dataset_type == 'SpeechCommandWaveformDataset':
         waveform_dataset = dataset_speech_command.SpeechCommandWaveformDataset
 
+    dataset_options = {}
+    if dataset_type == 'BaselineWaveformDatasetByBYOL':
+        dataset_options['augmentation_profile'] = get_augmentation_profile(config, mode)
+    if dataset_type in ['BaselineWaveformDataset', 'BaselineWaveformDatasetByBYOL', 'VoxCelebWaveformDataset']:
+        dataset_options['vad_manifest'] = config.get('{}_vad_manifest'.format(mode), None)
+
     dataset = waveform_dataset(
         file_path=config['{}_dataset'.format(mode)],
         audio_window=config['audio_window'],
         sample_rate=config['sampling_rate'],
         full_audio=config['full_audio'],
-        augmentation=config['{}_augmentation'.format(mode)]
+        augmentation=config['{}_augmentation'.format(mode)],
+        **dataset_options
     )
 
     dataloader = data.DataLoader(
@@ -84,6 +138,7 @@ def get_dataloader(config, mode='train'):
         shuffle=config['dataset_shuffle'],
         num_workers=config['num_workers'],
         pin_memory=config['pin_memory'],
+        collate_fn=get_collate_fn(config) if dataset_type.endswith('ByBYOL') else None,
     )
 
     return dataloader, dataset
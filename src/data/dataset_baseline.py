@@ -7,6 +7,7 @@ import torch.nn.functional as F
 # custom library
 import src.utils.interface_audio_io as audio_io
 import src.utils.interface_audio_augmentation as audio_augmentation
+import src.utils.interface_augmentation_profiler as augmentation_profiler
 
 # local library
 import numpy as np
@@ -41,7 +42,7 @@ def load_data_pipeline(audio_file, required_sample_rate, audio_window, full_audi
 
 
 def load_data_pipeline_by_byol(audio_file, required_sample_rate, audio_window, full_audio, augmentation,
-                               cut_silence=None):
+                               cut_silence=None, profiler=None):
     waveform, sample_rate = audio_io.audio_loader("{}".format(audio_file))
 
     if cut_silence is not None:
@@ -62,10 +63,12 @@ def load_data_pipeline_by_byol(audio_file, required_sample_rate, audio_window, f
     if augmentation:
         aug01_waveform = audio_augmentation.audio_augmentation_pipeline(aug01_waveform, sample_rate,
                                                                         audio_window,
-                                                                        random.sample(augmentation_list, 3))
+                                                                        random.sample(augmentation_list, 3),
+                                                                        profiler=profiler)
         aug02_waveform = audio_augmentation.audio_augmentation_pipeline(aug02_waveform, sample_rate,
                                                                         audio_window,
-                                                                        random.sample(augmentation_list, 3))
+                                                                        random.sample(augmentation_list, 3),
+                                                                        profiler=profiler)
 
     aug01_waveform = audio_io.audio_adjust_length(aug01_waveform, audio_window)
     aug02_waveform = audio_io.audio_adjust_length(aug02_waveform, audio_window)
@@ -76,7 +79,7 @@ def load_data_pipeline_by_byol(audio_file, required_sample_rate, audio_window, f
 # training CPC pretext model
 class BaselineWaveformDataset(Dataset):
     def __init__(self, file_path: str, audio_window=20480, sample_rate=16000,
-                 full_audio=False, augmentation=False):
+                 full_audio=False, augmentation=False, vad_manifest=None):
         super(BaselineWaveformDataset, self).__init__()
         self.file_path = file_path
         self.audio_window = audio_window
@@ -89,23 +92,48 @@ class BaselineWaveformDataset(Dataset):
         self.file_list = [x.strip() for x in id_data.readlines()]
         id_data.close()
 
+        # speech boundaries (sec) cached by audio_io.make_vad_manifest, used to cut leading/trailing silence
+        self.speech_boundary = None
+        if vad_manifest is not None:
+            self.speech_boundary = audio_io.load_vad_manifest(vad_manifest)
+
     def __len__(self):
         return len(self.file_list)
 
+    def get_speech_boundary(self, index):
+        if self.speech_boundary is None:
+            return None
+        return self.speech_boundary.get(self.file_list[index], None)
+
     def __getitem__(self, index):
         audio_file = get_audio_file(self.file_list, index)
         waveform = load_data_pipeline(audio_file, required_sample_rate=self.sample_rate,
                                       audio_window=self.audio_window, full_audio=self.full_audio,
-                                      augmentation=self.augmentation)
+                                      augmentation=self.augmentation, cut_silence=self.get_speech_boundary(index))
         return waveform
 
 
 # training waveBYOL base pretext model
 class BaselineWaveformDatasetByBYOL(BaselineWaveformDataset):
+    def __init__(self, file_path: str, audio_window=20480, sample_rate=16000,
+                 full_audio=False, augmentation=False, vad_manifest=None, augmentation_profile=None):
+        super(BaselineWaveformDatasetByBYOL, self).__init__(file_path=file_path, audio_window=audio_window,
+                                                           sample_rate=sample_rate, full_audio=full_audio,
+                                                           augmentation=augmentation, vad_manifest=vad_manifest)
+        self.profiler = None
+        if augmentation_profile is not None:
+            self.profiler = augmentation_profiler.AugmentationProfiler(augmentation_profile)
+
     def __getitem__(self, index):
         audio_file = get_audio_file(self.file_list, index)
+        if self.profiler is not None:
+            self.profiler.start_item(index)
         aug01_waveform, aug02_waveform = load_data_pipeline_by_byol(audio_file, required_sample_rate=self.sample_rate,
                                                                     audio_window=self.audio_window,
                                                                     full_audio=self.full_audio,
-                                                                    augmentation=self.augmentation)
+                                                                    augmentation=self.augmentation,
+                                                                    cut_silence=self.get_speech_boundary(index),
+                                                                    profiler=self.profiler)
+        if self.profiler is not None:
+            self.profiler.flush()
         return aug01_waveform, aug02_waveform
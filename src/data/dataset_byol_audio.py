@@ -14,16 +14,33 @@ import numpy as np
 import random
 
 
+def log_mel_shape(config, audio_window):
+    # (n_mels, frame) of the log mel spectrogram, librosa.stft pads both ends (center=True)
+    return config['n_mels'], 1 + audio_window // config['hop_length']
+
+
 # training BYOL-Audio pretext model - only byol-audio
 class BYOLAudioDataset(dataset_baseline.BaselineWaveformDataset):
     def __init__(self, directory_path, audio_window=20480, full_audio=False, config=None, use_librosa=True,
                  mode='train'):
         super().__init__(directory_path=directory_path, audio_window=audio_window, full_audio=full_audio)
         self.config = config
+        shared_memory = config.get('shared_memory_bank', False)
+        norm_stats = config.get('norm_stats', None)
         if mode == 'train':
-            self.transforms = audio_augmentation.AugmentationModule((64, 96), 2 * len(self.file_list))
+            self.transforms = audio_augmentation.AugmentationModule(log_mel_shape(config, audio_window),
+                                                                    2 * len(self.file_list),
+                                                                    shared_memory=shared_memory,
+                                                                    norm_stats=norm_stats)
         else:
-            self.transforms = audio_augmentation.AugmentationModule((64, 96), 2 * len(self.file_list))
+            self.transforms = audio_augmentation.AugmentationModule(log_mel_shape(config, audio_window),
+                                                                    2 * len(self.file_list),
+                                                                    shared_memory=shared_memory,
+                                                                    norm_stats=norm_stats)
+        # mixup and random resize crop run on collated batches in the trainer, the dataset only normalizes
+        self.batch_transforms = None
+        if config.get('batch_augmentation', False):
+            self.batch_transforms = audio_augmentation.BatchAugmentationModule()
         self.to_melspectrogram = audio_io.MelSpectrogramLibrosa(
             fs=config['sampling_rate'],
             n_fft=config['n_fft'],
@@ -59,7 +76,9 @@ class BYOLAudioDataset(dataset_baseline.BaselineWaveformDataset):
         log_mel_spectrogram = (self.to_melspectrogram(waveform) + torch.finfo().eps).log().unsqueeze(0)
 
         # transform (augment)
-        if self.transforms:
+        if self.batch_transforms is not None:
+            log_mel_spectrogram = self.transforms.pre_norm(log_mel_spectrogram)
+        elif self.transforms:
             log_mel_spectrogram = self.transforms(log_mel_spectrogram)
         else:
             log_mel_spectrogram = (log_mel_spectrogram, log_mel_spectrogram)
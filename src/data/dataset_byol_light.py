@@ -2,6 +2,7 @@ from torch.utils.data import Dataset
 import src.utils.interface_file_io as file_io
 import src.utils.interface_audio_io as audio_io
 import src.utils.interface_audio_augmentation as audio_augmentation
+import src.utils.interface_augmentation_profiler as augmentation_profiler
 import numpy as np
 import random
 
@@ -21,13 +22,17 @@ def load_waveform(audio_file, required_sampling_rate):
 
 
 class WaveformDatasetByWaveBYOL(Dataset):
-    def __init__(self, file_path, audio_window=20480, sampling_rate=16000, augmentation=[2, 3, 5, 6]):
+    def __init__(self, file_path, audio_window=20480, sampling_rate=16000, augmentation=[2, 3, 5, 6],
+                 augmentation_profile=None):
         super(WaveformDatasetByWaveBYOL, self).__init__()
         self.file_path = file_path
         self.audio_window = audio_window
         self.sampling_rate = sampling_rate
         self.augmentation = augmentation
         self.file_list = file_io.read_txt2list(self.file_path)
+        self.profiler = None
+        if augmentation_profile is not None:
+            self.profiler = augmentation_profiler.AugmentationProfiler(augmentation_profile)
 
     def __len__(self):
         return len(self.file_list)
@@ -40,14 +45,20 @@ class WaveformDatasetByWaveBYOL(Dataset):
         waveform01 = audio_io.random_cutoff(waveform01, self.audio_window, pick_index)
         waveform02 = audio_io.random_cutoff(waveform02, self.audio_window, pick_index)
         if len(self.augmentation) != 0:
+            if self.profiler is not None:
+                self.profiler.start_item(index)
             waveform01 = audio_augmentation.audio_augmentation_pipeline(waveform01, self.sampling_rate,
                                                                             self.audio_window,
                                                                             random.sample(self.augmentation, 3),
-                                                                            fix_audio_length=True)
+                                                                            fix_audio_length=True,
+                                                                            profiler=self.profiler)
             waveform02 = audio_augmentation.audio_augmentation_pipeline(waveform02, self.sampling_rate,
                                                                             self.audio_window,
                                                                             random.sample(self.augmentation, 3),
-                                                                            fix_audio_length=True)
+                                                                            fix_audio_length=True,
+                                                                            profiler=self.profiler)
+            if self.profiler is not None:
+                self.profiler.flush()
         return waveform01, waveform02
 
 
@@ -0,0 +1,26 @@
+import torch
+from torch.utils.data import Dataset
+import src.utils.interface_embedding_store as embedding_store
+
+
+# extract_embeddings.py로 만든 embedding store entry를 downstream 학습 데이터로 사용 (pretext model 실행 없음)
+# item은 원래 dataset과 같은 형식: (embedding, label) 또는 (embedding, filename, label)
+class EmbeddingStoreDataset(Dataset):
+    def __init__(self, entry_path):
+        super(EmbeddingStoreDataset, self).__init__()
+        self.embeddings, self.labels, self.file_index, self.metadata = embedding_store.load_entry(entry_path)
+        self.label_list = self.metadata['label_list']
+        self.filenames = self.metadata.get('filenames', None)
+        # 원래 dataset의 label dict 이름 (acoustic_dict / speaker_dict)을 그대로 사용할 수 있게 둠
+        setattr(self, self.metadata['label_attribute'], {label: index for index, label in enumerate(self.label_list)})
+        self.with_filename = self.filenames is not None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        embedding = torch.from_numpy(self.embeddings[index].astype('float32'))
+        label = self.label_list[self.labels[index]]
+        if self.with_filename:
+            return embedding, self.filenames[self.file_index[index]], label
+        return embedding, label
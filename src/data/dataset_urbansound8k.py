@@ -1,8 +1,9 @@
 import src.data.dataset_baseline as dataset_baseline
 import src.utils.interface_file_io as file_io
 
-import pandas as pd
 import natsort
+import src.utils.interface_lazy_import as lazy_import
+pd = lazy_import.lazy_import('pandas')
 
 
 def get_acoustic_dict(acoustic_list):
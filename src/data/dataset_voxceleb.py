@@ -13,9 +13,9 @@ def get_audio_file_with_speaker_info(file_list, index):
 
 class VoxCelebWaveformDataset(dataset_baseline.BaselineWaveformDataset):
     def __init__(self, file_path, audio_window=20480, sample_rate=16000, full_audio=False,
-                 augmentation=False, speaker_filelist="./dataset/voxceleb01-SI-label.txt"):
+                 augmentation=False, speaker_filelist="./dataset/voxceleb01-SI-label.txt", vad_manifest=None):
         super().__init__(file_path=file_path, audio_window=audio_window, sample_rate=sample_rate,
-                         full_audio=full_audio, augmentation=augmentation)
+                         full_audio=full_audio, augmentation=augmentation, vad_manifest=vad_manifest)
         self.speaker_list = natsort.natsorted(file_io.read_txt2list(speaker_filelist))
         self.speaker_dict = dataset_librispeech.get_speaker_dict(self.speaker_list)
 
@@ -24,5 +24,6 @@ class VoxCelebWaveformDataset(dataset_baseline.BaselineWaveformDataset):
         audio_file, speaker_id = get_audio_file_with_speaker_info(self.file_list, index)
         waveform = dataset_baseline.load_data_pipeline(audio_file, required_sample_rate=self.sample_rate,
                                                        audio_window=self.audio_window, full_audio=self.full_audio,
-                                                       augmentation=self.augmentation, custom_augmentation_list=[0, 2, 3, 6])
+                                                       augmentation=self.augmentation, custom_augmentation_list=[0, 2, 3, 6],
+                                                       cut_silence=self.get_speech_boundary(index))
         return waveform, speaker_id
\ No newline at end of file
@@ -1,6 +1,8 @@
+import functools
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
+import src.utils.interface_device as device_pack
 
 
 def set_criterion(name, params=None):
@@ -14,12 +16,23 @@ def set_criterion(name, params=None):
         return nn.CrossEntropyLoss()
 
 
+def float32_criterion(criterion):
+    # amp(autocast) 학습에서도 normalize와 2 - 2 * cosine은 float32로 계산 (half precision에서는 0 근처 loss가 뭉개짐)
+    @functools.wraps(criterion)
+    def wrapper(x, y):
+        with device_pack.float32_region(x.device):
+            return criterion(device_pack.upcast(x), device_pack.upcast(y))
+    return wrapper
+
+
+@float32_criterion
 def byol_criterion(x, y):
     x = F.normalize(x, dim=-1, p=2)
     y = F.normalize(y, dim=-1, p=2)
     return torch.mean(2 - 2 * (x * y).sum(dim=-1))
 
 
+@float32_criterion
 def byol_a_criterion(x, y):
     x = F.normalize(x, dim=-1, p=2)
     y = F.normalize(y, dim=-1, p=2)
@@ -31,6 +44,7 @@ def l2_normalization(x):
     return x
 
 
+@float32_criterion
 def byol_original_criterion(x, y):
     norm_x = F.normalize(x, dim=-1, p=2)
     norm_y = F.normalize(y, dim=-1, p=2)
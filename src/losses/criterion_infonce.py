@@ -1,6 +1,9 @@
+import collections
 import torch
 import torch.nn as nn
 import numpy as np
+import torch.utils.checkpoint as checkpoint
+import src.utils.interface_device as device_pack
 
 """
 InfoNCE
@@ -9,6 +12,45 @@ implementation by Bas Veeling & Sindy Lowe
 """
 
 
+class NegativeQueue(nn.Module):
+    """
+    FIFO queue of encoded latents z from previous steps, used as additional negative samples
+    preallocated (queue_size x C); entries older than max_staleness steps are not used
+    buffers are not persistent, so checkpoints do not change
+    """
+    def __init__(self, queue_size, dimension, max_staleness=None):
+        super(NegativeQueue, self).__init__()
+        self.queue_size = queue_size
+        self.max_staleness = max_staleness
+        self.register_buffer('latents', torch.zeros(queue_size, dimension), persistent=False)
+        self.pointer = 0
+        self.filled = 0
+        # 최근 max_staleness번 push의 row 수 (FIFO라 사용할 entry는 pointer 바로 앞의 연속된 구간)
+        self.push_sizes = collections.deque(maxlen=max_staleness)
+        self.num_valid = 0
+
+    def negatives(self):
+        # 사용할 entry 수는 push할 때 host에서 계산 (boolean mask / device sync 없음)
+        start = self.pointer - self.num_valid
+        if start >= 0:
+            return self.latents[start:self.pointer]
+        return torch.cat((self.latents[start:], self.latents[:self.pointer]), 0)
+
+    @torch.no_grad()
+    def push(self, latents):
+        # latents: (rows, C), queue보다 많으면 마지막 queue_size개만 남음
+        latents = latents[-self.queue_size:]
+        index = (self.pointer + torch.arange(latents.size(0), device=self.latents.device)) % self.queue_size
+        self.latents[index] = latents.detach().to(self.latents.dtype)
+        self.pointer = (self.pointer + latents.size(0)) % self.queue_size
+        self.filled = min(self.filled + latents.size(0), self.queue_size)
+        if self.max_staleness is None:
+            self.num_valid = self.filled
+        else:
+            self.push_sizes.append(latents.size(0))
+            self.num_valid = min(self.filled, sum(self.push_sizes))
+
+
 class InfoNCE(nn.Module):
     def __init__(self, args, gar_hidden, genc_hidden):
         super(InfoNCE, self).__init__()
@@ -17,6 +59,14 @@ class InfoNCE(nn.Module):
         self.gar_hidden = gar_hidden
         self.genc_hidden = genc_hidden
         self.negative_samples = self.args['negative_samples']
+        # "infonce_chunk_size": row chunk 단위로 score를 계산하고 backward에서 다시 계산 (None이면 한번에)
+        self.chunk_size = self.args.get('infonce_chunk_size', None)
+        # "negative_queue_size": 이전 step의 z (B*L row 단위)를 negative로 같이 사용 (0이면 현재 batch만)
+        # "negative_queue_staleness": queue entry를 사용할 최대 step 수 (None이면 제한 없음)
+        self.negative_queue = None
+        if self.args.get('negative_queue_size', 0) > 0:
+            self.negative_queue = NegativeQueue(self.args['negative_queue_size'], genc_hidden,
+                                                max_staleness=self.args.get('negative_queue_staleness', None))
 
         # predict |prediction_step| timesteps into the future
         self.predictor = nn.Linear(
@@ -42,7 +92,12 @@ class InfoNCE(nn.Module):
                 z = z[:, seq_begin : seq_begin + self.subsample_win, :]
 
         Wc = self.predictor(c)
-        return self.infonce_loss(Wc, z, full_z)
+        # score 계산과 log-softmax는 amp(autocast)에서도 float32
+        with device_pack.float32_region(Wc.device):
+            loss = self.infonce_loss(device_pack.upcast(Wc), device_pack.upcast(z), device_pack.upcast(full_z))
+        if self.negative_queue is not None and self.training:
+            self.negative_queue.push(self.broadcast_batch_length(full_z))
+        return loss
 
     def broadcast_batch_length(self, input_tensor):
         """
@@ -70,7 +125,26 @@ class InfoNCE(nn.Module):
         f_k = torch.squeeze(torch.matmul(Wc_k, z_k), 1)
         return f_k
 
-    def get_neg_z(self, z):
+    def get_neg_index(self, num_rows, device, pool_size=None):
+        """
+        draw the negative indices for all negative samples with one random tensor
+        (every column is an independent permutation of the rows, same distribution as one randperm per negative)
+        :param pool_size: number of negative candidates (num_rows + queued latents), num_rows if None
+        :return: rand_neg_idx of shape (num_rows) x negative_samples
+        """
+        pool_size = pool_size or num_rows
+        return torch.rand(self.negative_samples, pool_size, device=device).argsort(dim=1)[:, :num_rows].T
+
+    def get_neg_pool(self, z):
+        """
+        negative candidates: the current (B*L) x C latents followed by the queued latents of previous steps
+        (queued latents only in training mode, so eval loss / accuracy do not depend on the queue)
+        """
+        if self.negative_queue is None or not self.training:
+            return z
+        return torch.cat((z, self.negative_queue.negatives().to(z.dtype)), 0)
+
+    def get_neg_z(self, z, rand_neg_idx=None):
         """
         scramble z to retrieve negative samples, i.e. z values that should not be predicted by the model
         :param z: unshuffled z as output by the model
@@ -84,14 +158,10 @@ class InfoNCE(nn.Module):
             done once for all time-steps, much faster                
         """
         z = self.broadcast_batch_length(z)
-        z_neg = torch.stack(
-            [
-                torch.index_select(z, 0, torch.randperm(z.size(0)).to(z.get_device()))
-                for i in range(self.negative_samples)
-            ],
-            2,
-        )
-        rand_neg_idx = None
+        z_pool = self.get_neg_pool(z)
+        if rand_neg_idx is None:
+            rand_neg_idx = self.get_neg_index(z.size(0), z.device, z_pool.size(0))
+        z_neg = z_pool[rand_neg_idx].permute(0, 2, 1)
         rand_offset = None
         return z_neg, rand_neg_idx, rand_offset
 
@@ -119,7 +189,77 @@ class InfoNCE(nn.Module):
 
         return f_k
 
-    def infonce_loss(self, Wc, z, full_z):
+    def step_rows(self, batch_size, seq_len, device):
+        """
+        row layout shared by all prediction steps: (prediction_step) x R, R = batch_size * (seq_len - 1)
+        row r = b * (seq_len - k) + t of step k is placed at R - M_k + r (M_k = batch_size * (seq_len - k)),
+        so step k uses the last M_k rows of rand_neg_idx like z_neg[z_neg.size(0) - M_k:] in get_neg_samples_f
+        :return: b, t (prediction_step x R), k (prediction_step x 1), valid mask (prediction_step x R), M_k
+        """
+        k = torch.arange(1, self.args['prediction_step'] + 1, device=device).unsqueeze(1)
+        num_rows = batch_size * (seq_len - k)
+        total_rows = batch_size * (seq_len - 1)
+        r = torch.arange(total_rows, device=device).unsqueeze(0) - (total_rows - num_rows)
+        valid = r >= 0
+        r = r.clamp_min(0)
+        return r // (seq_len - k), r % (seq_len - k), k, valid, num_rows.squeeze(1)
+
+    def step_scores(self, Wc, z, full_z, b, t, k, rand_neg_idx):
+        """
+        log-bilinear scores of all prediction steps for a chunk of rows in one batched einsum
+        :param Wc: B x L x prediction_step x C, z: B x L x C, full_z: negative candidates (B*L_full + queued) x C
+        :param rand_neg_idx: negative indices of the chunk rows (rows x negative_samples)
+        :return: log-softmax of the positive sample and whether it has the highest score (prediction_step x rows)
+        """
+        Wc_k = Wc[b, t, k - 1]
+        pos_samples = (Wc_k * z[b, t + k]).sum(dim=-1, keepdim=True)
+        # negative는 chunk row의 것만 gather
+        neg_samples = torch.einsum('krc,rnc->krn', Wc_k, full_z[rand_neg_idx])
+        results = torch.cat((pos_samples, neg_samples), dim=-1)
+        return self.loss(results.transpose(1, 2))[:, 0], results.argmax(dim=-1) == 0
+
+    def infonce_loss(self, Wc, z, full_z, rand_neg_idx=None):
+        """
+        same loss as infonce_loss_loop, with all prediction steps computed together
+        :param Wc: output of the predictor (B, L, C * self.args.prediction_step)
+        :param z: encoded future - output of the encoder (B, L, C)
+        :param full_z: z before subsampling, negative samples are drawn from it (B, L_full, C)
+        :param rand_neg_idx: negative indices ((B*L_full) x negative_samples) into full_z and the queued latents,
+        drawn if None
+        :return: loss, accuracy - averaged over samples and timesteps per prediction step, then over prediction steps
+        """
+        batch_size, seq_len = z.size(0), z.size(1)
+        assert (seq_len > self.args['prediction_step']), \
+            "sequence length {} <= prediction step {}".format(seq_len, self.args['prediction_step'])
+        full_z = self.broadcast_batch_length(full_z)
+        num_full_rows = full_z.size(0)
+        full_z = self.get_neg_pool(full_z)
+        if rand_neg_idx is None:
+            rand_neg_idx = self.get_neg_index(num_full_rows, z.device, full_z.size(0))
+        b, t, k, valid, num_rows = self.step_rows(batch_size, seq_len, z.device)
+        rand_neg_idx = rand_neg_idx[rand_neg_idx.size(0) - b.size(1):]
+        Wc = Wc.reshape(batch_size, seq_len, self.args['prediction_step'], self.genc_hidden)
+
+        chunk_size = self.chunk_size or b.size(1)
+        log_probs, corrects = [], []
+        for start in range(0, b.size(1), chunk_size):
+            rows = slice(start, start + chunk_size)
+            inputs = (Wc, z, full_z, b[:, rows], t[:, rows], k, rand_neg_idx[rows])
+            if chunk_size < b.size(1) and torch.is_grad_enabled():
+                log_prob, correct = checkpoint.checkpoint(self.step_scores, *inputs, use_reentrant=False)
+            else:
+                log_prob, correct = self.step_scores(*inputs)
+            log_probs.append(log_prob)
+            corrects.append(correct)
+        log_probs = torch.cat(log_probs, dim=1)
+
+        total_loss = (-torch.where(valid, log_probs, torch.zeros_like(log_probs)).sum(dim=1) / num_rows).mean()
+        if not self.args['calc_accuracy']:
+            return total_loss, torch.zeros(())
+        accuracies = (torch.cat(corrects, dim=1) & valid).sum(dim=1) / num_rows
+        return total_loss, accuracies.mean().detach().cpu()
+
+    def infonce_loss_loop(self, Wc, z, full_z, rand_neg_idx=None):
         """
         calculate the loss based on the model outputs Wc (the prediction) and z (the encoded future)
         :param Wc: output of the predictor, where W are the weights for the different timesteps and
@@ -128,10 +268,12 @@ class InfoNCE(nn.Module):
         :return: loss - average loss over all samples, timesteps and prediction steps in the batch
                 accuracy - average accuracies over all samples, timesteps and predictions steps in the batch
         """
+        # prediction step마다 matmul을 따로 하는 원래 구현 (infonce_loss 검증 / benchmark 기준)
         seq_len = z.size(1)
+        batch_size = z.size(0)
         total_loss = 0
         accuracies = torch.zeros(self.args['prediction_step'], 1)
-        true_labels = torch.zeros((seq_len * self.args['batch_size'],)).long()
+        true_labels = torch.zeros((seq_len * batch_size,)).long()
 
         # Which type of method to use for negative sampling:
         # 0 - inside the loop for the prediction time-steps. Slow, but samples from all but the current pos sample
@@ -141,7 +283,7 @@ class InfoNCE(nn.Module):
         #   Low probability of sampling the positive sample as well.
 
         # sampling method 1 / 2
-        z_neg, _, _ = self.get_neg_z(full_z)
+        z_neg, _, _ = self.get_neg_z(full_z, rand_neg_idx)
 
         for k in range(1, self.args['prediction_step'] + 1):
             z_k = z[:, k:, :]
@@ -158,14 +300,14 @@ class InfoNCE(nn.Module):
             results = torch.cat((pos_samples, neg_samples), 1)
             loss = self.loss(results)[:, 0]
 
-            total_samples = (seq_len - k) * self.args['batch_size']
+            total_samples = (seq_len - k) * batch_size
             loss = -loss.sum() / total_samples
             total_loss += loss
 
             # calculate accuracy
             if self.args['calc_accuracy']:
-                predicted = torch.argmax(results, 1).cuda()
-                true_labels = true_labels.cuda()
+                predicted = torch.argmax(results, 1)
+                true_labels = true_labels.to(predicted.device)
                 # true_labels[: (seq_len - k) * self.args['model']['batch_size']]
                 correct = (
                     (predicted == true_labels[: len(predicted)])
@@ -177,4 +319,51 @@ class InfoNCE(nn.Module):
         total_loss /= self.args['prediction_step']
         accuracies = torch.mean(accuracies)
 
-        return total_loss, accuracies
\ No newline at end of file
+        return total_loss, accuracies
+
+
+def benchmark_step(method, batch_size, chunk_size=None, seq_len=128, genc_hidden=512, gar_hidden=256, steps=5,
+                   warmup=2):
+    # CPC (audio_window 20480 -> 128 step) 크기의 InfoNCE forward + backward time과 peak memory
+    # (CUDA: max allocated, CPU: max RSS), 같은 seed의 입력 / negative index에서 loss도 반환 (method끼리 같아야 함)
+    import time
+    import resource
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    args = {'prediction_step': 12, 'negative_samples': 10, 'subsample': False, 'calc_accuracy': True,
+            'batch_size': batch_size, 'infonce_chunk_size': chunk_size}
+    torch.manual_seed(0)
+    criterion = InfoNCE(args, gar_hidden=gar_hidden, genc_hidden=genc_hidden).to(device)
+    z = torch.randn(batch_size, seq_len, genc_hidden, device=device, requires_grad=True)
+    c = torch.randn(batch_size, seq_len, gar_hidden, device=device, requires_grad=True)
+    rand_neg_idx = criterion.get_neg_index(batch_size * seq_len, device)
+    loss_function = criterion.infonce_loss_loop if method == 'loop' else criterion.infonce_loss
+    for step in range(warmup + steps):
+        if step == warmup:
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+                torch.cuda.reset_peak_memory_stats(device)
+            start = time.perf_counter()
+        loss, accuracy = loss_function(criterion.predictor(c), z, z, rand_neg_idx)
+        loss.backward()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        peak_memory = torch.cuda.max_memory_allocated(device) / 2 ** 20
+    else:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    step_time = (time.perf_counter() - start) / steps
+    return step_time, peak_memory, loss.item(), float(accuracy)
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for batch_size in [8, 64, 256]:
+            for method, chunk_size in [('loop', None), ('fused', None), ('fused', 4096)]:
+                name = method if chunk_size is None else '{} / chunk {}'.format(method, chunk_size)
+                try:
+                    step_time, peak_memory, loss, accuracy = pool.apply(benchmark_step, (method, batch_size, chunk_size))
+                    print("batch {:>3d} | {:>18s} | {:.3f} sec/step | peak memory {:.0f} MB | loss {:.6f} | "
+                          "accuracy {:.4f}".format(batch_size, name, step_time, peak_memory, loss, accuracy))
+                except Exception as error:
+                    print("batch {:>3d} | {:>18s} | failed ({}: {})".format(
+                        batch_size, name, type(error).__name__, error))
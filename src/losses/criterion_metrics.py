@@ -1,5 +1,6 @@
 import torch.nn as nn
-from sklearn.metrics import *
+import src.utils.interface_lazy_import as lazy_import
+metrics = lazy_import.lazy_import('sklearn.metrics')
 
 
 def cosine_similarity(data01, data02):
@@ -15,10 +16,10 @@ def pairwise_distance(data01, data02):
 
 
 def mse(data01, data02):
-    output = mean_squared_error(data01, data02)
+    output = metrics.mean_squared_error(data01, data02)
     return output
 
 
 def mae(data01, data02):
-    output = mean_absolute_error(data01, data02)
+    output = metrics.mean_absolute_error(data01, data02)
     return output
\ No newline at end of file
@@ -1,216 +1,90 @@
-import src.models.model_cpc as model_baseline
-import src.models.model_downstream as model_downstream
-import src.models.model_proposed01 as model_proposed01
-import src.models.model_proposed02 as model_proposed02
-import src.models.model_proposed03 as model_proposed03
-import src.models.model_proposed04 as model_proposed04
-import src.models.model_proposed05 as model_proposed05
-import src.models.model_proposed06 as model_proposed06
-import src.models.model_proposed07 as model_proposed07
-import src.models.model_proposed_efficientnet_combine as model_proposed_efficientnet_combine
-import src.models.model_proposed_efficientnet_mix_combine as model_proposed_efficientnet_mix_combine
-import src.models.model_proposed_original as model_proposed_original
-import src.models.model_byol_audio as byol_audio
+import collections
+import importlib
 import torch
 
 
-def load_model(config, model_name, checkpoint_path=None):
-    model = None
+# model name -> (module, class, constructor argument <- config key, 고정 argument, 생성 후 호출할 setup method)
+# module은 load_model에서 처음 사용될 때 import 됨 (torchvision, efficientnet_pytorch 등을 필요한 model만 읽음)
+ModelEntry = collections.namedtuple(
+    'ModelEntry', ['module', 'class_name', 'config_keys', 'config_argument', 'options', 'setup'],
+    defaults=['config', {}, []]
+)
+
+DOWNSTREAM_KEYS = {
+    'input_dim': 'downstream_input_dim',
+    'hidden_dim': 'downstream_hidden_dim',
+    'output_dim': 'downstream_output_dim',
+}
+CPC_KEYS = ['g_enc_input', 'g_enc_hidden', 'g_ar_hidden', 'filter_sizes', 'strides', 'paddings']
+BYOL_AUDIO_KEYS = ['input_dims', 'hidden_dims', 'strides', 'filter_sizes', 'paddings', 'maxpool_filter_sizes',
+                   'maxpool_strides', 'feature_dimension', 'hidden_size', 'projection_size']
+WAVEBYOL_KEYS = ['pre_input_dims', 'pre_hidden_dims', 'pre_strides', 'pre_filter_sizes', 'pre_paddings',
+                 'dimension', 'hidden_size', 'projection_size']
 
-    if model_name == "NormalClassification":
-        model = model_downstream.DownstreamClassification(
-            input_dim=config['downstream_input_dim'],
-            hidden_dim=config['downstream_hidden_dim'],
-            output_dim=config['downstream_output_dim']
-        )
+MODEL_REGISTRY = {
+    'NormalClassification': ModelEntry('src.models.model_downstream', 'DownstreamClassification', DOWNSTREAM_KEYS,
+                                       config_argument=None),
     # implemented models
-    if model_name == 'CPCModel':
-        model = model_baseline.CPCModel(
-            args=config,
-            g_enc_input=config['g_enc_input'],
-            g_enc_hidden=config['g_enc_hidden'],
-            g_ar_hidden=config['g_ar_hidden'],
-            filter_sizes=config['filter_sizes'],
-            strides=config['strides'],
-            paddings=config['paddings'],
-        )
-    elif model_name == 'BYOLAudioModel':
-        model = byol_audio.BYOLAudio(
-            config=config,
-            input_dims=config['input_dims'],
-            hidden_dims=config['hidden_dims'],
-            strides=config['strides'],
-            filter_sizes=config['filter_sizes'],
-            paddings=config['paddings'],
-            maxpool_filter_sizes=config['maxpool_filter_sizes'],
-            maxpool_strides=config['maxpool_strides'],
-            feature_dimension=config['feature_dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size']
-        )
+    'CPCModel': ModelEntry('src.models.model_cpc', 'CPCModel', CPC_KEYS, config_argument='args'),
+    'BYOLAudioModel': ModelEntry('src.models.model_byol_audio', 'BYOLAudio', BYOL_AUDIO_KEYS),
     # proposed model
-    elif model_name == 'GenerativeCPCModel':
-        model = model_proposed01.GenerativeCPCModel(
-            args=config,
-            g_enc_input=config['g_enc_input'],
-            g_enc_hidden=config['g_enc_hidden'],
-            g_ar_hidden=config['g_ar_hidden'],
-            filter_sizes=config['filter_sizes'],
-            strides=config['strides'],
-            paddings=config['paddings'],
-        )
-    elif model_name == 'WaveBYOLEfficientB0':
-        model = model_proposed_efficientnet_combine.WaveBYOLEfficient(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-            efficientnet_model_name='efficientnet-b0',
-        )
-    elif model_name == 'WaveBYOLEfficientB0Mix':
-        model = model_proposed_efficientnet_mix_combine.WaveBYOLEfficient(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-            efficientnet_model_name='efficientnet-b0',
-        )
-    elif model_name == 'WaveBYOLEfficientB4':
-        model = model_proposed_efficientnet_combine.WaveBYOLEfficient(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-            efficientnet_model_name='efficientnet-b4',
-        )
-    elif model_name == 'WaveBYOLEfficientB4Mix':
-        model = model_proposed_efficientnet_mix_combine.WaveBYOLEfficient(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-            efficientnet_model_name='efficientnet-b4',
-        )
-    elif model_name == 'WaveBYOLEfficientB7':
-        model = model_proposed_efficientnet_combine.WaveBYOLEfficient(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-            efficientnet_model_name='efficientnet-b7',
-        )
-    elif model_name == 'WaveBYOL':
-        model = model_proposed02.WaveBYOL(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-        )
-        model.setup_target_network()
+    'GenerativeCPCModel': ModelEntry('src.models.model_proposed01', 'GenerativeCPCModel', CPC_KEYS,
+                                     config_argument='args'),
+    'WaveBYOLEfficientB0': ModelEntry('src.models.model_proposed_efficientnet_combine', 'WaveBYOLEfficient',
+                                      WAVEBYOL_KEYS, options={'efficientnet_model_name': 'efficientnet-b0'}),
+    'WaveBYOLEfficientB0Mix': ModelEntry('src.models.model_proposed_efficientnet_mix_combine', 'WaveBYOLEfficient',
+                                         WAVEBYOL_KEYS, options={'efficientnet_model_name': 'efficientnet-b0'}),
+    'WaveBYOLEfficientB4': ModelEntry('src.models.model_proposed_efficientnet_combine', 'WaveBYOLEfficient',
+                                      WAVEBYOL_KEYS, options={'efficientnet_model_name': 'efficientnet-b4'}),
+    'WaveBYOLEfficientB4Mix': ModelEntry('src.models.model_proposed_efficientnet_mix_combine', 'WaveBYOLEfficient',
+                                         WAVEBYOL_KEYS, options={'efficientnet_model_name': 'efficientnet-b4'}),
+    'WaveBYOLEfficientB7': ModelEntry('src.models.model_proposed_efficientnet_combine', 'WaveBYOLEfficient',
+                                      WAVEBYOL_KEYS, options={'efficientnet_model_name': 'efficientnet-b7'}),
+    'WaveBYOL': ModelEntry('src.models.model_proposed02', 'WaveBYOL', WAVEBYOL_KEYS,
+                           setup=['setup_target_network']),
+    'WaveBYOLTest01': ModelEntry('src.models.model_proposed03', 'WaveBYOLTest01', WAVEBYOL_KEYS,
+                                 setup=['setup_target_network']),
+    'WaveBYOLTest02': ModelEntry('src.models.model_proposed04', 'WaveBYOLTest02', WAVEBYOL_KEYS,
+                                 setup=['setup_target_network']),
+    'WaveBYOLTest03': ModelEntry('src.models.model_proposed05', 'WaveBYOLTest03', WAVEBYOL_KEYS,
+                                 setup=['setup_target_network']),
+    'EfficientBYOL': ModelEntry('src.models.model_proposed07', 'EfficientBYOL', WAVEBYOL_KEYS,
+                                setup=['setup_target_network', 'setup_modest_network']),
+    'waveBYOLOriginal': ModelEntry('src.models.model_proposed_original', 'WaveBYOL', WAVEBYOL_KEYS),
+}
+
 
-    elif model_name == 'WaveBYOLTest01':
-        model = model_proposed03.WaveBYOLTest01(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-        )
-        model.setup_target_network()
+def register_model(model_name, entry):
+    MODEL_REGISTRY[model_name] = entry
 
-    elif model_name == 'WaveBYOLTest02':
-        model = model_proposed04.WaveBYOLTest02(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-        )
-        model.setup_target_network()
 
-    elif model_name == 'WaveBYOLTest03':
-        model = model_proposed05.WaveBYOLTest03(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-        )
-        model.setup_target_network()
-    elif model_name == 'EfficientBYOL':
-        model = model_proposed07.EfficientBYOL(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-        )
-        model.setup_target_network()
-        model.setup_modest_network()
-    elif model_name == 'waveBYOLOriginal':
-        model = model_proposed_original.WaveBYOL(
-            config=config,
-            pre_input_dims=config['pre_input_dims'],
-            pre_hidden_dims=config['pre_hidden_dims'],
-            pre_strides=config['pre_strides'],
-            pre_filter_sizes=config['pre_filter_sizes'],
-            pre_paddings=config['pre_paddings'],
-            dimension=config['dimension'],
-            hidden_size=config['hidden_size'],
-            projection_size=config['projection_size'],
-        )
+def get_model_class(model_name):
+    assert (model_name in MODEL_REGISTRY), "Unknown model name: {}".format(model_name)
+    entry = MODEL_REGISTRY[model_name]
+    return getattr(importlib.import_module(entry.module), entry.class_name)
 
 
+def build_model(config, model_name):
+    entry = MODEL_REGISTRY[model_name]
+    model_class = get_model_class(model_name)
+    config_keys = entry.config_keys if isinstance(entry.config_keys, dict) \
+        else {key: key for key in entry.config_keys}
+    kwargs = {argument: config[key] for argument, key in config_keys.items()}
+    kwargs.update(entry.options)
+    if entry.config_argument is not None:
+        kwargs[entry.config_argument] = config
+    model = model_class(**kwargs)
+    for setup in entry.setup:
+        getattr(model, setup)()
+    return model
+
+
+def load_model(config, model_name, checkpoint_path=None):
+    model = build_model(config, model_name)
+
     if checkpoint_path is not None:
         device = torch.device('cpu')
         checkpoint = torch.load(checkpoint_path, map_location=device)
         model.load_state_dict(checkpoint['model_state_dict'], strict=False)
 
     return model
-
@@ -0,0 +1,271 @@
+import collections
+import contextlib
+import functools
+import torch
+import torch.nn as nn
+import torch.utils.checkpoint
+import src.models.model_fused_view as model_fused_view
+import src.utils.interface_weight_store as weight_store
+
+
+# pretrained backbone은 한번만 만들고 필요한 stage만 잘라서 사용
+# (예전 코드는 stage 하나마다 torchvision.models.resnet50(pretrained=True)를 새로 만들어서 weight를 여러번 읽었음)
+RESNET_STAGES = ['conv1', 'bn1', 'relu', 'maxpool', 'layer1', 'layer2', 'layer3', 'layer4']
+BACKBONES = [
+    'resnet18', 'resnet50', 'resnet152', 'wide_resnet50_2', 'wide_resnet101_2',
+    'vgg16_bn', 'vgg19_bn', 'mobilenet_v2', 'mobilenet_v3_large',
+    'efficientnet-b0', 'efficientnet-b3', 'efficientnet-b4', 'efficientnet-b7',
+]
+# False면 pretrained=True 요청도 random init으로 생성 (weight download 없이 구조만 필요할 때, e.g. offline CPU smoke test)
+USE_PRETRAINED = True
+
+
+@contextlib.contextmanager
+def without_pretrained_weights():
+    global USE_PRETRAINED
+    previous, USE_PRETRAINED = USE_PRETRAINED, False
+    try:
+        yield
+    finally:
+        USE_PRETRAINED = previous
+
+
+def construct_backbone(name, pretrained=False):
+    if name.startswith('efficientnet-'):
+        from efficientnet_pytorch import EfficientNet
+        if pretrained:
+            return EfficientNet.from_pretrained(name)
+        return EfficientNet.from_name(name)
+    import torchvision
+    return getattr(torchvision.models, name)(pretrained=pretrained)
+
+
+def build_backbone(name, pretrained=True):
+    # pretrained weight는 local weight store(mmap)에서 먼저 찾고, 없으면 download 후 store에 넣어둠
+    if not pretrained or not USE_PRETRAINED:
+        return construct_backbone(name)
+    if weight_store.has_weight(name):
+        if not weight_store.SUPPORTS_MMAP_LOAD:
+            return weight_store.load_into(construct_backbone(name), name)
+        # meta device에서 만들면 random init을 건너뜀 (state_dict에 없는 tensor가 남으면 일반 생성으로 다시 시도)
+        with torch.device('meta'):
+            backbone = construct_backbone(name)
+        weight_store.load_into(backbone, name, strict=False)
+        if not any(tensor.is_meta for tensor in list(backbone.parameters()) + list(backbone.buffers())):
+            return backbone
+        return weight_store.load_into(construct_backbone(name), name)
+    backbone = construct_backbone(name, pretrained=True)
+    weight_store.import_state_dict(name, backbone.state_dict())
+    return backbone
+
+
+def backbone_stages(name, stages, pretrained=True):
+    # backbone 하나에서 stage들을 꺼내고 나머지(fc, classifier 등)는 버림
+    backbone = build_backbone(name, pretrained=pretrained)
+    return [getattr(backbone, stage) for stage in stages]
+
+
+def backbone_stage(name, stage, pretrained=True):
+    return backbone_stages(name, [stage], pretrained=pretrained)[0]
+
+
+def named_stages(name, stages, first_index, prefix="feature_extract_layer", pretrained=True):
+    # nn.Sequential(OrderedDict)용 이름: 기존 checkpoint의 feature_extract_layerNN key를 그대로 유지
+    return [("{}{:02d}".format(prefix, first_index + index), stage)
+            for index, stage in enumerate(backbone_stages(name, stages, pretrained=pretrained))]
+
+
+def resnet_encoder(name, pretrained=True):
+    # 1x1 conv (1 -> 3 channel) + resnet conv1 ~ layer4 (model_proposed02/04 EncoderNetwork 구조)
+    return nn.Sequential(
+        collections.OrderedDict(
+            [("feature_extract_layer01", nn.Conv2d(1, 3, kernel_size=1, stride=1))]
+            + named_stages(name, RESNET_STAGES, first_index=2, pretrained=pretrained)
+        )
+    )
+
+
+def resnet_single_channel_encoder(name, pretrained=True):
+    # 1 channel conv1 + resnet bn1, relu, layer1 ~ layer4 (maxpool 없음, FeatBYOL/light resnet 구조)
+    return nn.Sequential(
+        # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
+        nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
+        *backbone_stages(name, ['bn1', 'relu', 'layer1', 'layer2', 'layer3', 'layer4'], pretrained=pretrained)
+    )
+
+
+# activation checkpointing 단위 (config의 "activation_checkpointing")
+# none: 사용 안함, stage: resnet layerN / efficientnet stage / vgg maxpool 구간, block: residual block / MBConv block / conv-bn-relu
+CHECKPOINT_GRANULARITIES = ['none', 'stage', 'block']
+
+
+def get_checkpoint_granularity(config):
+    granularity = 'none' if config is None else config.get('activation_checkpointing', 'none')
+    assert (granularity in CHECKPOINT_GRANULARITIES), "Unknown checkpoint granularity: {}".format(granularity)
+    return granularity
+
+
+def is_residual_stage(module):
+    # torchvision resnet의 layer1 ~ layer4 (BasicBlock/Bottleneck의 nn.Sequential)
+    return isinstance(module, nn.Sequential) and len(module) > 0 and \
+        all(type(block).__name__ in ['BasicBlock', 'Bottleneck'] for block in module)
+
+
+def sequential_segments(module, granularity):
+    # nn.Sequential (resnet_encoder, resnet_single_channel_encoder, vgg features)을 checkpoint 구간(module list)으로 나눔
+    segments, current = [], []
+    for child in module.children():
+        if is_residual_stage(child):
+            if len(current) > 0:
+                segments.append(current)
+                current = []
+            segments += [[block] for block in child] if granularity == 'block' else [[child]]
+        elif isinstance(child, nn.Sequential):
+            for segment in sequential_segments(child, granularity):
+                segments.append(current + segment)
+                current = []
+        else:
+            current.append(child)
+            if isinstance(child, nn.MaxPool2d) or (granularity == 'block' and isinstance(child, nn.ReLU)):
+                segments.append(current)
+                current = []
+    if len(current) > 0:
+        segments.append(current)
+    return segments
+
+
+def efficientnet_segments(network, granularity):
+    # stem / MBConv blocks (stage: output channel이 같은 연속 block) / head, extract_features와 같은 계산 순서
+    blocks = []
+    for index, block in enumerate(network._blocks):
+        drop_connect_rate = network._global_params.drop_connect_rate
+        if drop_connect_rate:
+            drop_connect_rate *= float(index) / len(network._blocks)
+        blocks.append(functools.partial(block, drop_connect_rate=drop_connect_rate))
+    segments = [[network._conv_stem, network._bn0, network._swish]]
+    for block in blocks:
+        if granularity == 'stage' and len(segments) > 1 and \
+                segments[-1][-1].func._block_args.output_filters == block.func._block_args.output_filters:
+            segments[-1].append(block)
+        else:
+            segments.append([block])
+    segments.append([network._conv_head, network._bn1, network._swish])
+    return segments
+
+
+@contextlib.contextmanager
+def preserved_batchnorm_stats(modules):
+    # backward에서 다시 계산할 때 BatchNorm running stat이 한번 더 갱신되지 않도록 되돌림
+    batchnorms = [module for item in modules for module in getattr(item, 'func', item).modules()
+                  if isinstance(module, nn.modules.batchnorm._BatchNorm) and module.training
+                  and module.track_running_stats]
+    saved = [[buffer.clone() for buffer in batchnorm.buffers()] for batchnorm in batchnorms]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for batchnorm, buffers in zip(batchnorms, saved):
+                for buffer, value in zip(batchnorm.buffers(), buffers):
+                    buffer.copy_(value)
+
+
+def run_segment(segment, x):
+    for item in segment:
+        x = item(x)
+    return x
+
+
+def checkpoint_segment(segment, x):
+    calls = []
+    # per_view_batchnorm block은 backward 전에 끝나므로 forward 시점의 BatchNorm mode를 저장해서 recompute에 사용
+    batchnorm_modes = model_fused_view.batchnorm_modes(segment)
+
+    def recompute(x):
+        if len(calls) == 0:
+            calls.append(x)
+            return run_segment(segment, x)
+        with preserved_batchnorm_stats(segment), model_fused_view.restored_batchnorm_modes(batchnorm_modes):
+            return run_segment(segment, x)
+    return torch.utils.checkpoint.checkpoint(recompute, x, use_reentrant=False)
+
+
+def checkpoint_forward(segments, x, granularity):
+    # gradient가 필요 없는 경우 (target network, eval)는 그냥 실행
+    if granularity == 'none' or not torch.is_grad_enabled():
+        for segment in segments:
+            x = run_segment(segment, x)
+        return x
+    for segment in segments:
+        x = checkpoint_segment(segment, x)
+    return x
+
+
+def sequential_features(network, x, granularity='none'):
+    if granularity == 'none':
+        return network(x)
+    return checkpoint_forward(sequential_segments(network, granularity), x, granularity)
+
+
+def efficientnet_features(network, x, granularity='none'):
+    # EfficientNet.extract_features + activation checkpointing
+    if granularity == 'none':
+        return network.extract_features(x)
+    return checkpoint_forward(efficientnet_segments(network, granularity), x, granularity)
+
+
+def startup_stages(name):
+    # model들이 backbone에서 꺼내 쓰는 stage (efficientnet은 backbone 전체)
+    if name.startswith('efficientnet-'):
+        return []
+    if name.startswith('vgg') or name.startswith('mobilenet'):
+        return ['features']
+    return RESNET_STAGES
+
+
+def measure_startup(name, mode):
+    # 별도 process에서 실행: (생성 시간, peak RSS MB)
+    import time
+    import resource
+    start = time.perf_counter()
+    if mode == 'factory':
+        backbone_stages(name, startup_stages(name))
+    else:
+        [getattr(build_backbone(name), stage) for stage in startup_stages(name)]
+    return time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_model_startup(model_name):
+    # 별도 process에서 실행: 등록된 model 하나의 생성 (smoke config) 시간과 peak RSS MB
+    import time
+    import resource
+    import src.models.model as model_pack
+    import src.models.model_benchmark as model_benchmark
+    start = time.perf_counter()
+    model_pack.build_model(model_benchmark.cpu_smoke_config(model_name), model_name)
+    return time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    import src.models.model as model_pack
+    # backbone별 stage 재생성(예전 방식, resnet 계열) vs 한번 생성 후 slicing의 startup 시간과 peak memory
+    # 그리고 등록된 model 전체의 생성 시간과 peak memory
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for backbone_name in BACKBONES:
+            startup_modes = ['per_stage', 'factory'] if len(startup_stages(backbone_name)) > 1 else ['factory']
+            for startup_mode in startup_modes:
+                try:
+                    elapsed, peak_rss = pool.apply(measure_startup, (backbone_name, startup_mode))
+                    print("{:>24s} | {:>9s} | {:.2f} sec | peak rss {:.0f} MB".format(
+                        backbone_name, startup_mode, elapsed, peak_rss))
+                except Exception as error:
+                    print("{:>24s} | {:>9s} | failed ({}: {})".format(
+                        backbone_name, startup_mode, type(error).__name__, error))
+        for model_name in model_pack.MODEL_REGISTRY:
+            try:
+                elapsed, peak_rss = pool.apply(measure_model_startup, (model_name,))
+                print("{:>24s} | {:>9s} | {:.2f} sec | peak rss {:.0f} MB".format(
+                    model_name, 'model', elapsed, peak_rss))
+            except Exception as error:
+                print("{:>24s} | {:>9s} | failed ({}: {})".format(
+                    model_name, 'model', type(error).__name__, error))
@@ -0,0 +1,220 @@
+import torch
+import src.models.model as model_pack
+
+
+# 등록된 model (model.MODEL_REGISTRY)의 CPU smoke test / benchmark (작은 config로 pretrained weight 없이 생성)
+
+
+def cpu_smoke_config(model_name):
+    # CPU smoke test용 작은 config (dimension은 audio_window에 대한 encoder output 크기)
+    base = {'batch_size': 2, 'audio_window': 20480, 'hidden_size': 256, 'projection_size': 256, 'ema_decay': 0.99}
+    wavebyol = dict(base, pre_input_dims=1, pre_hidden_dims=512, pre_filter_sizes=[10, 8, 4, 4, 4],
+                    pre_strides=[5, 4, 2, 2, 2], pre_paddings=[2, 2, 2, 2, 1])
+    cpc = dict(base, g_enc_input=1, g_enc_hidden=512, g_ar_hidden=256, filter_sizes=[10, 8, 4, 4, 4],
+               strides=[5, 4, 2, 2, 2], paddings=[2, 2, 2, 2, 1], prediction_step=12, negative_samples=10,
+               subsample=True, calc_accuracy=True)
+    configs = {
+        'NormalClassification': dict(base, downstream_input_dim=256, downstream_hidden_dim=128,
+                                     downstream_output_dim=10),
+        'CPCModel': cpc,
+        'GenerativeCPCModel': cpc,
+        'BYOLAudioModel': dict(base, input_dims=[1, 64, 64], hidden_dims=[64, 64, 64], strides=[1, 1, 1],
+                               filter_sizes=[3, 3, 3], paddings=[1, 1, 1], maxpool_filter_sizes=[2, 2, 2],
+                               maxpool_strides=[2, 2, 2], feature_dimension=2048),
+        'WaveBYOLEfficientB0': dict(wavebyol, dimension=64),
+        'WaveBYOLEfficientB0Mix': dict(wavebyol, dimension=16384),
+        'WaveBYOLEfficientB4': dict(wavebyol, dimension=64),
+        'WaveBYOLEfficientB4Mix': dict(wavebyol, dimension=16384),
+        'WaveBYOLEfficientB7': dict(wavebyol, dimension=64),
+        'WaveBYOL': dict(wavebyol, dimension=131072),
+        'WaveBYOLTest01': dict(wavebyol, dimension=65536),
+        'WaveBYOLTest02': dict(wavebyol, dimension=131072),
+        'WaveBYOLTest03': dict(wavebyol, audio_window=15200, dimension=86016),
+        'EfficientBYOL': dict(wavebyol, dimension=114688),
+        'waveBYOLOriginal': dict(wavebyol, dimension=65536),
+    }
+    return configs[model_name]
+
+
+def cpu_smoke_inputs(model_name, config):
+    batch_size = config['batch_size']
+    if model_name == 'NormalClassification':
+        return [torch.randn(batch_size, config['downstream_input_dim'])]
+    if model_name == 'BYOLAudioModel':
+        return [torch.randn(batch_size, 1, 64, 96), torch.randn(batch_size, 1, 64, 96)]
+    if model_name in ['CPCModel', 'GenerativeCPCModel']:
+        return [torch.rand(batch_size, 1, config['audio_window'])]
+    views = 3 if model_name == 'EfficientBYOL' else 2
+    return [torch.rand(batch_size, 1, config['audio_window']) for _ in range(views)]
+
+
+def cpu_smoke_step(model_name):
+    # CPU에서 build + forward + backward 한 step (pretrained weight download 없이 random init)
+    import time
+    import src.models.model_backbone as model_backbone
+    import src.utils.interface_device as device_pack
+    device_context = device_pack.DeviceContext('cpu')
+    config = cpu_smoke_config(model_name)
+    with model_backbone.without_pretrained_weights():
+        model = device_context.to_module(model_pack.build_model(config, model_name))
+    model.train()
+    inputs = device_context.to(*cpu_smoke_inputs(model_name, config))
+    inputs = inputs if isinstance(inputs, list) else [inputs]
+    start = time.perf_counter()
+    output = model(*inputs)
+    outputs = output if isinstance(output, tuple) else (output,)
+    # loss는 output 중 마지막 scalar (loss가 없는 downstream model은 output 합)
+    losses = [value for value in outputs if torch.is_tensor(value) and value.dim() == 0 and value.requires_grad]
+    loss = losses[-1] if len(losses) > 0 else outputs[0].sum()
+    forward_time = time.perf_counter() - start
+    start = time.perf_counter()
+    loss.backward()
+    backward_time = time.perf_counter() - start
+    gradients = sum(1 for parameter in model.parameters() if parameter.grad is not None)
+    return forward_time, backward_time, gradients
+
+
+def amp_benchmark_step(model_name, amp, batch_size=8, steps=5, warmup=2):
+    # amp 유무에 따른 학습 throughput (samples/sec)과 peak memory (CUDA: max allocated, CPU: max RSS)
+    import time
+    import resource
+    import src.models.model_backbone as model_backbone
+    import src.utils.interface_device as device_pack
+    device_context = device_pack.DeviceContext('cuda' if torch.cuda.is_available() else 'cpu', amp=amp)
+    config = dict(cpu_smoke_config(model_name), batch_size=batch_size)
+    with model_backbone.without_pretrained_weights():
+        model = device_context.to_module(model_pack.build_model(config, model_name))
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    inputs = device_context.to(*cpu_smoke_inputs(model_name, config))
+    inputs = inputs if isinstance(inputs, list) else [inputs]
+    for step in range(warmup + steps):
+        if step == warmup:
+            device_context.synchronize()
+            if device_context.is_cuda:
+                torch.cuda.reset_peak_memory_stats(device_context.device)
+            start = time.perf_counter()
+        with device_context.autocast():
+            outputs = model(*inputs)
+        outputs = outputs if isinstance(outputs, tuple) else (outputs,)
+        losses = [value for value in outputs if torch.is_tensor(value) and value.dim() == 0 and value.requires_grad]
+        loss = losses[-1] if len(losses) > 0 else outputs[0].float().sum()
+        optimizer.zero_grad()
+        device_context.backward(loss)
+        device_context.step(optimizer)
+    device_context.synchronize()
+    throughput = steps * batch_size / (time.perf_counter() - start)
+    if device_context.is_cuda:
+        return throughput, torch.cuda.max_memory_allocated(device_context.device) / 2 ** 20
+    return throughput, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def checkpoint_benchmark_step(model_name, granularity, fused_view=False, batch_size=8, steps=3, warmup=1):
+    # activation checkpointing 단위별 학습 step time과 peak memory (CUDA: max allocated, CPU: max RSS)
+    # 같은 seed의 초기 weight / 입력에서 loss와 parameter별 gradient norm도 같이 반환 (none과 같아야 함)
+    import time
+    import resource
+    import src.models.model_backbone as model_backbone
+    import src.utils.interface_device as device_pack
+    device_context = device_pack.DeviceContext('cuda' if torch.cuda.is_available() else 'cpu')
+    config = dict(cpu_smoke_config(model_name), batch_size=batch_size, activation_checkpointing=granularity,
+                  fused_view=fused_view, per_view_batchnorm=True)
+    torch.manual_seed(0)
+    with model_backbone.without_pretrained_weights():
+        model = device_context.to_module(model_pack.build_model(config, model_name))
+    inputs = device_context.to(*cpu_smoke_inputs(model_name, config))
+    inputs = inputs if isinstance(inputs, list) else [inputs]
+    model.train()
+    for step in range(warmup + steps):
+        if step == warmup:
+            device_context.synchronize()
+            if device_context.is_cuda:
+                torch.cuda.reset_peak_memory_stats(device_context.device)
+            start = time.perf_counter()
+        model.zero_grad()
+        outputs = model(*inputs)
+        loss = outputs[-1]
+        loss.backward()
+    device_context.synchronize()
+    step_time = (time.perf_counter() - start) / steps
+    if device_context.is_cuda:
+        peak_memory = torch.cuda.max_memory_allocated(device_context.device) / 2 ** 20
+    else:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    gradient_norms = torch.stack([parameter.grad.norm() if parameter.grad is not None else torch.zeros([])
+                                  for parameter in model.parameters()]).cpu()
+    return step_time, peak_memory, loss.item(), gradient_norms
+
+
+if __name__ == '__main__':
+    task = 'cpu_smoke'
+    if task == 'import_time':
+        import sys
+        import subprocess
+        # entry point별 cold import 시간 (module마다 새 python process에서 측정)
+        entry_points = ['src.models.model', 'src.utils.interface_tensorboard', 'src.utils.interface_audio_augmentation',
+                        'src.data.dataset', 'train_pretext_wavebyol', 'train_pretext_efficientbyol',
+                        'train_pretext_byol_audio', 'train_urbcls_wavebyol', 'train_voxceleb_wavebyol']
+        entry_points += sorted(set(entry.module for entry in model_pack.MODEL_REGISTRY.values()))
+        measure = "import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)"
+        for entry_point in entry_points:
+            result = subprocess.run([sys.executable, '-c', measure.format(entry_point)], capture_output=True, text=True)
+            if result.returncode != 0:
+                print("{:>55s} | failed ({})".format(entry_point, result.stderr.strip().splitlines()[-1]))
+            else:
+                print("{:>55s} | {:.3f} sec".format(entry_point, float(result.stdout.strip().splitlines()[-1])))
+    elif task == 'cpu_smoke':
+        # 등록된 모든 model의 CPU forward/backward (model마다 새 process: CUDA 초기화나 다른 model의 memory 영향 없음)
+        import multiprocessing
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            for model_name in model_pack.MODEL_REGISTRY:
+                try:
+                    forward_time, backward_time, gradients = pool.apply(cpu_smoke_step, (model_name,))
+                    print("{:>24s} | forward {:.3f} sec | backward {:.3f} sec | {} parameters with grad".format(
+                        model_name, forward_time, backward_time, gradients))
+                except Exception as error:
+                    print("{:>24s} | failed ({}: {})".format(model_name, type(error).__name__, error))
+    elif task == 'amp_benchmark':
+        import multiprocessing
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            for model_name in ['WaveBYOLEfficientB0', 'WaveBYOLEfficientB4', 'WaveBYOLEfficientB7', 'BYOLAudioModel']:
+                for amp in [None, 'bfloat16', 'float16']:
+                    try:
+                        throughput, peak_memory = pool.apply(amp_benchmark_step, (model_name, amp))
+                        print("{:>24s} | amp {:>8s} | {:.2f} samples/sec | peak memory {:.0f} MB".format(
+                            model_name, str(amp), throughput, peak_memory))
+                    except Exception as error:
+                        print("{:>24s} | amp {:>8s} | failed ({}: {})".format(
+                            model_name, str(amp), type(error).__name__, error))
+    elif task == 'checkpoint_benchmark':
+        import multiprocessing
+        import src.models.model_backbone as model_backbone
+        # stage / block의 loss와 parameter별 gradient norm이 같은 model, 같은 fused_view의 none과 다르면 mismatch
+        mismatches = []
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            for model_name in ['WaveBYOLEfficientB0', 'WaveBYOLEfficientB4', 'WaveBYOL', 'WaveBYOLTest02']:
+                for fused_view in [False, True]:
+                    reference = None
+                    for granularity in model_backbone.CHECKPOINT_GRANULARITIES:
+                        name = "{} ({})".format(model_name, 'fused' if fused_view else 'sequential')
+                        try:
+                            step_time, peak_memory, loss, gradient_norms = pool.apply(
+                                checkpoint_benchmark_step, (model_name, granularity, fused_view))
+                        except Exception as error:
+                            print("{:>37s} | {:>5s} | failed ({}: {})".format(
+                                name, granularity, type(error).__name__, error))
+                            continue
+                        if granularity == 'none':
+                            reference = (loss, gradient_norms)
+                            status = 'reference'
+                        elif reference is None:
+                            status = 'no reference'
+                        elif abs(loss - reference[0]) <= 1e-4 * max(1.0, abs(reference[0])) and \
+                                torch.allclose(gradient_norms, reference[1], rtol=1e-3, atol=1e-6):
+                            status = 'match'
+                        else:
+                            status = 'MISMATCH'
+                            mismatches.append((name, granularity))
+                        print("{:>37s} | {:>5s} | {:.3f} sec/step | peak memory {:.0f} MB | "
+                              "loss {:.6f} | grad norm {:.6f} | {}".format(
+                               name, granularity, step_time, peak_memory, loss, gradient_norms.norm().item(), status))
+        assert (len(mismatches) == 0), "activation checkpointing changed loss / gradients: {}".format(mismatches)
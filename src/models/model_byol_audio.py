@@ -4,6 +4,7 @@ import copy
 import torch
 import torch.nn as nn
 import src.losses.criterion as criterion
+import src.models.model_fused_view as model_fused_view
 
 
 def set_requires_grad(model, requires):
@@ -29,6 +30,8 @@ class BYOLAudio(nn.Module):
         self.target_projector = None
         # loss function
         self.criterion = criterion.byol_criterion
+        # 두 view를 batch 축으로 합쳐서 한번에 실행할지 여부
+        self.fused_view, self.per_view_batchnorm = model_fused_view.fused_view_options(config)
 
     def get_target_encoder(self):
         self.target_encoder = copy.deepcopy(self.online_encoder)
@@ -38,11 +41,14 @@ class BYOLAudio(nn.Module):
         self.target_projector = copy.deepcopy(self.online_projector)
         set_requires_grad(self.target_projector, requires=False)
 
-    def forward(self, x01, x02):
+    def forward(self, x01, x02=None):
         if self.target_encoder is None or self.target_projector is None:
             self.get_target_encoder()
             self.get_target_projector()
 
+        if self.fused_view or x02 is None:
+            return self.forward_fused_view(x01, x02)
+
         online_representation01 = self.online_encoder(x01)
         online_representation02 = self.online_encoder(x02)
         online_projection01 = self.online_projector(online_representation01)
@@ -60,6 +66,18 @@ class BYOLAudio(nn.Module):
         loss = loss01 + loss02
         return online_representation01, loss.mean()
 
+    def forward_fused_view(self, x01, x02=None):
+        def online_path(x):
+            online_representation = self.online_encoder(x)
+            return self.online_projector(online_representation), (online_representation,)
+
+        def target_path(x):
+            return self.target_projector(self.target_encoder(x)), ()
+
+        ((online_representation, _),), _, loss = model_fused_view.fused_view_forward(
+            self, x01, x02, online_path, target_path, self.online_predictor)
+        return online_representation, loss
+
 
 # dimensions of feature representation
 class EncodingNetwork(nn.Module):
@@ -148,10 +166,21 @@ if __name__ == '__main__':
         config=None
     )
 
-    input_data01 = torch.randn((2, 1, 64, 96))
-    input_data02 = torch.randn((2, 1, 64, 96))
-    output = model(input_data01, input_data02)
-    print(output)
+    task = 'forward'
+    if task == 'forward':
+        input_data01 = torch.randn((2, 1, 64, 96))
+        input_data02 = torch.randn((2, 1, 64, 96))
+        output = model(input_data01, input_data02)
+        print(output)
+    elif task == 'benchmark_fused_view':
+        # 순차 실행 vs fused view 실행 throughput (samples / sec)
+        input_data01 = torch.randn((64, 1, 64, 96))
+        input_data02 = torch.randn((64, 1, 64, 96))
+        model(input_data01, input_data02)
+        for per_view_batchnorm in [True, False]:
+            model.per_view_batchnorm = per_view_batchnorm
+            print("per view batchnorm: {}".format(per_view_batchnorm),
+                  model_fused_view.benchmark_fused_view(model, input_data01, input_data02))
 
 
 
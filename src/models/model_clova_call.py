@@ -6,11 +6,6 @@ import random
 import numpy as np
 import torch.nn.functional as F
 
-if torch.cuda.is_available():
-    import torch.cuda as device
-else:
-    import torch as device
-
 
 class MaskConv(nn.Module):
     def __init__(self, seq_module):
@@ -25,9 +20,7 @@ class MaskConv(nn.Module):
         """
         for module in self.seq_module:
             x = module(x)
-            mask = torch.BoolTensor(x.size()).fill_(0)
-            if x.is_cuda:
-                mask = mask.cuda()
+            mask = torch.zeros(x.size(), dtype=torch.bool, device=x.device)
             for i, length in enumerate(lengths):
                 length = length.item()
                 if (mask[i].size(2) - length) > 0:
@@ -84,7 +77,7 @@ class EncoderRNN(nn.Module):
         """
 
         output_lengths = self.get_seq_lens(input_lengths)
-        x = input_var.cuda()  # (B,1,D,T)
+        x = input_var  # (B,1,D,T)
         x, _ = self.conv(x, output_lengths)  # (B, C, D, T)
 
         x_size = x.size()
@@ -271,9 +264,7 @@ class DecoderRNN(nn.Module):
                                                                  function, teacher_forcing_ratio)
         else:
             batch_size = encoder_outputs.size(0)
-            inputs = torch.LongTensor([self.sos_id] * batch_size).view(batch_size, 1)
-            if torch.cuda.is_available():
-                inputs = inputs.cuda()
+            inputs = torch.full((batch_size, 1), self.sos_id, dtype=torch.long, device=encoder_outputs.device)
             max_length = self.max_length
 
         decoder_hidden = None
@@ -333,9 +324,7 @@ class DecoderRNN(nn.Module):
         if inputs is None:
             if teacher_forcing_ratio > 0:
                 raise ValueError("Teacher forcing has to be disabled (set 0) when no inputs is provided.")
-            inputs = torch.LongTensor([self.sos_id] * batch_size).view(batch_size, 1)
-            if torch.cuda.is_available():
-                inputs = inputs.cuda()
+            inputs = torch.full((batch_size, 1), self.sos_id, dtype=torch.long, device=encoder_outputs.device)
             max_length = self.max_length
         else:
             max_length = inputs.size(1) - 1  # minus the start of sequence symbol
@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import json
 import src.losses.criterion_infonce as criterion
+import src.utils.interface_device as device_pack
 
 
 class CPCModel(nn.Module):
@@ -27,7 +28,7 @@ class CPCModel(nn.Module):
         return z, c
 
     def get_latent_size(self, input_size):
-        x = torch.zeros(input_size).cuda()
+        x = torch.zeros(input_size, device=device_pack.module_device(self))
         z, c = self.get_latent_representations(x)
         return c.size(2), c.size(1)
 
@@ -72,7 +73,7 @@ class AutoRegressive(nn.Module):
         )
 
     def forward(self, x):
-        h0 = torch.zeros(1, x.size(0), self.hidden_dim).to(x.get_device())
+        h0 = torch.zeros(1, x.size(0), self.hidden_dim, device=x.device, dtype=x.dtype)
         self.autoregressive.flatten_parameters()
         output, _ = self.autoregressive(x, h0)
         return output
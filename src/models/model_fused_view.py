@@ -0,0 +1,124 @@
+import contextlib
+import time
+import torch
+import torch.nn as nn
+
+
+# fused view 모드: 두 view를 batch 축으로 이어 붙여서 online/target network를 한번씩만 실행
+def fused_view_options(config):
+    # (fused_view, per_view_batchnorm)
+    if config is None:
+        return False, True
+    return config.get('fused_view', False), config.get('per_view_batchnorm', True)
+
+
+def concat_views(x01, x02=None):
+    # x02가 None이면 x01은 이미 (x01, x02) 순서로 이어 붙여진 (2 * batch, ...) 입력 (fused_view_collate)
+    if x02 is None:
+        assert (x01.size(0) % 2 == 0), "Pre-concatenated views need an even batch size"
+        return x01, x01.size(0) // 2
+    return torch.cat([x01, x02], dim=0), x01.size(0)
+
+
+def split_views(x, batch_size):
+    return x[:batch_size], x[batch_size:]
+
+
+def per_view_batchnorm_forward(module, num_views):
+    original_forward = module.forward
+
+    def forward(x):
+        # view 별로 batch statistics를 따로 계산 (running stats도 순차 실행과 동일하게 view마다 갱신)
+        return torch.cat([original_forward(chunk) for chunk in x.chunk(num_views, dim=0)], dim=0)
+    return forward
+
+
+@contextlib.contextmanager
+def per_view_batchnorm(model, enabled=True, num_views=2):
+    """Keep BatchNorm statistics per view while the views share one fused batch.
+
+    The forward of every BatchNorm module is overridden on the instance only for the duration of the block,
+    so parameters and state_dict keys stay untouched. In eval mode the running statistics are used and the
+    override is skipped. Activation checkpointing records the overrides with batchnorm_modes and re-installs
+    them for the recompute in backward, which runs after the block has exited.
+    """
+    patched = []
+    if enabled and model.training:
+        for module in model.modules():
+            if isinstance(module, nn.modules.batchnorm._BatchNorm) and module.training:
+                module.forward = per_view_batchnorm_forward(module, num_views)
+                patched.append(module)
+    try:
+        yield
+    finally:
+        for module in patched:
+            del module.forward
+
+
+def fused_view_forward(model, x01, x02, online_path, target_path, predictor):
+    """Fused view step shared by the BYOL models: concat, online / target path, split and symmetric loss.
+
+    online_path and target_path take the fused batch and return (projection, features), where features is a
+    tuple of intermediate tensors the model returns. The online projection goes through predictor, the
+    target path runs under no_grad, and model.criterion compares each view's prediction with the other view's
+    target projection. Returns (online features, target features, loss) with every feature split into
+    (view 1, view 2).
+    """
+    x, batch_size = concat_views(x01, x02)
+    with per_view_batchnorm(model, enabled=model.per_view_batchnorm):
+        online_projection, online_features = online_path(x)
+        online_prediction = predictor(online_projection)
+        with torch.no_grad():
+            target_projection, target_features = target_path(x)
+
+    online_prediction01, online_prediction02 = split_views(online_prediction, batch_size)
+    target_projection01, target_projection02 = split_views(target_projection, batch_size)
+    loss01 = model.criterion(online_prediction01, target_projection02.detach())
+    loss02 = model.criterion(online_prediction02, target_projection01.detach())
+    loss = loss01 + loss02
+    return [split_views(feature, batch_size) for feature in online_features], \
+        [split_views(feature, batch_size) for feature in target_features], loss.mean()
+
+
+def batchnorm_modes(modules):
+    # 지금 적용된 BatchNorm forward override (per_view_batchnorm), checkpoint가 forward 시점에 저장
+    # modules: module 또는 functools.partial(module, ...) 목록 (checkpoint segment)
+    return [(module, module.__dict__['forward']) for item in modules for module in getattr(item, 'func', item).modules()
+            if isinstance(module, nn.modules.batchnorm._BatchNorm) and 'forward' in module.__dict__]
+
+
+@contextlib.contextmanager
+def restored_batchnorm_modes(modes):
+    # backward의 recompute가 forward 때와 같은 per view 계산을 하도록 저장한 override를 다시 적용
+    previous = [(module, module.__dict__.get('forward')) for module, _ in modes]
+    for module, forward in modes:
+        module.forward = forward
+    try:
+        yield
+    finally:
+        for module, forward in previous:
+            if forward is None:
+                del module.forward
+            else:
+                module.forward = forward
+
+
+def benchmark_fused_view(model, x01, x02, steps=10, warmup=2):
+    # 순차 실행과 fused 실행의 forward + backward throughput (samples / sec)
+    results = {}
+    original_fused_view = model.fused_view
+    for mode, fused_view in [('sequential', False), ('fused', True)]:
+        model.fused_view = fused_view
+        for step in range(warmup + steps):
+            if step == warmup:
+                if x01.is_cuda:
+                    torch.cuda.synchronize()
+                start = time.perf_counter()
+            loss = model(x01, x02)[-1]
+            loss.backward()
+            model.zero_grad(set_to_none=True)
+        if x01.is_cuda:
+            torch.cuda.synchronize()
+        results[mode] = 2 * x01.size(0) * steps / (time.perf_counter() - start)
+    model.fused_view = original_fused_view
+    return results
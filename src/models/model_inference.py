@@ -0,0 +1,217 @@
+import copy
+import json
+import torch
+import torch.nn as nn
+import src.models.model_onnx_runtime as onnx_runtime
+
+
+# downstream feature 추출용 inference graph (config의 "inference_backend")
+# eager: pretext model 그대로, trace: torch.jit.trace + freeze, compile: torch.compile (입력 shape 고정)
+# online branch (pre network -> encoder -> pooling -> projector)만 사용하고 target / predictor는 넣지 않음
+BACKENDS = ['eager', 'trace', 'compile']
+METHODS = ['get_representation', 'get_projection']
+EXCLUDED_MODULES = ['online_predictor_network']
+SHARED_MODULES = ['output_representation']
+METADATA_FILENAME = 'inference.json'
+
+
+class OnlineBranch(nn.Module):
+    def __init__(self, model, method='get_projection'):
+        super(OnlineBranch, self).__init__()
+        assert (method in METHODS), "Unknown inference method: {}".format(method)
+        for name, module in model.named_children():
+            if (name.startswith('online_') and name not in EXCLUDED_MODULES) or name in SHARED_MODULES:
+                self.add_module(name, module)
+        # get_representation / get_projection 구현은 pretext model class의 것을 그대로 사용
+        self.model_class = type(model)
+        self.method = method
+
+    def get_representation(self, x):
+        return self.model_class.get_representation(self, x)
+
+    def get_projection(self, x):
+        return self.model_class.get_projection(self, x)
+
+    def forward(self, x):
+        # trace는 tensor tuple만 반환할 수 있어서 output을 tensor 목록으로 펼침
+        tensors, _ = flatten_output(getattr(self, self.method)(x))
+        return tuple(tensors)
+
+
+def flatten_output(output):
+    # (tensor 목록, structure) - structure의 list는 tuple, {'tensor': index}는 tensor, {'constant': value}는 상수
+    tensors = []
+
+    def visit(value):
+        if torch.is_tensor(value):
+            tensors.append(value)
+            return {'tensor': len(tensors) - 1}
+        if isinstance(value, (tuple, list)):
+            return [visit(item) for item in value]
+        return {'constant': value}
+    return tensors, visit(output)
+
+
+def downstream_features(output, method):
+    # downstream trainer와 같은 입력: get_projection은 projection, get_representation은 (batch, time * mel * ch)
+    if method == 'get_projection':
+        return output[0]
+    return output.reshape((output.size(0), -1))
+
+
+class InferenceModel(nn.Module):
+    # get_representation / get_projection을 compile된 graph로 실행 (downstream trainer에서 pretext model 대신 사용)
+    def __init__(self, graphs, structures, input_shape, backend):
+        super(InferenceModel, self).__init__()
+        self.graphs = nn.ModuleDict(graphs)
+        self.structures = structures
+        self.input_shape = list(input_shape)
+        self.backend = backend
+
+    def run(self, method, x):
+        assert (method in self.graphs), "{} is not compiled (compiled: {})".format(method, list(self.graphs.keys()))
+        # batch 크기만 달라질 수 있음 (channel, audio_window는 build할 때의 shape와 같아야 함)
+        assert (list(x.shape[1:]) == self.input_shape[1:]), \
+            "Input shape {} does not match the compiled shape {}".format(list(x.shape), self.input_shape)
+        return onnx_runtime.unflatten_output(list(self.graphs[method](x)), self.structures[method])
+
+    def get_representation(self, x):
+        return self.run('get_representation', x)
+
+    def get_projection(self, x):
+        return self.run('get_projection', x)
+
+
+def example_input(model, audio_window, batch_size=1):
+    parameter = next(model.parameters())
+    return torch.rand(batch_size, 1, audio_window, device=parameter.device, dtype=parameter.dtype)
+
+
+def compile_branch(branch, x, backend):
+    if backend == 'eager':
+        return branch
+    if backend == 'trace':
+        with torch.no_grad():
+            traced = torch.jit.trace(branch, x, check_trace=False)
+        return torch.jit.freeze(traced)
+    compiled = torch.compile(branch, dynamic=False)
+    with torch.no_grad():
+        compiled(x)
+    return compiled
+
+
+def build_inference_model(model, audio_window, backend='trace', methods=('get_projection',), batch_size=1):
+    assert (backend in BACKENDS), "Unknown inference backend: {}".format(backend)
+    model.eval()
+    x = example_input(model, audio_window, batch_size=batch_size)
+    graphs, structures = {}, {}
+    for method in methods:
+        branch = OnlineBranch(model, method=method).eval()
+        with torch.no_grad():
+            _, structures[method] = flatten_output(getattr(branch, method)(x))
+        graphs[method] = compile_branch(branch, x, backend)
+    return InferenceModel(graphs, structures, x.shape, backend)
+
+
+def get_inference_model(model, config, methods=('get_projection',)):
+    # inference_backend가 eager면 (기본값) pretext model을 그대로 사용
+    backend = config.get('inference_backend', 'eager')
+    if backend == 'eager':
+        return model
+    return build_inference_model(model, config['audio_window'], backend=backend, methods=methods,
+                                 batch_size=config.get('batch_size', 1))
+
+
+class ExportableAdaptiveAvgPool(nn.Module):
+    # nn.AdaptiveAvgPool{1,2,3}d와 같은 계산을 축마다 구간 평균으로 (adaptive pooling은 축별로 나눠서 계산해도 같음)
+    # ONNX exporter가 adaptive_avg_pool3d를 지원하지 않아서 export할 때만 사용, batch 외의 shape는 export 시점에 고정
+    def __init__(self, output_size):
+        super(ExportableAdaptiveAvgPool, self).__init__()
+        self.output_size = output_size
+
+    def forward(self, x):
+        for axis, size in zip(range(x.dim() - len(self.output_size), x.dim()), self.output_size):
+            length = x.size(axis)
+            if size is None or size == length:
+                continue
+            if length % size == 0:
+                x = x.unflatten(axis, (size, length // size)).mean(dim=axis + 1)
+                continue
+            x = torch.cat([x.narrow(axis, index * length // size,
+                                    -(-(index + 1) * length // size) - index * length // size).mean(dim=axis, keepdim=True)
+                           for index in range(size)], dim=axis)
+        return x
+
+
+def exportable_branch(model, method):
+    # online module만 float32 / CPU로 복사해서 파일로 저장할 수 있게 바꿈 (학습 중인 model은 그대로)
+    branch = copy.deepcopy(OnlineBranch(model, method=method)).float().cpu().eval()
+    for module in branch.modules():
+        # efficientnet_pytorch의 MemoryEfficientSwish (custom autograd function)는 TorchScript / ONNX로 저장이 안 됨
+        if hasattr(module, 'set_swish'):
+            module.set_swish(memory_efficient=False)
+    for name, module in list(branch.named_children()):
+        if isinstance(module, (nn.AdaptiveAvgPool1d, nn.AdaptiveAvgPool2d, nn.AdaptiveAvgPool3d)):
+            output_size = module.output_size if isinstance(module.output_size, tuple) else (module.output_size,)
+            setattr(branch, name, ExportableAdaptiveAvgPool(output_size))
+    return branch
+
+
+def export_inference_graph(model, path, audio_window, method='get_projection', batch_size=1):
+    # trace된 online branch를 TorchScript 파일로 저장 (입력 shape와 output structure는 extra file로 같이 저장)
+    branch = exportable_branch(model, method)
+    x = torch.rand(batch_size, 1, audio_window)
+    with torch.no_grad():
+        _, structure = flatten_output(getattr(branch, method)(x))
+    metadata = {'method': method, 'input_shape': list(x.shape), 'structure': structure}
+    torch.jit.save(compile_branch(branch, x, 'trace'), path, _extra_files={METADATA_FILENAME: json.dumps(metadata)})
+    return path
+
+
+def load_inference_graph(path, device='cpu'):
+    extra_files = {METADATA_FILENAME: ''}
+    graph = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    metadata = json.loads(extra_files[METADATA_FILENAME])
+    return InferenceModel({metadata['method']: graph}, {metadata['method']: metadata['structure']},
+                          metadata['input_shape'], backend='trace')
+
+
+def benchmark_step(model_name, backend, batch_size, method='get_projection', steps=10, warmup=3):
+    # CPU에서 eager 대비 compile된 online branch의 latency (ms / batch)와 output 차이
+    import time
+    import src.models.model as model_pack
+    import src.models.model_benchmark as model_benchmark
+    import src.models.model_backbone as model_backbone
+    torch.manual_seed(0)
+    config = model_benchmark.cpu_smoke_config(model_name)
+    with model_backbone.without_pretrained_weights():
+        model = model_pack.build_model(config, model_name).eval()
+    x = example_input(model, config['audio_window'], batch_size=batch_size)
+    inference_model = build_inference_model(model, config['audio_window'], backend=backend, methods=[method],
+                                            batch_size=batch_size)
+    with torch.no_grad():
+        for _ in range(warmup):
+            output = getattr(inference_model, method)(x)
+        start = time.perf_counter()
+        for _ in range(steps):
+            output = getattr(inference_model, method)(x)
+        latency = (time.perf_counter() - start) / steps * 1000
+        expected, _ = flatten_output(getattr(model, method)(x))
+    actual, _ = flatten_output(output)
+    max_difference = max((a - b).abs().max().item() for a, b in zip(actual, expected))
+    return latency, max_difference
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for model_name in ['WaveBYOLEfficientB0', 'WaveBYOLEfficientB0Mix', 'WaveBYOLEfficientB4']:
+            for batch_size in [1, 8]:
+                for backend in BACKENDS:
+                    try:
+                        latency, max_difference = pool.apply(benchmark_step, (model_name, backend, batch_size))
+                        print("{:>24s} | batch {:>2d} | {:>7s} | {:.2f} ms | max diff {:.2e}".format(
+                            model_name, batch_size, backend, latency, max_difference))
+                    except Exception as error:
+                        print("{:>24s} | batch {:>2d} | {:>7s} | failed ({}: {})".format(
+                            model_name, batch_size, backend, type(error).__name__, error))
@@ -0,0 +1,161 @@
+import math
+import itertools
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+# memory에 올린 embedding tensor로 하는 downstream probe (embedding store / extract_embeddings.py 결과)
+# closed form: ridge / least squares classifier (alpha 여러개를 eigendecomposition 한번으로 계산)
+# stacked heads: learning rate, weight decay, hidden size가 다른 DownstreamClassification head 여러개를 한번에 학습
+
+
+def standardize(train_x, *other_x):
+    # train embedding의 평균 / 표준편차로 정규화
+    mean = train_x.mean(dim=0, keepdim=True)
+    std = train_x.std(dim=0, keepdim=True).clamp_min(1e-6)
+    return [(x - mean) / std for x in (train_x,) + other_x]
+
+
+def ridge_classifiers(train_x, train_y, num_classes, alphas, dtype=torch.float64):
+    # alpha별 (weight (dim, class), bias (class,)), alpha 0은 least squares (minimum norm)
+    # dim <= sample 수면 X^T X (dim x dim), 아니면 X X^T (sample x sample)의 eigendecomposition을 공유
+    x = train_x.to(dtype)
+    y = F.one_hot(train_y, num_classes).to(dtype)
+    x_mean, y_mean = x.mean(dim=0), y.mean(dim=0)
+    x, y = x - x_mean, y - y_mean
+    num_samples, dimension = x.shape
+    primal = dimension <= num_samples
+    eigenvalues, eigenvectors = torch.linalg.eigh(x.T @ x if primal else x @ x.T)
+    projected = eigenvectors.T @ (x.T @ y if primal else y)
+    tolerance = eigenvalues.max().clamp_min(0) * max(num_samples, dimension) * torch.finfo(dtype).eps
+    classifiers = []
+    for alpha in alphas:
+        denominator = eigenvalues + alpha
+        inverse = torch.where(denominator > tolerance, 1.0 / denominator, torch.zeros_like(denominator))
+        coefficient = eigenvectors @ (projected * inverse.unsqueeze(1))
+        weight = coefficient if primal else x.T @ coefficient
+        bias = y_mean - x_mean @ weight
+        classifiers.append((weight.to(train_x.dtype), bias.to(train_x.dtype)))
+    return classifiers
+
+
+def accuracy(logits, y):
+    return (logits.argmax(dim=-1) == y).float().mean(dim=-1)
+
+
+def stacked_uniform(num_heads, fan_in, *shape):
+    # nn.Linear 기본 초기화와 같은 범위 (kaiming_uniform(a=sqrt(5)) -> U(-1/sqrt(fan_in), 1/sqrt(fan_in)))
+    bound = 1.0 / math.sqrt(fan_in)
+    return nn.Parameter(torch.empty(num_heads, *shape).uniform_(-bound, bound))
+
+
+class StackedProbeHeads(nn.Module):
+    # hidden size가 같은 head H개: Linear -> BatchNorm1d -> ReLU -> Linear (hidden_dim 0이면 Linear 하나)
+    # 입력 (batch, input_dim)은 모든 head가 공유, 출력 (head, batch, output_dim)
+    def __init__(self, num_heads, input_dim, hidden_dim, output_dim, momentum=0.1, eps=1e-5):
+        super(StackedProbeHeads, self).__init__()
+        self.hidden_dim = hidden_dim
+        self.momentum = momentum
+        self.eps = eps
+        if hidden_dim == 0:
+            self.weight02 = stacked_uniform(num_heads, input_dim, input_dim, output_dim)
+            self.bias02 = stacked_uniform(num_heads, input_dim, output_dim)
+            return
+        self.weight01 = stacked_uniform(num_heads, input_dim, input_dim, hidden_dim)
+        self.bias01 = stacked_uniform(num_heads, input_dim, hidden_dim)
+        self.bn_weight = nn.Parameter(torch.ones(num_heads, hidden_dim))
+        self.bn_bias = nn.Parameter(torch.zeros(num_heads, hidden_dim))
+        self.register_buffer('running_mean', torch.zeros(num_heads, hidden_dim))
+        self.register_buffer('running_var', torch.ones(num_heads, hidden_dim))
+        self.weight02 = stacked_uniform(num_heads, hidden_dim, hidden_dim, output_dim)
+        self.bias02 = stacked_uniform(num_heads, hidden_dim, output_dim)
+
+    def forward(self, x):
+        if self.hidden_dim == 0:
+            return torch.einsum('bi,hio->hbo', x, self.weight02) + self.bias02.unsqueeze(1)
+        hidden = torch.einsum('bi,hio->hbo', x, self.weight01) + self.bias01.unsqueeze(1)
+        if self.training:
+            mean = hidden.mean(dim=1)
+            var = hidden.var(dim=1, unbiased=False)
+            with torch.no_grad():
+                unbiased_var = var * hidden.size(1) / max(hidden.size(1) - 1, 1)
+                self.running_mean.lerp_(mean, self.momentum)
+                self.running_var.lerp_(unbiased_var, self.momentum)
+        else:
+            mean, var = self.running_mean, self.running_var
+        hidden = (hidden - mean.unsqueeze(1)) * torch.rsqrt(var.unsqueeze(1) + self.eps)
+        hidden = F.relu(hidden * self.bn_weight.unsqueeze(1) + self.bn_bias.unsqueeze(1))
+        return torch.bmm(hidden, self.weight02) + self.bias02.unsqueeze(1)
+
+
+class StackedAdam:
+    # torch.optim.Adam과 같은 update (weight decay는 gradient에 더하는 L2), learning rate / weight decay는 head별 값
+    def __init__(self, parameters, learning_rates, weight_decays, betas=(0.9, 0.999), eps=1e-8):
+        self.parameters = list(parameters)
+        self.learning_rates = learning_rates
+        self.weight_decays = weight_decays
+        self.betas = betas
+        self.eps = eps
+        self.step_count = 0
+        self.exp_avg = [torch.zeros_like(parameter) for parameter in self.parameters]
+        self.exp_avg_sq = [torch.zeros_like(parameter) for parameter in self.parameters]
+
+    def zero_grad(self):
+        for parameter in self.parameters:
+            parameter.grad = None
+
+    @torch.no_grad()
+    def step(self):
+        self.step_count += 1
+        beta1, beta2 = self.betas
+        bias_correction1 = 1 - beta1 ** self.step_count
+        bias_correction2 = 1 - beta2 ** self.step_count
+        for parameter, exp_avg, exp_avg_sq in zip(self.parameters, self.exp_avg, self.exp_avg_sq):
+            shape = (-1,) + (1,) * (parameter.dim() - 1)
+            gradient = parameter.grad + self.weight_decays.view(shape) * parameter
+            exp_avg.lerp_(gradient, 1 - beta1)
+            exp_avg_sq.mul_(beta2).addcmul_(gradient, gradient, value=1 - beta2)
+            denominator = (exp_avg_sq / bias_correction2).sqrt_().add_(self.eps)
+            parameter.sub_(self.learning_rates.view(shape) / bias_correction1 * exp_avg / denominator)
+
+
+def probe_grid(learning_rates, weight_decays, hidden_sizes):
+    return [{'learning_rate': learning_rate, 'weight_decay': weight_decay, 'hidden_size': hidden_size}
+            for learning_rate, weight_decay, hidden_size in itertools.product(learning_rates, weight_decays,
+                                                                              hidden_sizes)]
+
+
+def train_stacked_heads(train_x, train_y, test_x, test_y, num_classes, grid, epochs=50, batch_size=256, seed=0):
+    # grid의 head를 hidden size별로 묶어서 같이 학습, epoch마다 test accuracy를 기록해서 (마지막, 최고) accuracy 반환
+    generator = torch.Generator(device='cpu').manual_seed(seed)
+    device = train_x.device
+    results = [None] * len(grid)
+    for hidden_size in sorted(set(setting['hidden_size'] for setting in grid)):
+        indices = [index for index, setting in enumerate(grid) if setting['hidden_size'] == hidden_size]
+        torch.manual_seed(seed)
+        heads = StackedProbeHeads(len(indices), train_x.size(1), hidden_size, num_classes).to(device)
+        optimizer = StackedAdam(
+            heads.parameters(),
+            learning_rates=torch.tensor([grid[index]['learning_rate'] for index in indices], device=device),
+            weight_decays=torch.tensor([grid[index]['weight_decay'] for index in indices], device=device),
+        )
+        best_accuracy = torch.zeros(len(indices), device=device)
+        for epoch in range(epochs):
+            heads.train()
+            permutation = torch.randperm(train_x.size(0), generator=generator).to(device)
+            for batch in permutation.split(batch_size):
+                logits = heads(train_x[batch])
+                # head별 loss의 합: 각 head의 gradient는 자기 loss에서만 나옴
+                loss = F.cross_entropy(logits.flatten(0, 1), train_y[batch].repeat(len(indices)),
+                                       reduction='sum') / batch.numel()
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+            heads.eval()
+            with torch.no_grad():
+                test_accuracy = accuracy(heads(test_x), test_y)
+            best_accuracy = torch.maximum(best_accuracy, test_accuracy)
+        for position, index in enumerate(indices):
+            results[index] = (test_accuracy[position].item(), best_accuracy[position].item())
+    return results
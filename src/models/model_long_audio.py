@@ -0,0 +1,157 @@
+import torch
+import torch.nn as nn
+import src.models.model_inference as inference_pack
+import src.utils.interface_audio_io as audio_io
+import src.utils.interface_device as device_pack
+
+
+# audio_window보다 긴 audio의 file 단위 embedding (full_audio=True dataset / 긴 녹음 파일)
+# waveform을 hop 간격의 audio_window chunk로 자르고, 여러 file의 chunk를 모아 batch_size 단위로 pretext model 실행
+# chunk embedding은 file별로 pooling (mean 또는 attentive), 상태는 (max score, 합, 가중합)만 유지하는 online softmax라
+# memory는 file 길이와 관계 없이 audio_window + block_size sample과 batch_size chunk 정도
+POOLINGS = ['mean', 'attentive']
+
+
+def sliding_windows(blocks, audio_window, hop):
+    # blocks: (1, n) waveform block iterable, (1, audio_window) chunk를 순서대로 반환
+    # 마지막 chunk 뒤에 남은 sample이 있으면 끝에 맞춘 chunk를 하나 더, audio_window보다 짧으면 (빈 audio 포함) padding한 chunk 하나
+    assert (0 < hop <= audio_window), "hop must be in (0, audio_window]: {}".format(hop)
+    buffer = torch.zeros(1, 0)
+    tail = torch.zeros(1, 0)
+    num_windows = 0
+    for block in blocks:
+        buffer = torch.cat([buffer, block], dim=1)
+        tail = torch.cat([tail, block], dim=1)[:, -audio_window:]
+        while buffer.size(1) >= audio_window:
+            yield buffer[:, :audio_window]
+            num_windows += 1
+            buffer = buffer[:, hop:]
+    if num_windows == 0:
+        yield audio_io.audio_adjust_length(buffer, audio_window)
+    elif buffer.size(1) > audio_window - hop:
+        yield tail
+
+
+def waveform_blocks(waveform, block_size=16000 * 60):
+    # memory에 있는 (channel, length) waveform을 block iterable로 (dataset의 full_audio 출력)
+    return waveform.mean(dim=0, keepdim=True).split(block_size, dim=1)
+
+
+class AttentivePooling(nn.Module):
+    # chunk embedding (chunk, dim)의 attention score (chunk,), downstream head와 같이 학습해서 사용
+    def __init__(self, input_dim, hidden_dim=128):
+        super(AttentivePooling, self).__init__()
+        self.attention = nn.Sequential(
+            nn.Linear(input_dim, hidden_dim),
+            nn.Tanh(),
+            nn.Linear(hidden_dim, 1),
+        )
+
+    def score(self, x):
+        return self.attention(x).squeeze(-1)
+
+    def forward(self, x, mask=None):
+        # x: (batch, chunk, dim), mask: (batch, chunk) True가 유효한 chunk -> (batch, dim)
+        scores = self.score(x)
+        if mask is not None:
+            scores = scores.masked_fill(~mask, -float('inf'))
+        return (torch.softmax(scores, dim=1).unsqueeze(-1) * x).sum(dim=1)
+
+
+class PoolingState:
+    # online softmax: score가 0이면 mean pooling
+    def __init__(self):
+        self.max_score = None
+        self.normalizer = None
+        self.weighted_sum = None
+        self.num_chunks = 0
+
+    def update(self, embeddings, scores):
+        batch_max = scores.max()
+        if self.max_score is None:
+            self.max_score = batch_max
+            self.normalizer = torch.zeros_like(batch_max)
+            self.weighted_sum = torch.zeros_like(embeddings[0])
+        max_score = torch.maximum(self.max_score, batch_max)
+        rescale = torch.exp(self.max_score - max_score)
+        weights = torch.exp(scores - max_score)
+        self.normalizer = self.normalizer * rescale + weights.sum()
+        self.weighted_sum = self.weighted_sum * rescale + weights @ embeddings
+        self.max_score = max_score
+        self.num_chunks += embeddings.size(0)
+
+    def result(self):
+        return self.weighted_sum / self.normalizer
+
+
+class LongAudioEmbedder:
+    def __init__(self, model, audio_window, hop=None, batch_size=32, method='get_projection', pooling='mean',
+                 attentive_pooling=None, device_context=None):
+        assert (method in inference_pack.METHODS), "Unknown inference method: {}".format(method)
+        assert (pooling in POOLINGS), "Unknown pooling: {}".format(pooling)
+        assert (pooling != 'attentive' or attentive_pooling is not None), "attentive pooling needs a trained module"
+        self.model = model
+        self.audio_window = audio_window
+        self.hop = hop or audio_window // 2
+        self.batch_size = batch_size
+        self.method = method
+        self.pooling = pooling
+        self.attentive_pooling = attentive_pooling
+        self.device_context = device_context or device_pack.DeviceContext(device=device_pack.module_device(model))
+
+    def chunk_embeddings(self, chunks):
+        with torch.no_grad(), self.device_context.autocast():
+            output = getattr(self.model, self.method)(self.device_context.to(torch.stack(chunks)))
+            embeddings = inference_pack.downstream_features(output, self.method).float()
+            if self.pooling == 'mean':
+                return embeddings, torch.zeros(embeddings.size(0), device=embeddings.device)
+            return embeddings, self.attentive_pooling.score(embeddings).float()
+
+    def embed_stream(self, sources):
+        # sources: file별 block iterable -> (source index, (dim,) embedding, chunk 수)를 source 순서대로 반환
+        # 여러 file의 chunk가 한 batch에 섞이고, batch를 실행한 뒤 끝난 file부터 내보냄
+        chunks, owners = [], []
+        states, finished = {}, []
+
+        def flush():
+            if len(chunks) > 0:
+                embeddings, scores = self.chunk_embeddings(chunks)
+                owner_tensor = torch.tensor(owners, device=embeddings.device)
+                for owner in sorted(set(owners)):
+                    selected = owner_tensor == owner
+                    states.setdefault(owner, PoolingState()).update(embeddings[selected], scores[selected])
+                chunks.clear()
+                owners.clear()
+            completed = []
+            while len(finished) > 0:
+                owner = finished.pop(0)
+                state = states.pop(owner)
+                completed.append((owner, state.result().cpu(), state.num_chunks))
+            return completed
+
+        for index, blocks in enumerate(sources):
+            for chunk in sliding_windows(blocks, self.audio_window, self.hop):
+                chunks.append(chunk)
+                owners.append(index)
+                if len(chunks) >= self.batch_size:
+                    # 지금 file은 아직 chunk가 남았을 수 있어서 finished에 넣기 전에 실행
+                    yield from flush()
+            finished.append(index)
+        # 마지막 batch가 딱 맞게 실행됐어도 끝난 file이 남아 있을 수 있음
+        yield from flush()
+
+    def embed_files(self, audio_files, sample_rate=16000, block_size=16000 * 60):
+        # audio file 경로 -> (file 수, dim) embedding, file은 block_size sample씩 streaming으로 읽음
+        # audio_window는 sample_rate 기준이므로 다른 sampling rate의 file은 읽기 전에 에러
+        def source(audio_file):
+            file_sample_rate = audio_io.audio_sample_rate(audio_file)
+            assert (file_sample_rate == sample_rate), "sampling rate of {} is {}, expected {}".format(
+                audio_file, file_sample_rate, sample_rate)
+            return audio_io.audio_block_loader(audio_file, block_size)
+        sources = (source(audio_file) for audio_file in audio_files)
+        return torch.stack([embedding for _, embedding, _ in self.embed_stream(sources)])
+
+    def embed_waveforms(self, waveforms):
+        # (channel, length) waveform 목록 (길이가 달라도 됨) -> (waveform 수, dim)
+        return torch.stack([embedding for _, embedding, _ in
+                            self.embed_stream(waveform_blocks(waveform) for waveform in waveforms)])
@@ -0,0 +1,88 @@
+import json
+import torch
+import src.models.model_inference as inference_pack
+import src.models.model_onnx_runtime as onnx_runtime
+
+
+# load_model로 만든 pretext model의 online branch (model_inference.OnlineBranch)를 batch 축이 dynamic인 ONNX로 저장
+INPUT_NAME = 'waveform'
+OPSET_VERSION = 18
+
+
+def export_onnx(model, path, audio_window, method='get_projection', batch_size=1, opset_version=OPSET_VERSION):
+    branch = inference_pack.exportable_branch(model, method)
+    x = torch.rand(batch_size, 1, audio_window)
+    with torch.no_grad():
+        tensors, structure = inference_pack.flatten_output(getattr(branch, method)(x))
+        output_names = ['output{:02d}'.format(index) for index in range(len(tensors))]
+        torch.onnx.export(
+            branch, (x,), path,
+            input_names=[INPUT_NAME], output_names=output_names,
+            dynamic_axes={name: {0: 'batch'} for name in [INPUT_NAME] + output_names},
+            opset_version=opset_version, do_constant_folding=True,
+        )
+    metadata = {'method': method, 'input_shape': list(x.shape), 'structure': structure,
+                'output_names': output_names, 'opset_version': opset_version}
+    with open(onnx_runtime.metadata_path(path), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+    return path
+
+
+def verify_onnx(model, path, batch_sizes=(1, 4), num_threads=None):
+    # 같은 입력에서 PyTorch online branch와 onnxruntime output의 최대 차이 (batch size별)
+    onnx_model = onnx_runtime.OnnxInferenceModel(path, num_threads=num_threads)
+    branch = inference_pack.exportable_branch(model, onnx_model.method)
+    differences = {}
+    for batch_size in batch_sizes:
+        x = torch.rand(batch_size, *onnx_model.input_shape[1:])
+        with torch.no_grad():
+            expected, _ = inference_pack.flatten_output(getattr(branch, onnx_model.method)(x))
+        actual, _ = inference_pack.flatten_output(
+            [torch.from_numpy(array) for array in onnx_model.session.run(None, {onnx_model.input_name: x.numpy()})])
+        differences[batch_size] = max((a - b).abs().max().item() for a, b in zip(actual, expected))
+    return differences
+
+
+def benchmark_step(model_name, batch_sizes=(1, 4, 16), steps=10, warmup=3):
+    # CPU에서 PyTorch eager와 onnxruntime의 latency (ms / batch)와 throughput (samples / sec), output 차이
+    import os
+    import time
+    import tempfile
+    import src.models.model as model_pack
+    import src.models.model_benchmark as model_benchmark
+    import src.models.model_backbone as model_backbone
+    torch.manual_seed(0)
+    config = model_benchmark.cpu_smoke_config(model_name)
+    with model_backbone.without_pretrained_weights():
+        model = model_pack.build_model(config, model_name).eval()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = export_onnx(model, os.path.join(directory, "{}.onnx".format(model_name)), config['audio_window'])
+        differences = verify_onnx(model, path, batch_sizes=batch_sizes)
+        onnx_model = onnx_runtime.OnnxInferenceModel(path)
+        branch = inference_pack.exportable_branch(model, onnx_model.method)
+        for batch_size in batch_sizes:
+            x = torch.rand(batch_size, 1, config['audio_window'])
+            for backend, run in [('torch', lambda: branch.get_projection(x)),
+                                 ('onnxruntime', lambda: onnx_model.get_projection(x.numpy()))]:
+                with torch.no_grad():
+                    for _ in range(warmup):
+                        run()
+                    start = time.perf_counter()
+                    for _ in range(steps):
+                        run()
+                latency = (time.perf_counter() - start) / steps
+                results.append((batch_size, backend, latency * 1000, batch_size / latency, differences[batch_size]))
+    return results
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for model_name in ['WaveBYOLEfficientB0', 'WaveBYOLEfficientB4', 'WaveBYOLEfficientB0Mix']:
+            try:
+                for batch_size, backend, latency, throughput, difference in pool.apply(benchmark_step, (model_name,)):
+                    print("{:>24s} | batch {:>2d} | {:>11s} | {:.2f} ms | {:.1f} samples/sec | max diff {:.2e}".format(
+                        model_name, batch_size, backend, latency, throughput, difference))
+            except Exception as error:
+                print("{:>24s} | failed ({}: {})".format(model_name, type(error).__name__, error))
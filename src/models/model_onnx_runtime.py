@@ -0,0 +1,48 @@
+import json
+import numpy as np
+import src.utils.interface_lazy_import as lazy_import
+ort = lazy_import.lazy_import('onnxruntime')
+
+
+# model_onnx.export_onnx로 저장한 online branch를 onnxruntime으로 실행 (torch 없이 CPU serving)
+# 입력 shape와 output structure는 "<onnx path>.json"에 같이 저장되어 있음
+def metadata_path(path):
+    return "{}.json".format(path)
+
+
+def unflatten_output(tensors, structure):
+    # structure의 list는 tuple, {'tensor': index}는 tensor (또는 numpy array), {'constant': value}는 상수
+    if isinstance(structure, list):
+        return tuple(unflatten_output(tensors, item) for item in structure)
+    if 'tensor' in structure:
+        return tensors[structure['tensor']]
+    return structure['constant']
+
+
+class OnnxInferenceModel:
+    def __init__(self, path, num_threads=None, providers=('CPUExecutionProvider',)):
+        with open(metadata_path(path), 'r') as metadata_file:
+            metadata = json.load(metadata_file)
+        self.method = metadata['method']
+        self.input_shape = metadata['input_shape']
+        self.structure = metadata['structure']
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=list(providers))
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, method, x):
+        assert (method == self.method), "{} is not exported (exported: {})".format(method, self.method)
+        # batch 축만 dynamic (channel, audio_window는 export할 때의 shape와 같아야 함)
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        assert (list(x.shape[1:]) == self.input_shape[1:]), \
+            "Input shape {} does not match the exported shape {}".format(list(x.shape), self.input_shape)
+        return unflatten_output(self.session.run(None, {self.input_name: x}), self.structure)
+
+    def get_representation(self, x):
+        return self.run('get_representation', x)
+
+    def get_projection(self, x):
+        return self.run('get_projection', x)
@@ -41,7 +41,8 @@ class GenerativeCPCModel(model_baseline.CPCModel):
         return z, permuted_z, c
 
     def alteration(self, z):
-        alterated_z = tensor_manipulation.random_alteration_tensor_1d(z)
+        # encoder의 ReLU output을 in-place로 바꾸면 backward가 실패하므로 복사본을 변경
+        alterated_z = tensor_manipulation.random_alteration_tensor_1d(z.clone())
         return alterated_z
 
     def generative_network(self, z):
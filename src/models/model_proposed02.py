@@ -1,10 +1,11 @@
-import collections
+import functools
 import torch
 import torch.nn as nn
-import torchvision
 import copy
 import src.models.model_cpc as model_baseline
 import src.losses.criterion as losses
+import src.models.model_backbone as model_backbone
+import src.models.model_fused_view as model_fused_view
 
 
 # 모델 파라미터의 gradient 업데이트 여부를 결정
@@ -20,32 +21,32 @@ class PreNetwork(model_baseline.Encoder):
 
 
 class EncoderNetwork(nn.Module):
-    def __init__(self):
+    def __init__(self, checkpoint_granularity='none'):
         super(EncoderNetwork, self).__init__()
+        # activation checkpointing 단위 (none, stage: layer1 ~ layer4, block: residual block)
+        self.checkpoint_granularity = checkpoint_granularity
         # 생각보다 vgg가 성능이 안좋지 않나 싶음
         # self.vgg16 = torchvision.models.vgg16_bn(pretrained=True, ).features
-        self.network = nn.Sequential(
-            collections.OrderedDict(
-                [
-                    ("feature_extract_layer01", nn.Conv2d(1, 3, kernel_size=1, stride=1)), # it just 1*1 convolution
-                    ("feature_extract_layer02", torchvision.models.resnet50(pretrained=True).conv1),
-                    ("feature_extract_layer03", torchvision.models.resnet50(pretrained=True).bn1),
-                    ("feature_extract_layer04", torchvision.models.resnet50(pretrained=True).relu),
-                    ("feature_extract_layer05", torchvision.models.resnet50(pretrained=True).maxpool),
-                    ("feature_extract_layer06", torchvision.models.resnet50(pretrained=True).layer1),
-                    ("feature_extract_layer07", torchvision.models.resnet50(pretrained=True).layer2),
-                    ("feature_extract_layer08", torchvision.models.resnet50(pretrained=True).layer3),
-                    ("feature_extract_layer09", torchvision.models.resnet50(pretrained=True).layer4),
-
-                ]
-            )
-        )
+        self.network = model_backbone.resnet_encoder('resnet50', pretrained=True)
 
     def forward(self, x):
-        out = self.network(x)
+        out = model_backbone.sequential_features(self.network, x, self.checkpoint_granularity)
         return out
 
 
+def representation_path(pre_network, encoder_network, output_representation, projector_network, x,
+                        pooled_projection=False):
+    # fused view의 online / target path: (projection, (pre network 출력, representation, output_representation 출력))
+    # pooled_projection: output_representation으로 pooling한 representation을 projector에 넣음 (efficientnet combine)
+    x_pre = pre_network(x)
+    representation = encoder_network(x_pre.unsqueeze(1))
+    representation_output = output_representation(representation)
+    projector_input = representation_output if pooled_projection else representation
+    projector_input = projector_input.permute(0, 3, 2, 1)  # (batch, time, mel, ch)
+    B, T, D, C = projector_input.shape
+    return projector_network(projector_input.reshape((B, T * C * D))), (x_pre, representation, representation_output)
+
+
 # projection network와 prediction network는 코드상으로 다른점이 하나도 없기 때문에 한번에 정의해도 됨
 # 일부러 분리해서 작성했는데 구지 그럴 필요가 있었는지 이류를 찾는 중
 class ProjectionNetwork(nn.Module):
@@ -90,7 +91,7 @@ class WaveBYOL(nn.Module):
             paddings=pre_paddings,
         )
         # audio_window가 달라진다면 바뀌어야할 파라미터들이 있어서, 나중에는 파라미터로 직접 받을 수 있게 변경하는 것이 좋을 듯
-        self.online_encoder_network = EncoderNetwork()
+        self.online_encoder_network = EncoderNetwork(checkpoint_granularity=model_backbone.get_checkpoint_granularity(config))
         self.online_projector_network = ProjectionNetwork(dimension, hidden_size, projection_size)
         self.online_predictor_network = PredictionNetwork(projection_size, hidden_size, projection_size)
 
@@ -103,6 +104,8 @@ class WaveBYOL(nn.Module):
         self.criterion = losses.byol_a_criterion
 
         self.output_representation = nn.AdaptiveAvgPool3d((1, 16, 4))
+        # 두 view를 batch 축으로 합쳐서 한번에 실행할지 여부
+        self.fused_view, self.per_view_batchnorm = model_fused_view.fused_view_options(config)
 
     def setup_target_network(self):
         self.get_pre_network()
@@ -128,7 +131,7 @@ class WaveBYOL(nn.Module):
         online_representation = online_representation.permute(0, 3, 2, 1)
         return online_representation
 
-    def forward(self, x01, x02):
+    def forward(self, x01, x02=None):
         # 먼저 target network 파라미터부터 따와서 생성
         if self.target_pre_network is None \
                 or self.target_encoder_network is None or self.target_projector_network is None:
@@ -136,6 +139,9 @@ class WaveBYOL(nn.Module):
             self.get_target_encoder()
             self.get_target_projector()
 
+        if self.fused_view or x02 is None:
+            return self.forward_fused_view(x01, x02)
+
         # online network 관련 코드부터 실행 (x01과 x02 모두)
         # input: (batch, frequency, timestep)
         # output: (batch, frequency, timestep)
@@ -201,6 +207,22 @@ class WaveBYOL(nn.Module):
         else:
             return online_representation01, online_representation02, target_representation01, target_representation02, loss.mean()
 
+    def forward_fused_view(self, x01, x02=None):
+        # x01, x02를 batch 축으로 이어 붙여서 각 network를 한번씩만 실행하고, loss 계산 직전에 다시 나눔
+        online_features, target_features, loss = model_fused_view.fused_view_forward(
+            self, x01, x02,
+            functools.partial(representation_path, self.online_pre_network, self.online_encoder_network,
+                              self.output_representation, self.online_projector_network),
+            functools.partial(representation_path, self.target_pre_network, self.target_encoder_network,
+                              self.output_representation, self.target_projector_network),
+            self.online_predictor_network)
+        online_x_pre, online_representation, online_representation_output = online_features
+        target_x_pre, target_representation, target_representation_output = target_features
+        if self.research:
+            return (*online_x_pre, *online_representation_output, *target_x_pre, *target_representation_output, loss)
+        else:
+            return (*online_representation, *target_representation, loss)
+
 
 if __name__ == '__main__':
     data = torch.rand(8, 1, 20480)
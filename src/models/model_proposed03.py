@@ -1,10 +1,18 @@
 import copy
-import os
+import functools
 import torch
 import torch.nn as nn
 import src.losses.criterion as losses
 import src.models.model_proposed02 as model_proposed02
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+import src.models.model_fused_view as model_fused_view
+
+
+def pre_network_path(pre_network, projector_network, x):
+    # fused view의 online / target path: (projection, (pre network 출력,))
+    x = pre_network(x)
+    B, D, T = x.shape
+    return projector_network(x.reshape((B, T * D))), (x,)
+
 
 class WaveBYOLTest01(nn.Module):
     def __init__(self, config, pre_input_dims, pre_hidden_dims, pre_filter_sizes, pre_strides, pre_paddings,
@@ -28,6 +36,8 @@ class WaveBYOLTest01(nn.Module):
 
         # 아직도 이 loss에 대해서 좀 분분인데 일단은 그냥 쓰기로 햇음
         self.criterion = losses.byol_a_criterion
+        # 두 view를 batch 축으로 합쳐서 한번에 실행할지 여부
+        self.fused_view, self.per_view_batchnorm = model_fused_view.fused_view_options(config)
 
     def setup_target_network(self):
         self.get_pre_network()
@@ -45,13 +55,16 @@ class WaveBYOLTest01(nn.Module):
         output = self.online_pre_network(x)
         return output
 
-    def forward(self, x01, x02):
+    def forward(self, x01, x02=None):
         # 먼저 target network 파라미터부터 따와서 생성
         if self.target_pre_network is None \
                 or self.target_projector_network is None:
             self.get_pre_network()
             self.get_target_projector()
 
+        if self.fused_view or x02 is None:
+            return self.forward_fused_view(x01, x02)
+
         # online network 관련 코드부터 실행 (x01과 x02 모두)
         # input: (batch, frequency, timestep)
         # output: (batch, frequency, timestep)
@@ -88,6 +101,16 @@ class WaveBYOLTest01(nn.Module):
         loss = loss01 + loss02
         return online_x01, online_x02, target_x01, target_x02, loss.mean()
 
+    def forward_fused_view(self, x01, x02=None):
+        # x01, x02를 batch 축으로 이어 붙여서 각 network를 한번씩만 실행하고, loss 계산 직전에 다시 나눔
+        online_features, target_features, loss = model_fused_view.fused_view_forward(
+            self, x01, x02,
+            functools.partial(pre_network_path, self.online_pre_network, self.online_projector_network),
+            functools.partial(pre_network_path, self.target_pre_network, self.target_projector_network),
+            self.online_predictor_network)
+        (online_x,), (target_x,) = online_features, target_features
+        return (*online_x, *target_x, loss)
+
 
 if __name__ == '__main__':
     test_model = WaveBYOLTest01(
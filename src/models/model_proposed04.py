@@ -1,36 +1,21 @@
 import copy
-import os
-import collections
+import functools
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
+import src.models.model_backbone as model_backbone
 import src.models.model_proposed02 as model_proposed02
-os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+import src.models.model_fused_view as model_fused_view
 
 
 class EncoderNetwork(nn.Module):
-    def __init__(self):
+    def __init__(self, checkpoint_granularity='none'):
         super(EncoderNetwork, self).__init__()
-        self.network = nn.Sequential(
-            collections.OrderedDict(
-                [
-                    ("feature_extract_layer01", nn.Conv2d(1, 3, kernel_size=1, stride=1)),  # it just 1*1 convolution
-                    ("feature_extract_layer02", torchvision.models.resnet152(pretrained=True).conv1),
-                    ("feature_extract_layer03", torchvision.models.resnet152(pretrained=True).bn1),
-                    ("feature_extract_layer04", torchvision.models.resnet152(pretrained=True).relu),
-                    ("feature_extract_layer05", torchvision.models.resnet152(pretrained=True).maxpool),
-                    ("feature_extract_layer06", torchvision.models.resnet152(pretrained=True).layer1),
-                    ("feature_extract_layer07", torchvision.models.resnet152(pretrained=True).layer2),
-                    ("feature_extract_layer08", torchvision.models.resnet152(pretrained=True).layer3),
-                    ("feature_extract_layer09", torchvision.models.resnet152(pretrained=True).layer4),
-
-                ]
-            )
-        )
+        self.checkpoint_granularity = checkpoint_granularity
+        self.network = model_backbone.resnet_encoder('resnet152', pretrained=True)
 
     def forward(self, x):
-        out = self.network(x)
+        out = model_backbone.sequential_features(self.network, x, self.checkpoint_granularity)
         return out
 
 
@@ -47,7 +32,7 @@ class WaveBYOLTest02(nn.Module):
             strides=pre_strides,
             paddings=pre_paddings,
         )
-        self.online_encoder_network = EncoderNetwork()
+        self.online_encoder_network = EncoderNetwork(checkpoint_granularity=model_backbone.get_checkpoint_granularity(config))
         self.online_projector_network = model_proposed02.ProjectionNetwork(dimension, hidden_size, projection_size)
         self.online_predictor_network = model_proposed02.PredictionNetwork(projection_size, hidden_size, projection_size)
 
@@ -59,6 +44,8 @@ class WaveBYOLTest02(nn.Module):
         # 아직도 이 loss에 대해서 좀 분분인데 일단은 그냥 쓰기로 햇음
         self.criterion = losses.byol_a_criterion
         self.output_representation = nn.AdaptiveAvgPool3d((1, 16, 4))
+        # 두 view를 batch 축으로 합쳐서 한번에 실행할지 여부
+        self.fused_view, self.per_view_batchnorm = model_fused_view.fused_view_options(config)
 
     def setup_target_network(self):
         self.get_pre_network()
@@ -83,7 +70,7 @@ class WaveBYOLTest02(nn.Module):
         online_representation = self.online_encoder_network(output)
         return online_representation
 
-    def forward(self, x01, x02):
+    def forward(self, x01, x02=None):
         # 먼저 target network 파라미터부터 따와서 생성
         if self.target_pre_network is None \
                 or self.target_encoder_network is None or self.target_projector_network is None:
@@ -91,6 +78,9 @@ class WaveBYOLTest02(nn.Module):
             self.get_target_encoder()
             self.get_target_projector()
 
+        if self.fused_view or x02 is None:
+            return self.forward_fused_view(x01, x02)
+
         # online network 관련 코드부터 실행 (x01과 x02 모두)
         # input: (batch, frequency, timestep)
         # output: (batch, frequency, timestep)
@@ -156,6 +146,23 @@ class WaveBYOLTest02(nn.Module):
         else:
             return online_representation01, online_representation02, target_representation01, target_representation02, loss.mean()
 
+    def forward_fused_view(self, x01, x02=None):
+        # x01, x02를 batch 축으로 이어 붙여서 각 network를 한번씩만 실행하고, loss 계산 직전에 다시 나눔
+        online_features, target_features, loss = model_fused_view.fused_view_forward(
+            self, x01, x02,
+            functools.partial(model_proposed02.representation_path, self.online_pre_network, self.online_encoder_network,
+                              self.output_representation, self.online_projector_network),
+            functools.partial(model_proposed02.representation_path, self.target_pre_network, self.target_encoder_network,
+                              self.output_representation, self.target_projector_network),
+            self.online_predictor_network)
+        online_x_pre, online_representation, online_representation_output = online_features
+        target_x_pre, target_representation, target_representation_output = target_features
+        if self.research:
+            return (*online_x_pre, *online_representation_output, *target_x_pre, *target_representation_output, loss)
+        else:
+            return (*online_representation, *target_representation, loss)
+
+
 
 if __name__ == '__main__':
     test_model = WaveBYOLTest02(
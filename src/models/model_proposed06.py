@@ -1,13 +1,11 @@
 import copy
-import os
 import collections
 import torch
 import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
+import src.models.model_backbone as model_backbone
 import src.models.model_proposed02 as model_proposed02
-from efficientnet_pytorch import EfficientNet
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
 
 
 class EncoderNetwork(nn.Module):
@@ -17,7 +15,7 @@ class EncoderNetwork(nn.Module):
             collections.OrderedDict(
                 [
                     ("feature_extract_layer01", nn.Conv2d(1, 3, kernel_size=1, stride=1)),  # it just 1*1 convolution
-                    ("mobilnet_v2_layer02", torchvision.models.mobilenet_v2(pretrained=True).features)
+                    ("mobilnet_v2_layer02", model_backbone.backbone_stage('mobilenet_v2', 'features', pretrained=True))
                 ]
             )
         )
@@ -1,14 +1,11 @@
 import torch
 import copy
-import os
 import torch.nn as nn
 import collections
-import torchvision
-from efficientnet_pytorch import EfficientNet
 import src.models.model_proposed02 as model_proposed02
 import src.models.model_proposed05 as model_proposed05
+import src.models.model_backbone as model_backbone
 import src.losses.criterion as losses
-os.environ['CUDA_VISIBLE_DEVICES'] = '2'
 
 
 class EfficientBYOL(nn.Module):
@@ -24,7 +21,8 @@ class EfficientBYOL(nn.Module):
             strides=pre_strides,
             paddings=pre_paddings,
         )
-        self.online_encoder_network = model_proposed05.EncoderNetwork()
+        self.online_encoder_network = model_proposed05.EncoderNetwork(
+            checkpoint_granularity=model_backbone.get_checkpoint_granularity(config))
         self.online_projector_network = model_proposed02.ProjectionNetwork(dimension, hidden_size, projection_size)
         self.online_predictor_network = model_proposed02.PredictionNetwork(projection_size, hidden_size, projection_size)
 
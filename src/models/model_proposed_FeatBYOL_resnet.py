@@ -1,11 +1,8 @@
 import copy
-import os
-import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
-os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+import src.models.model_backbone as model_backbone
 
 
 def set_requires_grad(model, requires):
@@ -79,77 +76,27 @@ class FeatureExtract(nn.Module):
         if resnet_version == "18":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.resnet18(pretrained=True).bn1,
-                    torchvision.models.resnet18(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.resnet18(pretrained=True).layer1,
-                    torchvision.models.resnet18(pretrained=True).layer2,
-                    torchvision.models.resnet18(pretrained=True).layer3,
-                    torchvision.models.resnet18(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('resnet18', pretrained=True)
             )
         elif resnet_version == "50":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.resnet50(pretrained=True).bn1,
-                    torchvision.models.resnet50(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.resnet50(pretrained=True).layer1,
-                    torchvision.models.resnet50(pretrained=True).layer2,
-                    torchvision.models.resnet50(pretrained=True).layer3,
-                    torchvision.models.resnet50(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('resnet50', pretrained=True)
             )
         elif resnet_version == "50_2":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.wide_resnet50_2(pretrained=True).bn1,
-                    torchvision.models.wide_resnet50_2(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer1,
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer2,
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer3,
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('wide_resnet50_2', pretrained=True)
             )
         elif resnet_version == "101_2":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.wide_resnet101_2(pretrained=True).bn1,
-                    torchvision.models.wide_resnet101_2(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer1,
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer2,
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer3,
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('wide_resnet101_2', pretrained=True)
             )
         elif resnet_version == "152":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.resnet152(pretrained=False).bn1,
-                    torchvision.models.resnet152(pretrained=False).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.resnet152(pretrained=False).layer1,
-                    torchvision.models.resnet152(pretrained=False).layer2,
-                    torchvision.models.resnet152(pretrained=False).layer3,
-                    torchvision.models.resnet152(pretrained=False).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('resnet152', pretrained=False)
             )
 
     def forward(self, x):
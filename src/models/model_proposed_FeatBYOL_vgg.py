@@ -1,11 +1,8 @@
 import copy
-import os
-import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
-os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+import src.models.model_backbone as model_backbone
 
 
 def set_requires_grad(model, requires):
@@ -80,14 +77,14 @@ class FeatureExtract(nn.Module):
             self.encoder02.add_module(
                 "resnet_encoder_layer",
                 nn.Sequential(
-                    torchvision.models.vgg16_bn(pretrained=True).features
+                    model_backbone.backbone_stage('vgg16_bn', 'features', pretrained=True)
                 )
             )
         elif vgg_version == "19":
             self.encoder02.add_module(
                 "vgg_encoder_layer",
                 nn.Sequential(
-                    torchvision.models.vgg19_bn(pretrained=True).features
+                    model_backbone.backbone_stage('vgg19_bn', 'features', pretrained=True)
                 )
             )
 
@@ -1,18 +1,18 @@
 import copy
-import os
+import functools
 import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
+import src.models.model_backbone as model_backbone
 import src.models.model_proposed02 as model_proposed02
-from efficientnet_pytorch import EfficientNet
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+import src.models.model_fused_view as model_fused_view
 
 
 class EncoderNetwork(nn.Module):
-    def __init__(self, efficientnet_model_name='efficientnet-b4'):
+    def __init__(self, efficientnet_model_name='efficientnet-b4', checkpoint_granularity='none'):
         super(EncoderNetwork, self).__init__()
+        self.checkpoint_granularity = checkpoint_granularity
         self.network = nn.Sequential(
             collections.OrderedDict(
                 [
@@ -20,11 +20,11 @@ class EncoderNetwork(nn.Module):
                 ]
             )
         )
-        self.efficient_network = EfficientNet.from_pretrained(efficientnet_model_name)
+        self.efficient_network = model_backbone.build_backbone(efficientnet_model_name, pretrained=True)
 
     def forward(self, x):
         out = self.network(x)
-        out = self.efficient_network.extract_features(out)
+        out = model_backbone.efficientnet_features(self.efficient_network, out, self.checkpoint_granularity)
         return out
 
 
@@ -40,7 +40,8 @@ class WaveBYOLEfficient(nn.Module):
             strides=pre_strides,
             paddings=pre_paddings,
         )
-        self.online_encoder_network = EncoderNetwork(efficientnet_model_name=efficientnet_model_name)
+        self.online_encoder_network = EncoderNetwork(efficientnet_model_name=efficientnet_model_name,
+                                                     checkpoint_granularity=model_backbone.get_checkpoint_granularity(config))
         self.online_projector_network = model_proposed02.ProjectionNetwork(dimension, hidden_size, projection_size)
         self.online_predictor_network = model_proposed02.PredictionNetwork(projection_size, hidden_size, projection_size)
 
@@ -52,6 +53,8 @@ class WaveBYOLEfficient(nn.Module):
         # 아직도 이 loss에 대해서 좀 분분인데 일단은 그냥 쓰기로 햇음
         self.criterion = losses.byol_a_criterion
         self.output_representation = nn.AdaptiveAvgPool3d((1, 16, 4))
+        # 두 view를 batch 축으로 합쳐서 한번에 실행할지 여부
+        self.fused_view, self.per_view_batchnorm = model_fused_view.fused_view_options(config)
 
     def setup_target_network(self):
         self.get_pre_network()
@@ -91,7 +94,7 @@ class WaveBYOLEfficient(nn.Module):
         return online_projection, (output_line, online_representation_permute)
 
 
-    def forward(self, x01, x02):
+    def forward(self, x01, x02=None):
         # 먼저 target network 파라미터부터 따와서 생성
         if self.target_pre_network is None \
                 or self.target_encoder_network is None or self.target_projector_network is None:
@@ -99,6 +102,9 @@ class WaveBYOLEfficient(nn.Module):
             self.get_target_encoder()
             self.get_target_projector()
 
+        if self.fused_view or x02 is None:
+            return self.forward_fused_view(x01, x02)
+
         # online network 관련 코드부터 실행 (x01과 x02 모두)
         # input: (batch, frequency, timestep)
         # output: (batch, frequency, timestep)
@@ -166,6 +172,23 @@ class WaveBYOLEfficient(nn.Module):
         target_representation = [(target_x01_pre, target_x02_pre,), (target_representation01_output, target_representation02_output,)]
         return online_representation, target_representation, loss.mean()
 
+    def forward_fused_view(self, x01, x02=None):
+        # x01, x02를 batch 축으로 이어 붙여서 각 network를 한번씩만 실행하고, loss 계산 직전에 다시 나눔
+        online_features, target_features, loss = model_fused_view.fused_view_forward(
+            self, x01, x02,
+            functools.partial(model_proposed02.representation_path, self.online_pre_network,
+                              self.online_encoder_network, self.output_representation, self.online_projector_network,
+                              pooled_projection=True),
+            functools.partial(model_proposed02.representation_path, self.target_pre_network,
+                              self.target_encoder_network, self.output_representation, self.target_projector_network,
+                              pooled_projection=True),
+            self.online_predictor_network)
+        online_x_pre, _, online_representation_output = online_features
+        target_x_pre, _, target_representation_output = target_features
+        online_representation = [online_x_pre, online_representation_output]
+        target_representation = [target_x_pre, target_representation_output]
+        return online_representation, target_representation, loss
+
 
 if __name__ == '__main__':
     model_type = 'b4'
@@ -1,11 +1,8 @@
 import copy
-import os
 import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
 
 
 def set_requires_grad(model, requires):
@@ -1,12 +1,8 @@
 import copy
-import os
-import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
-from efficientnet_pytorch import EfficientNet
-os.environ['CUDA_VISIBLE_DEVICES'] = '2'
+import src.models.model_backbone as model_backbone
 
 
 def set_requires_grad(model, requires):
@@ -41,8 +37,9 @@ class PostNetwork(nn.Module):
 
 
 class Encoder(nn.Module):
-    def __init__(self, input_dim, hidden_dim, stride, filter_size, padding, efficientnet_version):
+    def __init__(self, input_dim, hidden_dim, stride, filter_size, padding, efficientnet_version, checkpoint_granularity='none'):
         super(Encoder, self).__init__()
+        self.checkpoint_granularity = checkpoint_granularity
         assert(
                 len(stride) == len(filter_size) == len(padding)
         ), "Inconsistent length of strides, filter sizes and padding"
@@ -62,7 +59,7 @@ class Encoder(nn.Module):
         self.encoder02.add_module("post_encoder",
                                   nn.Sequential(nn.Conv2d(1, 3, kernel_size=2, stride=1, padding=1)))
 
-        self.efficient_network = EfficientNet.from_pretrained("efficientnet-{}".format(efficientnet_version))
+        self.efficient_network = model_backbone.build_backbone("efficientnet-{}".format(efficientnet_version), pretrained=True)
 
 
     def forward(self, x):
@@ -70,7 +67,7 @@ class Encoder(nn.Module):
         out = torch.transpose(out, 1, 2)
         out = out.unsqueeze(1)
         out = self.encoder02(out)
-        out = self.efficient_network.extract_features(out)
+        out = model_backbone.efficientnet_features(self.efficient_network, out, self.checkpoint_granularity)
         return out
 
 
@@ -85,7 +82,8 @@ class WaveBYOL(nn.Module):
             filter_size=encoder_filter_size,
             stride=encoder_stride,
             padding=encoder_padding,
-            efficientnet_version=efficientnet_version
+            efficientnet_version=efficientnet_version,
+            checkpoint_granularity=model_backbone.get_checkpoint_granularity(config)
         )
         self.online_post_network = PostNetwork()
         self.online_projector_network = MLPNetwork(mlp_input_dim, mlp_hidden_dim, mlp_output_dim)
@@ -1,11 +1,8 @@
 import copy
-import os
-import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+import src.models.model_backbone as model_backbone
 
 
 def set_requires_grad(model, requires):
@@ -40,8 +37,9 @@ class PostNetwork(nn.Module):
 
 
 class Encoder(nn.Module):
-    def __init__(self, input_dim, hidden_dim, stride, filter_size, padding, resnet_version):
+    def __init__(self, input_dim, hidden_dim, stride, filter_size, padding, resnet_version, checkpoint_granularity='none'):
         super(Encoder, self).__init__()
+        self.checkpoint_granularity = checkpoint_granularity
         assert(
                 len(stride) == len(filter_size) == len(padding)
         ), "Inconsistent length of strides, filter sizes and padding"
@@ -61,84 +59,34 @@ class Encoder(nn.Module):
         if resnet_version == "18":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.resnet18(pretrained=True).bn1,
-                    torchvision.models.resnet18(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.resnet18(pretrained=True).layer1,
-                    torchvision.models.resnet18(pretrained=True).layer2,
-                    torchvision.models.resnet18(pretrained=True).layer3,
-                    torchvision.models.resnet18(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('resnet18', pretrained=True)
             )
         elif resnet_version == "50":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.resnet50(pretrained=True).bn1,
-                    torchvision.models.resnet50(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.resnet50(pretrained=True).layer1,
-                    torchvision.models.resnet50(pretrained=True).layer2,
-                    torchvision.models.resnet50(pretrained=True).layer3,
-                    torchvision.models.resnet50(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('resnet50', pretrained=True)
             )
         elif resnet_version == "50_2":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.wide_resnet50_2(pretrained=True).bn1,
-                    torchvision.models.wide_resnet50_2(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer1,
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer2,
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer3,
-                    torchvision.models.wide_resnet50_2(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('wide_resnet50_2', pretrained=True)
             )
         elif resnet_version == "101_2":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.wide_resnet101_2(pretrained=True).bn1,
-                    torchvision.models.wide_resnet101_2(pretrained=True).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer1,
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer2,
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer3,
-                    torchvision.models.wide_resnet101_2(pretrained=True).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('wide_resnet101_2', pretrained=True)
             )
         elif resnet_version == "152":
             self.encoder02.add_module(
                 "resnet_encoder_layer",
-                nn.Sequential(
-                    # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
-                    nn.Conv2d(1, 64, kernel_size=7, stride=2, padding=3),
-                    torchvision.models.resnet152(pretrained=False).bn1,
-                    torchvision.models.resnet152(pretrained=False).relu,
-                    # maxpool layer는 사용하지 않고 작업을 해보려고 함.
-                    torchvision.models.resnet152(pretrained=False).layer1,
-                    torchvision.models.resnet152(pretrained=False).layer2,
-                    torchvision.models.resnet152(pretrained=False).layer3,
-                    torchvision.models.resnet152(pretrained=False).layer4
-                )
+                model_backbone.resnet_single_channel_encoder('resnet152', pretrained=False)
             )
 
     def forward(self, x):
         out = self.encoder01(x)
         out = torch.transpose(out, 1, 2)
         out = out.unsqueeze(1)
-        out = self.encoder02(out)
+        out = model_backbone.sequential_features(self.encoder02, out, self.checkpoint_granularity)
         return out
 
 
@@ -153,7 +101,8 @@ class WaveBYOL(nn.Module):
             filter_size=encoder_filter_size,
             stride=encoder_stride,
             padding=encoder_padding,
-            resnet_version=resnet_version
+            resnet_version=resnet_version,
+            checkpoint_granularity=model_backbone.get_checkpoint_granularity(config)
         )
         self.online_post_network = PostNetwork()
         self.online_projector_network = MLPNetwork(mlp_input_dim, mlp_hidden_dim, mlp_output_dim)
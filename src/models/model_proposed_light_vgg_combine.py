@@ -1,11 +1,8 @@
 import copy
-import os
-import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+import src.models.model_backbone as model_backbone
 
 
 def set_requires_grad(model, requires):
@@ -40,8 +37,9 @@ class PostNetwork(nn.Module):
 
 
 class Encoder(nn.Module):
-    def __init__(self, input_dim, hidden_dim, stride, filter_size, padding, vgg_version):
+    def __init__(self, input_dim, hidden_dim, stride, filter_size, padding, vgg_version, checkpoint_granularity='none'):
         super(Encoder, self).__init__()
+        self.checkpoint_granularity = checkpoint_granularity
         assert(
                 len(stride) == len(filter_size) == len(padding)
         ), "Inconsistent length of strides, filter sizes and padding"
@@ -64,7 +62,7 @@ class Encoder(nn.Module):
                 nn.Sequential(
                     # 원래 resnet은 3 to 64 인데, 여기서는 1채널부터 시작하기 때문에 1 to 64로
                     nn.Conv2d(1, 3, kernel_size=1, stride=1, padding=1),
-                    torchvision.models.vgg16_bn(pretrained=True).features
+                    model_backbone.backbone_stage('vgg16_bn', 'features', pretrained=True)
                 )
             )
 
@@ -72,7 +70,7 @@ class Encoder(nn.Module):
         out = self.encoder01(x)
         out = torch.transpose(out, 1, 2)
         out = out.unsqueeze(1)
-        out = self.encoder02(out)
+        out = model_backbone.sequential_features(self.encoder02, out, self.checkpoint_granularity)
         return out
 
 
@@ -87,7 +85,8 @@ class WaveBYOL(nn.Module):
             filter_size=encoder_filter_size,
             stride=encoder_stride,
             padding=encoder_padding,
-            vgg_version=vgg_version
+            vgg_version=vgg_version,
+            checkpoint_granularity=model_backbone.get_checkpoint_granularity(config)
         )
         self.online_post_network = PostNetwork()
         self.online_projector_network = MLPNetwork(mlp_input_dim, mlp_hidden_dim, mlp_output_dim)
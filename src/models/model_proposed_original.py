@@ -1,13 +1,9 @@
 import copy
-import os
 import collections
 import torch
-import torchvision
 import torch.nn as nn
 import src.losses.criterion as losses
 import src.models.model_proposed02 as model_proposed02
-from efficientnet_pytorch import EfficientNet
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
 
 
 class WaveBYOL(nn.Module):
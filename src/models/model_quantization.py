@@ -0,0 +1,113 @@
+import io
+import copy
+import torch
+import torch.nn as nn
+import src.models.model_cpc as model_cpc
+import src.models.model_inference as inference_pack
+
+
+# post-training quantization (CPU inference 전용)
+# Linear (projector, downstream classifier): dynamic int8, weight만 미리 int8로 두고 activation은 실행 때 quantize
+# Conv1d + ReLU (WaveBYOL PreNetwork = CPC Encoder): static int8, calibration 입력으로 activation scale을 정함
+QUANTIZED_ENGINES = ['x86', 'fbgemm', 'qnnpack']
+
+
+def get_quantized_engine():
+    for engine in QUANTIZED_ENGINES:
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError("No quantized engine in {}".format(torch.backends.quantized.supported_engines))
+
+
+class StaticQuantizedModule(nn.Module):
+    # float 입력 -> quantize -> int8 module -> dequantize (앞뒤 module은 float 그대로)
+    def __init__(self, module):
+        super(StaticQuantizedModule, self).__init__()
+        self.quant = torch.ao.quantization.QuantStub()
+        self.module = module
+        self.dequant = torch.ao.quantization.DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.module(self.quant(x)))
+
+
+def static_conv_encoders(model):
+    return [module for module in model.modules() if isinstance(module, model_cpc.Encoder)]
+
+
+def prepare_static_conv(model, engine):
+    # Conv1d + ReLU를 fuse 하고 observer를 붙임 (이후 calibration 입력을 forward 해야 함)
+    for encoder in static_conv_encoders(model):
+        for block in encoder.encoder:
+            torch.ao.quantization.fuse_modules(block, [['0', '1']], inplace=True)
+        encoder.encoder = StaticQuantizedModule(encoder.encoder)
+        encoder.encoder.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+        torch.ao.quantization.prepare(encoder.encoder, inplace=True)
+    return model
+
+
+def convert_static_conv(model):
+    for encoder in static_conv_encoders(model):
+        torch.ao.quantization.convert(encoder.encoder, inplace=True)
+    return model
+
+
+def quantize_dynamic_linear(model):
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def quantize_models(pretext_model, downstream_model, method='get_projection', static_conv=False,
+                    calibration_inputs=(), engine=None):
+    # pretext model은 online branch만 복사해서 quantize (학습용 model은 그대로), 둘 다 CPU float32 기준
+    engine = get_quantized_engine() if engine is None else engine
+    torch.backends.quantized.engine = engine
+    branch = copy.deepcopy(inference_pack.OnlineBranch(pretext_model, method=method)).float().cpu().eval()
+    if static_conv:
+        prepare_static_conv(branch, engine)
+        with torch.no_grad():
+            for x in calibration_inputs:
+                getattr(branch, method)(x.float().cpu())
+        convert_static_conv(branch)
+    quantize_dynamic_linear(branch)
+    downstream_model = quantize_dynamic_linear(copy.deepcopy(downstream_model).float().cpu().eval())
+    metadata = {'method': method, 'static_conv': static_conv, 'engine': engine}
+    return branch, downstream_model, metadata
+
+
+def save_quantized_checkpoint(path, branch, downstream_model, metadata):
+    torch.save({
+        'pretext_state_dict': branch.state_dict(),
+        'downstream_state_dict': downstream_model.state_dict(),
+        'quantization': metadata,
+    }, path)
+
+
+def load_quantized_checkpoint(config, path):
+    # float model 구조를 만들고 같은 quantization을 적용한 뒤 (calibration 없이) quantized weight / scale을 읽음
+    import warnings
+    import src.models.model as model_pack
+    import src.models.model_backbone as model_backbone
+    checkpoint = torch.load(path, map_location=torch.device('cpu'))
+    metadata = checkpoint['quantization']
+    with model_backbone.without_pretrained_weights():
+        pretext_model = model_pack.load_model(config, config['pretext_model_name'])
+    downstream_model = model_pack.load_model(config, config['downstream_model_name'])
+    with warnings.catch_warnings():
+        # calibration 없이 convert 하면 observer 경고가 나옴 (scale은 바로 checkpoint 값으로 덮어씀)
+        warnings.simplefilter('ignore')
+        branch, downstream_model, _ = quantize_models(pretext_model, downstream_model, **metadata)
+    branch.load_state_dict(checkpoint['pretext_state_dict'])
+    downstream_model.load_state_dict(checkpoint['downstream_state_dict'])
+    return branch, downstream_model, metadata
+
+
+def state_dict_size(*modules):
+    # 직렬화된 state_dict 크기 (MB)
+    buffer = io.BytesIO()
+    torch.save([module.state_dict() for module in modules], buffer)
+    return buffer.tell() / 2 ** 20
+
+
+def predict(branch, downstream_model, x, method):
+    with torch.no_grad():
+        return downstream_model(inference_pack.downstream_features(getattr(branch, method)(x), method))
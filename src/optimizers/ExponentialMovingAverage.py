@@ -1,3 +1,8 @@
+import math
+import collections
+import torch
+
+
 class EMA():
     def __init__(self, beta):
         super(EMA, self).__init__()
@@ -12,5 +17,249 @@ class EMA():
 
 def update_moving_average(ema_updater, moving_average_model, current_model):
     for current_params, moving_average_params in zip(current_model.parameters(), moving_average_model.parameters()):
-        old_weight, update_weight = moving_average_params.data, current_params.data
-        moving_average_params.data = ema_updater.update_average(old_weight, update_weight)
+        # old * beta + (1 - beta) * new 를 새 tensor 할당 없이 in-place로 계산
+        moving_average_params.data.lerp_(current_params.data, 1 - ema_updater.beta)
+
+
+def cosine_tau(base_tau, step, total_steps):
+    # BYOL: tau_k = 1 - (1 - tau_base) * (cos(pi * k / K) + 1) / 2
+    return 1 - (1 - base_tau) * (math.cos(math.pi * min(step, total_steps) / total_steps) + 1) / 2
+
+
+def find_ema_pairs(model):
+    # 이름 규칙으로 (moving average, source) 쌍을 찾음: target_X <- online_X, modest_X <- target_X (순서대로 갱신)
+    children = dict(model.named_children())
+    pairs = []
+    for prefix, source_prefix in [('target_', 'online_'), ('modest_', 'target_')]:
+        for name, module in children.items():
+            source_name = source_prefix + name[len(prefix):]
+            if name.startswith(prefix) and source_name in children:
+                pairs.append((name, source_name))
+    return pairs
+
+
+def flatten_parameters(module, storage_dtype=None):
+    # module의 parameter들을 (device, dtype) 별 연속 flat buffer 하나로 모으고, 각 parameter는 그 buffer의 view가 됨
+    # storage_dtype이 주어지면 flat buffer를 그 dtype으로 저장 (no-grad target 전용)
+    groups = collections.OrderedDict()
+    for parameter in module.parameters():
+        groups.setdefault((parameter.device, parameter.dtype), []).append(parameter)
+    flats = []
+    for (device, dtype), parameters in groups.items():
+        dtype = dtype if storage_dtype is None else storage_dtype
+        flat = torch.empty(sum(parameter.numel() for parameter in parameters), device=device, dtype=dtype)
+        offset = 0
+        for parameter in parameters:
+            numel = parameter.numel()
+            flat[offset:offset + numel].copy_(parameter.data.reshape(-1))
+            parameter.data = flat[offset:offset + numel].view_as(parameter)
+            offset += numel
+        flats.append(flat)
+    return flats
+
+
+def stochastic_round_to_bfloat16(x):
+    # float32 -> bfloat16: 버려지는 하위 16 bit에 uniform noise를 더한 뒤 자름 (기댓값이 x와 같음)
+    bits = x.view(torch.int32)
+    noise = torch.randint_like(bits, 0, 1 << 16)
+    return ((bits + noise) & -65536).view(torch.float32).to(torch.bfloat16)
+
+
+class LowPrecisionStorage:
+    """Holds the parameters of a no-grad module as one bf16/fp16 flat buffer.
+
+    A forward pre-hook upcasts the flat buffer to float32 and points the parameters at the copy; the forward hook
+    points them back at the low precision views, so the float32 copy only lives during the forward pass.
+    """
+
+    def __init__(self, module, storage_dtype):
+        self.parameters = [parameter for parameter in module.parameters()]
+        self.original_dtypes = [parameter.dtype for parameter in self.parameters]
+        self.flats = flatten_parameters(module, storage_dtype=storage_dtype)
+        self.views = [parameter.data for parameter in self.parameters]
+        flat_index = {flat.data_ptr(): index for index, flat in enumerate(self.flats)}
+        self.locations = [(flat_index[view.untyped_storage().data_ptr()], view.storage_offset())
+                          for view in self.views]
+        module.register_forward_pre_hook(self.upcast)
+        module.register_forward_hook(self.restore)
+
+    def upcast(self, module, inputs):
+        flats = [flat.float() for flat in self.flats]
+        for parameter, dtype, (index, offset) in zip(self.parameters, self.original_dtypes, self.locations):
+            parameter.data = flats[index][offset:offset + parameter.numel()].view(parameter.shape).to(dtype)
+
+    def restore(self, module, inputs, output):
+        for parameter, view in zip(self.parameters, self.views):
+            parameter.data = view
+
+    def memory_report(self):
+        # (float32 bytes, stored bytes)
+        numel = sum(flat.numel() for flat in self.flats)
+        return numel * 4, sum(flat.numel() * flat.element_size() for flat in self.flats)
+
+
+def foreach_lerp_(targets, sources, weight):
+    if hasattr(torch, '_foreach_lerp_'):
+        torch._foreach_lerp_(targets, sources, weight)
+    else:
+        for target, source in zip(targets, sources):
+            target.lerp_(source, weight)
+
+
+def foreach_copy_(targets, sources):
+    if hasattr(torch, '_foreach_copy_'):
+        torch._foreach_copy_(targets, sources)
+    else:
+        for target, source in zip(targets, sources):
+            target.copy_(source)
+
+
+class TargetEMA:
+    """Multi-tensor in-place EMA update of the target (and modest) networks.
+
+    The networks are paired by name (`target_X` <- `online_X`, `modest_X` <- `target_X`) and their parameters are
+    moved into flat contiguous buffers, so one update is a single lerp per buffer instead of a python loop that
+    allocates a new tensor per parameter. The pairs are built on the first update because the models create their
+    target networks lazily in the first forward; build after `.cuda()` since moving the model replaces the views.
+
+    Args:
+        base_tau: EMA decay (`ema_decay`).
+        total_steps: Number of updates of the whole training, used by the cosine schedule.
+        schedule: 'constant' or 'cosine' (tau goes from base_tau to 1).
+        per_step: Update after every optimizer step instead of once per epoch.
+        sync_buffers: Copy the online buffers (BatchNorm running stats) into the target after each update.
+        storage_dtype: Keep the target/modest parameters as torch.bfloat16 or torch.float16 flat buffers
+            (None: keep their dtype). The EMA itself is computed in float32.
+        stochastic_rounding: Stochastically round the float32 EMA result into bfloat16 storage, otherwise updates
+            smaller than half a bf16 ulp are lost. float16 storage always rounds to nearest.
+    """
+
+    def __init__(self, base_tau, total_steps, schedule='constant', per_step=False, sync_buffers=False,
+                 storage_dtype=None, stochastic_rounding=True):
+        assert (schedule in ['constant', 'cosine']), "Unknown EMA schedule: {}".format(schedule)
+        assert (storage_dtype in [None, torch.float32, torch.bfloat16, torch.float16]), \
+            "Unsupported target storage dtype: {}".format(storage_dtype)
+        self.base_tau = base_tau
+        self.total_steps = max(total_steps, 1)
+        self.schedule = schedule
+        self.per_step = per_step
+        self.sync_buffers = sync_buffers
+        self.storage_dtype = None if storage_dtype == torch.float32 else storage_dtype
+        self.stochastic_rounding = stochastic_rounding
+        self.step_count = 0
+        self.pairs = None
+        self.storages = {}
+
+    def tau(self):
+        if self.schedule == 'cosine':
+            return cosine_tau(self.base_tau, self.step_count, self.total_steps)
+        return self.base_tau
+
+    def build(self, model):
+        flats = {}
+        self.pairs = []
+        for name, source_name in find_ema_pairs(model):
+            for module_name in [name, source_name]:
+                if module_name in flats:
+                    continue
+                if self.storage_dtype is not None and not module_name.startswith('online_'):
+                    self.storages[module_name] = LowPrecisionStorage(getattr(model, module_name), self.storage_dtype)
+                    flats[module_name] = self.storages[module_name].flats
+                else:
+                    flats[module_name] = flatten_parameters(getattr(model, module_name))
+            for flat, source_flat in zip(flats[name], flats[source_name]):
+                assert (flat.shape == source_flat.shape), "{} and {} do not match".format(name, source_name)
+            buffers = [buffer for buffer in getattr(model, name).buffers()]
+            source_buffers = [buffer for buffer in getattr(model, source_name).buffers()]
+            self.pairs.append((flats[name], flats[source_name], buffers, source_buffers))
+
+    @torch.no_grad()
+    def update(self, model):
+        if self.pairs is None:
+            self.build(model)
+        weight = 1 - self.tau()
+        # pair 순서대로 갱신 (modest는 갱신된 target을 따라감)
+        for flats, source_flats, buffers, source_buffers in self.pairs:
+            if self.storage_dtype is None:
+                foreach_lerp_(flats, source_flats, weight)
+            else:
+                for flat, source_flat in zip(flats, source_flats):
+                    self.lerp_low_precision_(flat, source_flat, weight)
+            if self.sync_buffers and len(buffers) > 0:
+                foreach_copy_(buffers, source_buffers)
+        self.step_count += 1
+
+    def lerp_low_precision_(self, flat, source_flat, weight):
+        value = flat.float().lerp_(source_flat.float(), weight)
+        if self.stochastic_rounding and flat.dtype == torch.bfloat16:
+            value = stochastic_round_to_bfloat16(value)
+        flat.copy_(value)
+
+    def memory_report(self):
+        # module name -> (float32 MB, stored MB, saved MB)
+        report = {}
+        for name, storage in self.storages.items():
+            full_bytes, stored_bytes = storage.memory_report()
+            report[name] = (full_bytes / 2 ** 20, stored_bytes / 2 ** 20, (full_bytes - stored_bytes) / 2 ** 20)
+        return report
+
+    def on_step(self, model):
+        # target network는 첫 forward에서 생성되므로 첫 step 이후에 build (low precision 저장도 여기서 시작)
+        if self.pairs is None:
+            self.build(model)
+        if self.per_step:
+            self.update(model)
+
+    def on_epoch(self, model):
+        if not self.per_step:
+            self.update(model)
+
+
+def get_target_ema(config, steps_per_epoch):
+    per_step = config.get('ema_update', 'epoch') == 'step'
+    total_steps = config['epoch'] * steps_per_epoch if per_step else config['epoch']
+    return TargetEMA(
+        base_tau=config['ema_decay'],
+        total_steps=total_steps,
+        schedule=config.get('ema_schedule', 'constant'),
+        per_step=per_step,
+        sync_buffers=config.get('ema_sync_buffers', False),
+        storage_dtype=getattr(torch, config.get('target_storage_dtype', 'float32')),
+        stochastic_rounding=config.get('ema_stochastic_rounding', True),
+    )
+
+
+
+if __name__ == '__main__':
+    # float32 target 대비 low precision target의 EMA 오차 (online은 optimizer step처럼 조금씩 움직이는 random walk)
+    num_steps, base_tau, step_size = 2000, 0.996, 1e-4
+    modes = [('float32', None, False), ('bfloat16-stochastic', torch.bfloat16, True),
+             ('bfloat16-nearest', torch.bfloat16, False), ('float16', torch.float16, False)]
+    models = []
+    for mode, storage_dtype, stochastic_rounding in modes:
+        torch.manual_seed(0)
+        model = torch.nn.Module()
+        model.online_network = torch.nn.Linear(1024, 1024)
+        model.target_network = torch.nn.Linear(1024, 1024)
+        model.target_network.load_state_dict(model.online_network.state_dict())
+        target_ema = TargetEMA(base_tau, num_steps, per_step=True, storage_dtype=storage_dtype,
+                               stochastic_rounding=stochastic_rounding)
+        target_ema.build(model)
+        models.append((mode, model, target_ema))
+
+    for step in range(num_steps):
+        noise = [torch.randn_like(parameter) * step_size for parameter in models[0][1].online_network.parameters()]
+        for mode, model, target_ema in models:
+            with torch.no_grad():
+                for parameter, delta in zip(model.online_network.parameters(), noise):
+                    parameter.add_(delta)
+            target_ema.on_step(model)
+
+    reference = torch.cat([parameter.float().reshape(-1) for parameter in models[0][1].target_network.parameters()])
+    moved = (reference - torch.cat([parameter.reshape(-1) for parameter in models[0][1].online_network.parameters()])).norm()
+    for mode, model, target_ema in models:
+        target = torch.cat([parameter.float().reshape(-1) for parameter in model.target_network.parameters()])
+        print("{:>20s} | max abs error: {:.3e} | relative error: {:.3e} | saved MB: {}".format(
+            mode, (target - reference).abs().max().item(), ((target - reference).norm() / reference.norm()).item(),
+            {name: round(saved, 2) for name, (_, _, saved) in target_ema.memory_report().items()}))
+    print("online - target distance (float32): {:.3e}".format(moved.item()))
@@ -1,4 +1,3 @@
-import augment
 import torch
 import numpy as np
 import torch.nn as nn
@@ -9,6 +8,12 @@ import torchaudio.functional as AF
 import src.utils.interface_file_io as file_io
 import src.utils.interface_audio_io as audio_io
 import random
+import math
+import json
+import multiprocessing
+from fractions import Fraction
+import src.utils.interface_lazy_import as lazy_import
+augment = lazy_import.lazy_import('augment')
 
 
 def audio_additive_noise(x, sr, audio_window=20480, datalist_path="./dataset/musan-total.txt"):
@@ -45,7 +50,7 @@ def audio_reverb(x, sr, reverb_size=100, audio_window=None):
     return y
 
 
-def audio_pitch_shift(x, sr, shift_size=500, audio_window=None):
+def audio_pitch_shift_sox(x, sr, shift_size=500, audio_window=None):
     random_pitch_shift = lambda: np.random.randint(-shift_size, +shift_size)
     combination = augment.EffectChain().pitch("-q", random_pitch_shift).rate(sr)
     y = combination.apply(x, src_info={'rate': sr}, target_info={'rate': sr})
@@ -58,7 +63,7 @@ def audio_clipping_audio(x, sr, clipping_rate=0.25, audio_window=None):
     return y
 
 
-def audio_speed(x, sr, audio_window=None, rate=None):
+def audio_speed_sox(x, sr, audio_window=None, rate=None):
     if rate is not None:
         effects = [['speed', str(rate)]]
     else:
@@ -69,7 +74,153 @@ def audio_speed(x, sr, audio_window=None, rate=None):
     return waveform
 
 
-def audio_augmentation_pipeline(x, sr, audio_window, pick_augmentation,fix_audio_length=True):
+def get_sinc_resample_kernel(orig_freq, new_freq, lowpass_filter_width=6, rolloff=0.99):
+    # windowed sinc polyphase filter bank, the same construction as torchaudio.functional.resample
+    # kernel: (new_freq, 1, 2 * width + orig_freq)
+    base_freq = min(orig_freq, new_freq) * rolloff
+    width = math.ceil(lowpass_filter_width * orig_freq / base_freq)
+    index = torch.arange(-width, width + orig_freq, dtype=torch.float64)[None, None] / orig_freq
+    t = torch.arange(0, -new_freq, -1, dtype=torch.float64)[:, None, None] / new_freq + index
+    t = (t * base_freq).clamp(-lowpass_filter_width, lowpass_filter_width)
+    window = torch.cos(t * math.pi / lowpass_filter_width / 2) ** 2
+    t = t * math.pi
+    kernel = torch.where(t == 0, torch.ones_like(t), t.sin() / t) * window * base_freq / orig_freq
+    return kernel, width
+
+
+class SpeedPerturbation(nn.Module):
+    """Speed perturbation (sox `speed`) by polyphase resampling.
+
+    The filter bank of every rate is computed once and cached, so perturbation is a single strided conv1d.
+
+    Args:
+        rates: Discrete speed rates picked at random.
+        max_denominator: Bound of the rational approximation orig/new of each rate, which bounds the filter size.
+    """
+
+    def __init__(self, rates=(0.95, 0.93, 0.9, 0.85, 0.83, 0.8, 0.75), max_denominator=100):
+        super().__init__()
+        self.rates = rates
+        self.max_denominator = max_denominator
+        self.kernels = {}
+
+    def get_kernel(self, rate, dtype, device):
+        key = (rate, dtype, device)
+        if key not in self.kernels:
+            fraction = Fraction(rate).limit_denominator(self.max_denominator)
+            kernel, width = get_sinc_resample_kernel(fraction.numerator, fraction.denominator)
+            self.kernels[key] = (fraction.numerator, fraction.denominator, kernel.to(device, dtype), width)
+        return self.kernels[key]
+
+    def resample(self, x, rate):
+        # x: (..., length) -> (..., length / rate)
+        orig_freq, new_freq, kernel, width = self.get_kernel(rate, x.dtype, x.device)
+        shape, length = x.shape[:-1], x.shape[-1]
+        x = F.pad(x.reshape(-1, 1, length), (width, width + orig_freq))
+        y = F.conv1d(x, kernel, stride=orig_freq)  # (batch, new_freq, frames)
+        y = y.transpose(1, 2).reshape(*shape, -1)
+        return y[..., :math.ceil(new_freq * length / orig_freq)]
+
+    def forward(self, x, rate=None):
+        if rate is None:
+            rate = random.choice(self.rates)
+        return self.resample(x, rate)
+
+    def forward_batch(self, x, audio_window):
+        # x: (batch, channel, length) -> (batch, channel, audio_window), with a random rate for every item
+        picked = np.random.randint(len(self.rates), size=x.shape[0])
+        output = x.new_zeros((x.shape[0], x.shape[1], audio_window))
+        for rate_index in np.unique(picked):
+            item_index = torch.from_numpy(np.nonzero(picked == rate_index)[0]).to(x.device)
+            y = self.resample(x[item_index], self.rates[rate_index])
+            y = audio_io.audio_adjust_length(y.reshape(-1, y.shape[-1]), audio_window, fit=True)
+            output[item_index] = y.reshape(len(item_index), x.shape[1], audio_window)
+        return output
+
+    def __repr__(self):
+        return self.__class__.__name__ + f'(rates={self.rates})'
+
+
+class PitchShift(nn.Module):
+    """Pitch shift by phase vocoder time stretch followed by the speed perturbation path.
+
+    The shift is quantized to `step` cents, so the resampling filter of every shift is cached.
+
+    Args:
+        shift_size: Random shift range in cents `(-shift_size, shift_size)`.
+        step: Quantization step of the shift in cents.
+    """
+
+    def __init__(self, shift_size=500, step=50, n_fft=512, hop_length=128):
+        super().__init__()
+        self.shift_size = shift_size
+        self.step = step
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.speed = SpeedPerturbation(rates=())
+        self.windows = {}
+
+    def get_window(self, dtype, device):
+        key = (dtype, device)
+        if key not in self.windows:
+            window = torch.hann_window(self.n_fft, dtype=dtype, device=device)
+            phase_advance = torch.linspace(0, math.pi * self.hop_length, self.n_fft // 2 + 1,
+                                           dtype=dtype, device=device)[..., None]
+            self.windows[key] = (window, phase_advance)
+        return self.windows[key]
+
+    def time_stretch(self, x, factor):
+        # x: (batch, length) -> (batch, length * factor), pitch unchanged
+        window, phase_advance = self.get_window(x.dtype, x.device)
+        spectrogram = torch.stft(x, self.n_fft, self.hop_length, window=window, return_complex=True)
+        spectrogram = AF.phase_vocoder(spectrogram, 1. / factor, phase_advance)
+        return torch.istft(spectrogram, self.n_fft, self.hop_length, window=window,
+                           length=int(round(x.shape[-1] * factor)))
+
+    def forward(self, x, cents=None):
+        # x: (..., length), a single shift for the whole input
+        if cents is None:
+            cents = np.random.randint(-self.shift_size, self.shift_size)
+        cents = int(round(cents / self.step) * self.step)
+        if cents == 0:
+            return x
+        factor = float(Fraction(2 ** (cents / 1200)).limit_denominator(self.speed.max_denominator))
+        shape, length = x.shape[:-1], x.shape[-1]
+        y = self.time_stretch(x.reshape(-1, length), factor)
+        y = self.speed.resample(y, factor)
+        return y.reshape(*shape, -1)
+
+    def forward_batch(self, x, audio_window):
+        # x: (batch, channel, length) -> (batch, channel, audio_window), with a random shift for every item
+        # items with the same quantized shift are processed together
+        cents = np.round(np.random.randint(-self.shift_size, self.shift_size, size=x.shape[0]) / self.step)
+        cents = cents.astype(np.int64) * self.step
+        output = x.new_zeros((x.shape[0], x.shape[1], audio_window))
+        for shift in np.unique(cents):
+            item_index = torch.from_numpy(np.nonzero(cents == shift)[0]).to(x.device)
+            y = self.forward(x[item_index], cents=int(shift))
+            y = audio_io.audio_adjust_length(y.reshape(-1, y.shape[-1]), audio_window, fit=True)
+            output[item_index] = y.reshape(len(item_index), x.shape[1], audio_window)
+        return output
+
+    def __repr__(self):
+        return self.__class__.__name__ + f'(shift_size={self.shift_size}, step={self.step})'
+
+
+# filters are cached per process (per DataLoader worker)
+speed_perturbation = SpeedPerturbation()
+pitch_shift = PitchShift()
+
+
+def audio_pitch_shift(x, sr, shift_size=500, audio_window=None):
+    return pitch_shift(x, cents=np.random.randint(-shift_size, +shift_size))
+
+
+def audio_speed(x, sr, audio_window=None, rate=None):
+    return speed_perturbation(x, rate)
+
+
+def audio_augmentation_pipeline(x, sr, audio_window, pick_augmentation, fix_audio_length=True, profiler=None):
     pipeline = []
     for pick in pick_augmentation:
         if pick == 0:
@@ -88,20 +239,24 @@ def audio_augmentation_pipeline(x, sr, audio_window, pick_augmentation,fix_audio
             pipeline.append(audio_speed)
 
     for method in pipeline:
-        x = method(x=x, sr=sr, audio_window=audio_window)
+        if profiler is not None:
+            x = profiler.measure(method, x, sr=sr, audio_window=audio_window)
+        else:
+            x = method(x=x, sr=sr, audio_window=audio_window)
         if fix_audio_length:
             if len(x[0]) != audio_window:
                 x = audio_io.audio_adjust_length(x, audio_window, True)
     return x
 
 
-def audio_augmentation_baseline(x, sr=16000, audio_window=20480, fix_audio_length=False, custom_augmentation_list = None):
+def audio_augmentation_baseline(x, sr=16000, audio_window=20480, fix_audio_length=False, custom_augmentation_list=None,
+                                profiler=None):
     if custom_augmentation_list is not None:
         augmentation_list = custom_augmentation_list
     else:
         augmentation_list = [0, 2, 3, 5, 6]
     pick_augmentation = random.sample(augmentation_list, 3)
-    audio_augmentation_pipeline(x, sr, audio_window, pick_augmentation, fix_audio_length)
+    audio_augmentation_pipeline(x, sr, audio_window, pick_augmentation, fix_audio_length, profiler=profiler)
     return x
 
 
@@ -165,6 +320,46 @@ class RandomResizeCrop(nn.Module):
         return format_string
 
 
+class RandomResizeCropBatch(RandomResizeCrop):
+    """Random Resize Crop block for batch inputs.
+
+    Note:
+        Unlike RandomResizeCrop, use this with *batch inputs* `(B, C, F, T)`.
+        The crop parameters of every item are sampled at once, and the virtual crop area, crop and
+        resize of the whole batch are done by a single `grid_sample` call.
+    """
+
+    def get_batch_params(self, batch_size, virtual_crop_size, in_size):
+        canvas_h, canvas_w = virtual_crop_size
+        src_h, src_w = in_size
+        h = np.clip((np.random.uniform(*self.freq_scale, batch_size) * src_h).astype(int), 1, canvas_h)
+        w = np.clip((np.random.uniform(*self.time_scale, batch_size) * src_w).astype(int), 1, canvas_w)
+        i = (np.random.random(batch_size) * (canvas_h - h + 1)).astype(int)
+        j = (np.random.random(batch_size) * (canvas_w - w + 1)).astype(int)
+        return i, j, h, w
+
+    def get_theta(self, i, j, h, w, virtual_crop_size, in_size):
+        # affine map from the output grid to the input, in normalized coordinates (align_corners=True)
+        (lh, lw), (src_h, src_w) = virtual_crop_size, in_size
+        y, x = (lh - src_h) // 2, (lw - src_w) // 2
+        norm_h, norm_w = max(src_h - 1, 1), max(src_w - 1, 1)
+        theta = np.zeros((len(i), 2, 3))
+        theta[:, 0, 0] = (w - 1) / norm_w
+        theta[:, 0, 2] = (2 * (j - x) + w - 1) / norm_w - 1
+        theta[:, 1, 1] = (h - 1) / norm_h
+        theta[:, 1, 2] = (2 * (i - y) + h - 1) / norm_h - 1
+        return torch.from_numpy(theta)
+
+    def forward(self, lms):
+        virtual_crop_size = [int(s * c) for s, c in zip(lms.shape[-2:], self.virtual_crop_scale)]
+        i, j, h, w = self.get_batch_params(lms.shape[0], virtual_crop_size, lms.shape[-2:])
+        theta = self.get_theta(i, j, h, w, virtual_crop_size, lms.shape[-2:]).to(lms.device, lms.dtype)
+        grid = F.affine_grid(theta, list(lms.shape), align_corners=True)
+        # zero padding outside of the input plays the role of the empty virtual crop area
+        lms = F.grid_sample(lms, grid, mode=self.interpolation, padding_mode='zeros', align_corners=True)
+        return lms.to(torch.float)
+
+
 def log_mixup_exp(xa, xb, alpha):
     xa = xa.exp()
     xb = xb.exp()
@@ -172,6 +367,64 @@ def log_mixup_exp(xa, xb, alpha):
     return torch.log(x + torch.finfo(x.dtype).eps)
 
 
+class MemoryBank:
+    """FIFO memory bank on a preallocated ring buffer.
+
+    Args:
+        n_memory: Capacity of the ring buffer.
+        shape: Shape of one stored item. The buffer is allocated at construction if this is given,
+            otherwise at the first put.
+        shared: Place the buffer in shared memory, so that every DataLoader worker uses one bank.
+            The buffer has to exist before the workers start, so `shape` is required.
+    """
+
+    def __init__(self, n_memory=2048, shape=None, shared=False):
+        assert shape is not None or not shared, "shared memory bank needs the item shape"
+        self.n = n_memory
+        self.shared = shared
+        self.memory = None
+        # (next write position, number of stored items)
+        self.state = torch.zeros(2, dtype=torch.long)
+        self.lock = None
+        if shared:
+            self.state.share_memory_()
+            self.lock = multiprocessing.Lock()
+        if shape is not None:
+            self.allocate(shape)
+
+    def allocate(self, shape, dtype=torch.float, device='cpu'):
+        self.memory = torch.zeros((self.n, *shape), dtype=dtype, device=device)
+        if self.shared:
+            self.memory.share_memory_()
+
+    def put(self, x):
+        self.put_batch(x.unsqueeze(0))
+
+    def put_batch(self, x):
+        x = x.detach()[-self.n:]
+        if self.memory is None:
+            self.allocate(x.shape[1:], x.dtype, x.device)
+        if self.lock is not None:
+            with self.lock:
+                self._write(x)
+        else:
+            self._write(x)
+
+    def _write(self, x):
+        position, count = int(self.state[0]), int(self.state[1])
+        index = (position + torch.arange(len(x))) % self.n
+        self.memory[index.to(self.memory.device)] = x.to(self.memory.device)
+        self.state[0] = (position + len(x)) % self.n
+        self.state[1] = min(count + len(x), self.n)
+
+    def sample(self, k):
+        index = torch.randint(len(self), (k,))
+        return self.memory[index.to(self.memory.device)]
+
+    def __len__(self):
+        return int(self.state[1])
+
+
 class MixupBYOLA(nn.Module):
     """Mixup for BYOL-A.
 
@@ -179,34 +432,53 @@ class MixupBYOLA(nn.Module):
         ratio: Alpha in the paper.
         n_memory: Size of memory bank FIFO.
         log_mixup_exp: Use log-mixup-exp to mix if this is True, or mix without notion of log-scale.
+        shape: Shape of one input, needed only for a shared memory bank.
+        shared_memory: Share one memory bank across every DataLoader worker.
     """
 
-    def __init__(self, ratio=0.4, n_memory=2048, log_mixup_exp=True):
+    def __init__(self, ratio=0.4, n_memory=2048, log_mixup_exp=True, shape=None, shared_memory=False):
         super().__init__()
         self.ratio = ratio
         self.n = n_memory
         self.log_mixup_exp = log_mixup_exp
-        self.memory_bank = []
+        self.memory_bank = MemoryBank(n_memory, shape=shape, shared=shared_memory)
+
+    def mix(self, x, z, alpha):
+        return log_mixup_exp(x, z, 1. - alpha) if self.log_mixup_exp \
+            else alpha * z + (1. - alpha) * x
 
     def forward(self, x):
         # mix random
         alpha = self.ratio * np.random.random()
-        if self.memory_bank:
+        if len(self.memory_bank) > 0:
             # get z as a mixing background sound
-            z = self.memory_bank[np.random.randint(len(self.memory_bank))]
+            z = self.memory_bank.sample(1)[0]
             # mix them
-            mixed = log_mixup_exp(x, z, 1. - alpha) if self.log_mixup_exp \
-                    else alpha * z + (1. - alpha) * x
+            mixed = self.mix(x, z, alpha)
         else:
             mixed = x
         # update memory bank
-        self.memory_bank = (self.memory_bank + [x])[-self.n:]
+        self.memory_bank.put(x)
+
+        return mixed.to(torch.float)
+
+    def forward_batch(self, x, update_memory=True):
+        # x: (batch, ...) every item is mixed with its own background sound drawn from the memory bank
+        # the whole batch goes into the memory bank after mixing (unless update_memory is False, e.g. evaluation)
+        alpha = self.ratio * torch.rand((x.shape[0],) + (1,) * (x.dim() - 1), device=x.device)
+        if len(self.memory_bank) > 0:
+            z = self.memory_bank.sample(x.shape[0]).to(x.device)
+            mixed = self.mix(x, z, alpha)
+        else:
+            mixed = x
+        if update_memory:
+            self.memory_bank.put_batch(x)
 
         return mixed.to(torch.float)
 
     def __repr__(self):
         format_string = self.__class__.__name__ + f'(ratio={self.ratio},n={self.n}'
-        format_string += f',log_mixup_exp={self.log_mixup_exp})'
+        format_string += f',log_mixup_exp={self.log_mixup_exp},shared={self.memory_bank.shared})'
         return format_string
 
 
@@ -308,6 +580,31 @@ class RunningNorm(nn.Module):
         return format_string
 
 
+def merge_norm_stats(stats01, stats02):
+    """Merge two partial (count, mean, M2) statistics with the parallel Welford update (Chan et al.)."""
+    count01, mean01, m2_01 = stats01
+    count02, mean02, m2_02 = stats02
+    count = count01 + count02
+    if count == 0:
+        return 0, 0.0, 0.0
+    delta = mean02 - mean01
+    mean = mean01 + delta * count02 / count
+    m2 = m2_01 + m2_02 + delta ** 2 * count01 * count02 / count
+    return count, mean, m2
+
+
+def save_norm_stats(file_path, stats):
+    count, mean, m2 = stats
+    with open(file_path, 'w') as stats_file:
+        json.dump({'count': count, 'mean': mean, 'std': float(np.sqrt(m2 / count))}, stats_file, indent='\t')
+
+
+def load_norm_stats(file_path):
+    with open(file_path, 'r') as stats_file:
+        stats = json.load(stats_file)
+    return stats['mean'], stats['std']
+
+
 class PrecomputedNorm(nn.Module):
     """Normalization using Pre-computed Mean/Std.
 
@@ -356,14 +653,87 @@ class NormalizeBatch(nn.Module):
 class AugmentationModule:
     """BYOL-A augmentation module example, the same parameter with the paper."""
 
-    def __init__(self, size, epoch_samples, log_mixup_exp=True, mixup_ratio=0.4):
+    def __init__(self, size, epoch_samples, log_mixup_exp=True, mixup_ratio=0.4, shared_memory=False,
+                 norm_stats=None):
+        # a shared memory bank is allocated up front for (1, F, T) log mel spectrograms of `size`
         self.train_transform = nn.Sequential(
-            MixupBYOLA(ratio=mixup_ratio, log_mixup_exp=log_mixup_exp),
+            MixupBYOLA(ratio=mixup_ratio, log_mixup_exp=log_mixup_exp,
+                       shape=(1, *size) if shared_memory else None, shared_memory=shared_memory),
             RandomResizeCrop(virtual_crop_scale=(1.0, 1.5), freq_scale=(0.6, 1.5), time_scale=(0.6, 1.5)),
         )
-        self.pre_norm = RunningNorm(epoch_samples=epoch_samples)
+        # statistics file written by precompute_norm_stats.py, otherwise each worker keeps running statistics
+        if norm_stats is not None:
+            self.pre_norm = PrecomputedNorm(load_norm_stats(norm_stats))
+        else:
+            self.pre_norm = RunningNorm(epoch_samples=epoch_samples)
         print('Augmentatoions:', self.train_transform)
 
     def __call__(self, x):
         x = self.pre_norm(x)
         return self.train_transform(x), self.train_transform(x)
+
+
+class BatchAugmentationModule(nn.Module):
+    """BYOL-A augmentation module for batch inputs `(B, 1, F, T)`, to run on the training device.
+
+    Inputs should already be normalized (pre_norm of AugmentationModule is done in the dataset).
+    """
+
+    def __init__(self, log_mixup_exp=True, mixup_ratio=0.4):
+        super().__init__()
+        self.mixup = MixupBYOLA(ratio=mixup_ratio, log_mixup_exp=log_mixup_exp)
+        self.random_resize_crop = RandomResizeCropBatch(virtual_crop_scale=(1.0, 1.5), freq_scale=(0.6, 1.5),
+                                                        time_scale=(0.6, 1.5))
+
+    def transform(self, x, update_memory=True):
+        return self.random_resize_crop(self.mixup.forward_batch(x, update_memory=update_memory))
+
+    def forward(self, x, update_memory=True):
+        return self.transform(x, update_memory), self.transform(x, update_memory)
+
+
+if __name__ == '__main__':
+    task = ""
+    if task == "benchmark_speed_pitch":
+        import time
+        sample_rate, audio_window, batch_size, repeat = 16000, 20480, 32, 10
+        batch = torch.randn(batch_size, 1, audio_window)
+
+        def benchmark(name, function):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                function()
+            print("{}: {:.2f} ms/batch".format(name, (time.perf_counter() - start) / repeat * 1000))
+
+        benchmark("speed (sox, per sample)",
+                  lambda: [audio_speed_sox(x, sample_rate) for x in batch])
+        benchmark("speed (cached kernel, per sample)",
+                  lambda: [audio_speed(x, sample_rate) for x in batch])
+        benchmark("speed (cached kernel, batched)",
+                  lambda: speed_perturbation.forward_batch(batch, audio_window))
+        benchmark("pitch shift (sox, per sample)",
+                  lambda: [audio_pitch_shift_sox(x, sample_rate) for x in batch])
+        benchmark("pitch shift (resampling, per sample)",
+                  lambda: [audio_pitch_shift(x, sample_rate) for x in batch])
+        benchmark("pitch shift (resampling, batched)",
+                  lambda: pitch_shift.forward_batch(batch, audio_window))
+    elif task == "compare_batch_augmentation":
+        # per item (AugmentationModule.train_transform, dataset) vs batch (BatchAugmentationModule, trainer)
+        # 같은 정규화된 log mel batch를 넣고 view 출력의 통계를 비교 (memory bank가 찬 뒤의 batch만 사용)
+        n_mels, frames, batch_size, repeat = 64, 129, 64, 8
+        batches = [torch.randn(batch_size, 1, n_mels, frames) for _ in range(repeat + 1)]
+        item_transform = AugmentationModule((n_mels, frames), epoch_samples=batch_size).train_transform
+        batch_transform = BatchAugmentationModule()
+        outputs = {'per item': [], 'batch': []}
+        for index, batch in enumerate(batches):
+            item_views = [item_transform(x) for x in batch for _ in range(2)]
+            batch_views = batch_transform(batch)
+            if index > 0:
+                outputs['per item'].append(torch.stack(item_views))
+                outputs['batch'].append(torch.cat(batch_views))
+        for name, views in outputs.items():
+            views = torch.cat(views)
+            item_std = views.flatten(1).std(dim=1)
+            print("{:>8s}: mean {:.4f} | std {:.4f} | min {:.4f} | max {:.4f} | per view std {:.4f} +- {:.4f}".format(
+                name, views.mean().item(), views.std().item(), views.min().item(), views.max().item(),
+                item_std.mean().item(), item_std.std().item()))
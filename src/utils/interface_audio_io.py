@@ -1,7 +1,5 @@
-import soundfile as sf
 from tqdm import tqdm
 import src.utils.interface_file_io as io
-import librosa
 import wave
 import multiprocessing
 import src.utils.interface_multiprocessing as mi
@@ -9,6 +7,9 @@ import torchaudio
 import numpy as np
 import torch.nn.functional as F
 import torch
+import src.utils.interface_lazy_import as lazy_import
+sf = lazy_import.lazy_import('soundfile')
+librosa = lazy_import.lazy_import('librosa')
 torchaudio.set_audio_backend("sox_io")
 
 
@@ -16,6 +17,16 @@ def audio_loader(audio_file):
     return torchaudio.load(audio_file)
 
 
+def audio_block_loader(audio_file, block_size=16000 * 60):
+    # 파일 전체를 읽지 않고 block_size sample씩 (1, block) float32 tensor로 읽음 (multi channel은 평균)
+    for block in sf.blocks(audio_file, blocksize=block_size, dtype='float32', always_2d=True):
+        yield torch.from_numpy(block.mean(axis=1)).unsqueeze(0)
+
+
+def audio_sample_rate(audio_file):
+    return sf.info(audio_file).samplerate
+
+
 def cutoff(waveform, sample_rate, start, end):
     cut = waveform[0][int(start*sample_rate): int(end*sample_rate)]
     return cut.unsqueeze(0)
@@ -41,22 +52,71 @@ def audio_adjust_length(x, audio_window, fit=False):
     return x
 
 
-def audio_auto_trim(waveform, vad, audio_window=None):
-    waveform = vad(waveform)
-    waveform = torch.flip(waveform, [0, 1])
-    waveform = vad(waveform)
-    waveform = torch.flip(waveform, [0, 1])
+def energy_vad_boundary(waveform, sample_rate=16000, frame_length=0.025, frame_shift=0.01, threshold_db=-40.0):
+    # frames with energy above (loudest frame + threshold_db) are speech
+    # returns the first and last speech sample, or the whole waveform if nothing passes the threshold
+    audio_length = waveform.shape[-1]
+    frame_size, frame_step = int(frame_length * sample_rate), int(frame_shift * sample_rate)
+    if audio_length < frame_size:
+        return 0, audio_length
+    frames = waveform.mean(0).unfold(0, frame_size, frame_step)
+    energy = 10 * torch.log10(frames.pow(2).mean(1) + 1e-10)
+    speech_frames = torch.nonzero(energy > energy.max() + threshold_db).squeeze(1)
+    if len(speech_frames) == 0:
+        return 0, audio_length
+    start = speech_frames[0].item() * frame_step
+    end = min(speech_frames[-1].item() * frame_step + frame_size, audio_length)
+    return start, end
+
+
+def audio_tile(waveform, audio_window):
+    audio_length = waveform.shape[1]
+    if 0 < audio_length < audio_window:
+        waveform = waveform.repeat(1, -(-audio_window // audio_length))
+    return waveform
+
+
+def audio_auto_trim(waveform, vad=None, audio_window=None, sample_rate=16000):
+    if vad is not None:
+        # torchaudio VAD only trims the front, so it runs on the flipped waveform for the back
+        waveform = vad(waveform)
+        waveform = torch.flip(waveform, [0, 1])
+        waveform = vad(waveform)
+        waveform = torch.flip(waveform, [0, 1])
+    else:
+        start, end = energy_vad_boundary(waveform, sample_rate)
+        waveform = waveform[:, start:end]
 
     if audio_window is not None:
-        while True:
-            audio_length = waveform.shape[1]
-            if audio_length < audio_window:
-                waveform = torch.cat((waveform, waveform), 1)
-            else:
-                break
+        waveform = audio_tile(waveform, audio_window)
     return waveform
 
 
+def get_speech_boundary(audio_file, sample_rate=16000):
+    waveform, sampling_rate = audio_loader(audio_file)
+    start, end = energy_vad_boundary(waveform, sampling_rate)
+    return start / sampling_rate, end / sampling_rate
+
+
+def make_vad_manifest(file_list, manifest_path, num_workers=multiprocessing.cpu_count() - 1):
+    # manifest line: <filelist line> <tab> <speech start (sec)> <tab> <speech end (sec)>
+    # filelist lines carry a 4 character prefix before the audio file path
+    with multiprocessing.Pool(num_workers) as pool:
+        boundaries = pool.map(get_speech_boundary, [audio_file[4:] for audio_file in file_list], chunksize=64)
+    with open(manifest_path, 'w') as manifest:
+        for audio_file, (start, end) in zip(file_list, boundaries):
+            manifest.write("{}\t{:.4f}\t{:.4f}\n".format(audio_file, start, end))
+
+
+def load_vad_manifest(manifest_path):
+    speech_boundary = {}
+    with open(manifest_path, 'r') as manifest:
+        for line in manifest:
+            audio_file, start, end = line.rstrip('\n').split('\t')
+            speech_boundary[audio_file] = [float(start), float(end)]
+    return speech_boundary
+
+
 def resampling_audio(file, original_sampling_rate=44100, resampling_rate=16000):
     waveform, sampling_rate = librosa(file, original_sampling_rate)
     resample_waveform = librosa.resample(waveform, original_sampling_rate, resampling_rate)
@@ -116,7 +176,11 @@ class MelSpectrogramLibrosa:
 
 if __name__ == '__main__':
     task = ""
-    if task == "resampling":
+    if task == "vad_manifest":
+        make_vad_manifest(io.read_txt2list('../../dataset/voxceleb01-train.txt'),
+                          '../../dataset/voxceleb01-train-vad.txt')
+
+    elif task == "resampling":
         directory_path = ['../../dataset/UrbanSound8K/audio']
         new_save_directory = '../../dataset/UrbanSound8K/audio_16k/'
         resampling_audio_list(directory_path, new_save_directory, 'wav', 44100, 16000)
@@ -0,0 +1,113 @@
+import os
+import glob
+import time
+import multiprocessing.util
+import numpy as np
+
+
+# columns of one profile record: item index, effect name, wall time (seconds), input length, output length
+PROFILE_FILE_FORMAT = "augmentation-profile-{}.txt"
+# items buffered in memory before they are appended to the worker file
+FLUSH_ITEMS = 64
+
+
+class AugmentationProfiler:
+    """Per-effect profiler of the waveform augmentation pipeline.
+
+    Every DataLoader worker is a separate process, so each worker appends its records to its own file
+    (named by the worker pid) under `directory`. The main process merges the files with `collect`.
+    Records are written every `flush_items` items and when the worker process exits.
+    Profile files left in `directory` by an earlier run are removed when the profiler is created.
+
+    Args:
+        directory: Directory shared by the main process and the DataLoader workers.
+        flush_items: Number of items buffered before the records are written.
+    """
+
+    def __init__(self, directory, flush_items=FLUSH_ITEMS):
+        self.directory = directory
+        self.flush_items = flush_items
+        self.item = -1
+        self.records = []
+        self.pending_items = 0
+        self.finalizer_pid = None
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for file_path in glob.glob(os.path.join(self.directory, PROFILE_FILE_FORMAT.format('*'))):
+            os.remove(file_path)
+
+    def start_item(self, index):
+        self.item = index
+
+    def record(self, effect, elapsed, input_length, output_length):
+        self.records.append((self.item, effect, elapsed, input_length, output_length))
+
+    def measure(self, method, x, **kwargs):
+        input_length = x.shape[-1]
+        start = time.perf_counter()
+        y = method(x=x, **kwargs)
+        self.record(method.__name__, time.perf_counter() - start, input_length, y.shape[-1])
+        return y
+
+    def flush(self, force=False):
+        # called at the end of every item, writes once `flush_items` items are buffered (or when forced)
+        if len(self.records) == 0:
+            return
+        self.pending_items += 1
+        if not force and self.pending_items < self.flush_items:
+            if self.finalizer_pid != os.getpid():
+                # the buffered records of a DataLoader worker are written when the worker exits
+                self.finalizer_pid = os.getpid()
+                multiprocessing.util.Finalize(self, self.flush, kwargs={'force': True}, exitpriority=10)
+            return
+        file_path = os.path.join(self.directory, PROFILE_FILE_FORMAT.format(os.getpid()))
+        with open(file_path, 'a') as profile_file:
+            profile_file.writelines("{}\t{}\t{:.9f}\t{}\t{}\n".format(item, effect, elapsed, input_length, output_length)
+                                    for item, effect, elapsed, input_length, output_length in self.records)
+        self.records = []
+        self.pending_items = 0
+
+    def collect(self, clear=True):
+        """Merge the records of every worker.
+
+        Returns:
+            dict: effect name -> {'elapsed', 'length_change', 'item'} numpy arrays
+        """
+        self.flush(force=True)
+        merged = {}
+        for file_path in glob.glob(os.path.join(self.directory, PROFILE_FILE_FORMAT.format('*'))):
+            with open(file_path, 'r') as profile_file:
+                for line in profile_file:
+                    item, effect, elapsed, input_length, output_length = line.strip().split('\t')
+                    records = merged.setdefault(effect, {'elapsed': [], 'length_change': [], 'item': []})
+                    records['elapsed'].append(float(elapsed))
+                    records['length_change'].append(int(output_length) - int(input_length))
+                    records['item'].append(int(item))
+            if clear:
+                os.remove(file_path)
+        return {effect: {key: np.array(value) for key, value in records.items()}
+                for effect, records in merged.items()}
+
+
+def summarize_profile(profile, percentiles=(50, 90, 99)):
+    summary = {}
+    for effect, records in profile.items():
+        elapsed = records['elapsed'] * 1000.0  # ms
+        summary[effect] = {
+            'count': len(elapsed),
+            'total_ms': float(elapsed.sum()),
+            'mean_ms': float(elapsed.mean()),
+            'mean_length_change': float(records['length_change'].mean()),
+        }
+        for percentile, value in zip(percentiles, np.percentile(elapsed, percentiles)):
+            summary[effect]['p{}_ms'.format(percentile)] = float(value)
+    return summary
+
+
+def item_elapsed(profile):
+    # total augmentation time (seconds) spent on each dataset item across every effect
+    totals = {}
+    for records in profile.values():
+        for item, elapsed in zip(records['item'], records['elapsed']):
+            totals[item] = totals.get(item, 0.0) + elapsed
+    return np.array(list(totals.values()))
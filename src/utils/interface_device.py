@@ -0,0 +1,106 @@
+import torch
+
+
+# config의 device / precision으로 실행 환경을 정함
+# "device": "cuda", "cuda:1", "cpu" (없으면 use_cuda와 GPU 유무로 결정, GPU가 없으면 CPU로 실행)
+# "precision": "float32", "float64", "bfloat16" (model parameter와 floating point 입력의 dtype)
+# "amp": "bfloat16", "float16" (float32 parameter + autocast mixed precision, float16은 grad scaler 사용)
+PRECISIONS = {
+    'float32': torch.float32,
+    'float64': torch.float64,
+    'bfloat16': torch.bfloat16,
+}
+AMP_DTYPES = {
+    'bfloat16': torch.bfloat16,
+    'float16': torch.float16,
+}
+
+
+class DeviceContext:
+    def __init__(self, device='cpu', precision='float32', amp=None):
+        assert (precision in PRECISIONS), "Unsupported precision: {}".format(precision)
+        assert (amp is None or amp in AMP_DTYPES), "Unsupported amp dtype: {}".format(amp)
+        assert (amp is None or precision == 'float32'), "amp needs float32 parameters (precision: {})".format(precision)
+        self.device = torch.device(device)
+        self.precision = precision
+        self.dtype = PRECISIONS[precision]
+        self.amp = amp
+        self.grad_scaler = get_grad_scaler(self.device, enabled=amp == 'float16')
+
+    @property
+    def is_cuda(self):
+        return self.device.type == 'cuda'
+
+    def to(self, *tensors):
+        # floating point tensor만 dtype을 바꾸고 (label, length 등 integer tensor는 device만 이동), None은 그대로
+        moved = [self.to_tensor(tensor) for tensor in tensors]
+        return moved[0] if len(moved) == 1 else moved
+
+    def to_tensor(self, tensor):
+        if tensor is None:
+            return None
+        if tensor.is_floating_point():
+            return tensor.to(self.device, self.dtype, non_blocking=True)
+        return tensor.to(self.device, non_blocking=True)
+
+    def to_module(self, module):
+        return module.to(self.device, self.dtype)
+
+    def autocast(self):
+        # amp가 꺼져 있으면 아무것도 하지 않음
+        if self.amp is None:
+            return torch.autocast(self.device.type, enabled=False)
+        return torch.autocast(self.device.type, dtype=AMP_DTYPES[self.amp])
+
+    def backward(self, loss):
+        self.grad_scaler.scale(loss).backward()
+
+    def unscale_(self, optimizer):
+        # gradient clipping 전에 호출
+        self.grad_scaler.unscale_(optimizer)
+
+    def step(self, optimizer):
+        # float16 gradient에 inf/nan이 있으면 step을 건너뛰고 scale을 줄임
+        self.grad_scaler.step(optimizer)
+        self.grad_scaler.update()
+
+    def synchronize(self):
+        if self.is_cuda:
+            torch.cuda.synchronize(self.device)
+
+    def __repr__(self):
+        return "DeviceContext(device={}, precision={}, amp={})".format(self.device, self.precision, self.amp)
+
+
+def get_device_context(config):
+    device = config.get('device', None)
+    if device is None:
+        device = 'cuda' if config.get('use_cuda', True) else 'cpu'
+    if device.startswith('cuda') and not torch.cuda.is_available():
+        device = 'cpu'
+    return DeviceContext(device=device, precision=config.get('precision', 'float32'), amp=config.get('amp', None))
+
+
+def get_grad_scaler(device, enabled):
+    if hasattr(torch, 'amp') and hasattr(torch.amp, 'GradScaler'):
+        return torch.amp.GradScaler(device.type, enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled and device.type == 'cuda')
+
+
+def float32_region(device):
+    # autocast 안에서 정밀도가 필요한 계산 (loss 등)을 float32로 실행
+    return torch.autocast(device.type, enabled=False)
+
+
+def upcast(tensor):
+    # float16/bfloat16만 float32로 (float64 precision은 그대로)
+    if tensor.dtype in [torch.float16, torch.bfloat16]:
+        return tensor.float()
+    return tensor
+
+
+def module_device(module):
+    # module이 올라가 있는 device (parameter가 없으면 cpu)
+    for parameter in module.parameters():
+        return parameter.device
+    return torch.device('cpu')
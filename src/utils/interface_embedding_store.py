@@ -0,0 +1,103 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import torch
+import src.utils.interface_weight_store as weight_store
+
+
+# frozen pretext model의 embedding을 한번만 뽑아서 저장하는 local store (downstream 학습은 store에서 바로 읽음)
+# <root>/<key>/embeddings.npy: (row, *feature_shape) float16, labels.npy: (row,) int64, file_index.npy: (row,) int64
+# <root>/<key>/metadata.json: 마지막에 쓰기 때문에 있으면 완성된 entry
+# key: pretext checkpoint의 sha256 + config (model, filelist, audio_window 등) + layer + crop 설정의 sha256
+EMBEDDING_STORE_ENV = 'EMBEDDING_STORE_DIR'
+DEFAULT_EMBEDDING_STORE = os.path.join(os.path.expanduser('~'), '.cache', 'waverdeep', 'embedding_store')
+METADATA_FILENAME = 'metadata.json'
+
+
+def get_store_root(root=None):
+    return root or os.environ.get(EMBEDDING_STORE_ENV, DEFAULT_EMBEDDING_STORE)
+
+
+def get_entry_path(key, root=None):
+    return os.path.join(get_store_root(root), key)
+
+
+def make_key(checkpoint_path, description):
+    # description: json으로 표현 가능한 config / layer / crop 설정
+    key_source = dict(description, checkpoint_sha256=weight_store.file_sha256(checkpoint_path)
+                      if checkpoint_path is not None else None)
+    return hashlib.sha256(json.dumps(key_source, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def has_entry(key, root=None):
+    return os.path.exists(os.path.join(get_entry_path(key, root), METADATA_FILENAME))
+
+
+class EmbeddingWriter:
+    # 임시 directory에 memmap으로 쓰고, 다 쓰면 metadata를 남기고 entry 위치로 옮김 (중간에 죽으면 entry가 생기지 않음)
+    def __init__(self, key, num_rows, root=None):
+        self.key = key
+        self.root = get_store_root(root)
+        self.num_rows = num_rows
+        os.makedirs(self.root, exist_ok=True)
+        self.directory = tempfile.mkdtemp(dir=self.root, prefix='.{}-'.format(key[:8]))
+        self.embeddings = None
+        self.labels = np.lib.format.open_memmap(os.path.join(self.directory, 'labels.npy'), mode='w+',
+                                                dtype=np.int64, shape=(num_rows,))
+        self.file_index = np.lib.format.open_memmap(os.path.join(self.directory, 'file_index.npy'), mode='w+',
+                                                    dtype=np.int64, shape=(num_rows,))
+        self.position = 0
+
+    def write(self, embeddings, labels, file_index):
+        # embeddings: (batch, *feature_shape) numpy array, feature shape는 첫 batch에서 정해짐
+        if self.embeddings is None:
+            self.embeddings = np.lib.format.open_memmap(os.path.join(self.directory, 'embeddings.npy'), mode='w+',
+                                                        dtype=np.float16, shape=(self.num_rows,) + embeddings.shape[1:])
+        end = self.position + len(embeddings)
+        self.embeddings[self.position:end] = embeddings.astype(np.float16)
+        self.labels[self.position:end] = labels
+        self.file_index[self.position:end] = file_index
+        self.position = end
+
+    def close(self, metadata):
+        assert (self.position == self.num_rows), "{} of {} rows written".format(self.position, self.num_rows)
+        for array in [self.embeddings, self.labels, self.file_index]:
+            array.flush()
+        metadata = dict(metadata, key=self.key, num_rows=self.num_rows,
+                        feature_shape=list(self.embeddings.shape[1:]))
+        with open(os.path.join(self.directory, METADATA_FILENAME), 'w') as metadata_file:
+            json.dump(metadata, metadata_file, indent=2)
+        entry_path = get_entry_path(self.key, self.root)
+        if os.path.exists(entry_path):  # 같은 key를 다른 process가 먼저 완성한 경우
+            shutil.rmtree(self.directory)
+        else:
+            os.replace(self.directory, entry_path)
+        return entry_path
+
+    def abort(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def load_entry(entry_path):
+    # (embeddings, labels, file_index, metadata), embeddings는 read-only memmap
+    with open(os.path.join(entry_path, METADATA_FILENAME), 'r') as metadata_file:
+        metadata = json.load(metadata_file)
+    embeddings = np.load(os.path.join(entry_path, 'embeddings.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(entry_path, 'labels.npy'))
+    file_index = np.load(os.path.join(entry_path, 'file_index.npy'))
+    return embeddings, labels, file_index, metadata
+
+
+def load_tensors(entry_path, label_list=None):
+    # memory에 올린 (embedding (row, dim) float32, label (row,), label_list), label_list를 주면 그 순서로 label을 맞춤
+    embeddings, labels, _, metadata = load_entry(entry_path)
+    x = torch.from_numpy(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+    entry_label_list = metadata['label_list']
+    if label_list is None:
+        label_list = entry_label_list
+    label_index = {label: index for index, label in enumerate(label_list)}
+    y = torch.tensor([label_index[entry_label_list[label]] for label in labels], dtype=torch.long)
+    return x, y, label_list
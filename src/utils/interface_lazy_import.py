@@ -0,0 +1,25 @@
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    # 첫 attribute 접근 때 실제로 import 하는 module (augment, librosa, matplotlib, sklearn, pandas처럼 무거운 library용)
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+
+def lazy_import(name):
+    # 이미 import 된 module은 그대로 사용
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -1,5 +1,6 @@
-import matplotlib.pyplot as plt
-from sklearn.manifold import TSNE
+import src.utils.interface_lazy_import as lazy_import
+plt = lazy_import.lazy_import('matplotlib.pyplot')
+manifold = lazy_import.lazy_import('sklearn.manifold')
 
 
 def plot_tsne(config, embedding, labels):
@@ -10,5 +11,5 @@ def plot_tsne(config, embedding, labels):
 
 
 def tsne(config, features):
-    embedding = TSNE().fit_transform(features)
+    embedding = manifold.TSNE().fit_transform(features)
     return embedding
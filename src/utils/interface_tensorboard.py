@@ -1,9 +1,11 @@
 # 텐서보드를 사용해서 Projector를 구현할 때 오류가 있음
 # 이 오류를 해결하기 위해서 작성해야 할 것
 from torch.utils.tensorboard import SummaryWriter
-import matplotlib.pyplot as plt
 # import tensorflow as tf
 import tensorboard as tb
+import src.utils.interface_augmentation_profiler as augmentation_profiler
+import src.utils.interface_lazy_import as lazy_import
+plt = lazy_import.lazy_import('matplotlib.pyplot')
 # tf.io.gfile = tb.compat.tensorflow_stub.io.gfile
 # console: tensorboard --logdir=runs --bind_all
 # # nohup tensorboard --logdir=runs --bind_all > /dev/null 2>&1
@@ -25,6 +27,8 @@ def close_tensorboard_writer(writer):
 def add_dataset_figure(writer, dataloader, desc="Train", epoch=0):
     dataiter = iter(dataloader)
     waveform01, waveform02, _, _ = dataiter.next()
+    if waveform02 is None:  # pre concatenated views
+        waveform01, waveform02 = waveform01.chunk(2)
     fig = plt.figure()
     plt.plot(waveform01[0].t().numpy(), alpha=0.5)
     plt.plot(waveform02[0].t().numpy(), alpha=0.5)
@@ -36,6 +40,8 @@ def add_dataset_figure(writer, dataloader, desc="Train", epoch=0):
 def visualization_dataset_by_byol(writer, dataloader, desc="Train", epoch=0):
     dataiter = iter(dataloader)
     waveform01, waveform02 = dataiter.next()
+    if waveform02 is None:  # pre concatenated views
+        waveform01, waveform02 = waveform01.chunk(2)
     fig = plt.figure()
     plt.plot(waveform01[0].t().numpy(), alpha=0.5)
     plt.plot(waveform02[0].t().numpy(), alpha=0.5)
@@ -50,6 +56,8 @@ def visualization_dataset_by_byol(writer, dataloader, desc="Train", epoch=0):
 def add_dataset_figure_by_byol(writer, dataloader, desc="Train", epoch=0):
     dataiter = iter(dataloader)
     waveform01, waveform02 = dataiter.next()
+    if waveform02 is None:  # pre concatenated views
+        waveform01, waveform02 = waveform01.chunk(2)
     fig = plt.figure()
     plt.plot(waveform01[0].t().numpy(), alpha=0.5)
     plt.plot(waveform02[0].t().numpy(), alpha=0.5)
@@ -80,6 +88,15 @@ def add_byol_latent_heatmap(writer, online1, online2, target1, target2, title, d
     plt.close()
 
 
-
-
-
+def add_augmentation_profile(writer, profile, epoch):
+    # profile: output of AugmentationProfiler.collect(), merged over every DataLoader worker
+    if len(profile) == 0:
+        return
+    summary = augmentation_profiler.summarize_profile(profile)
+    for effect, records in profile.items():
+        writer.add_histogram('AugmentationProfile/{}-elapsed_ms'.format(effect), records['elapsed'] * 1000.0, epoch)
+        writer.add_histogram('AugmentationProfile/{}-length_change'.format(effect), records['length_change'], epoch)
+        for key, value in summary[effect].items():
+            writer.add_scalar('AugmentationProfile/{}-{}'.format(effect, key), value, epoch)
+    writer.add_histogram('AugmentationProfile/item-elapsed_ms',
+                         augmentation_profiler.item_elapsed(profile) * 1000.0, epoch)
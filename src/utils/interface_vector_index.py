@@ -0,0 +1,185 @@
+import math
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+# cosine similarity 기반 approximate nearest neighbour index (IVF + product quantization, numpy / torch만 사용)
+# IVF: k-means coarse centroid로 list를 나누고 query와 가까운 nprobe개 list만 검색
+# PQ: centroid와의 residual을 subspace M개로 나눠서 subspace별 k-means codebook index (uint8) M개로 저장
+# embedding을 L2 normalize 하고 inner product로 검색: score = q . centroid + sum_m q_m . codeword_m
+
+
+def normalize(x):
+    return F.normalize(x.float(), dim=1)
+
+
+def kmeans(x, num_clusters, iterations=20, seed=0, chunk_size=65536):
+    # squared euclidean k-means, 빈 cluster는 임의의 sample로 다시 시작
+    generator = torch.Generator(device='cpu').manual_seed(seed)
+    centroids = x[torch.randperm(x.size(0), generator=generator)[:num_clusters].to(x.device)].clone()
+    for _ in range(iterations):
+        assignment = nearest_centroid(x, centroids, chunk_size)
+        sums = torch.zeros_like(centroids).index_add_(0, assignment, x)
+        counts = torch.bincount(assignment, minlength=num_clusters).to(x.dtype)
+        empty = counts == 0
+        centroids = sums / counts.clamp_min(1).unsqueeze(1)
+        if empty.any():
+            reseed = torch.randint(x.size(0), (int(empty.sum()),), generator=generator).to(x.device)
+            centroids[empty] = x[reseed]
+    return centroids
+
+
+def nearest_centroid(x, centroids, chunk_size=65536):
+    centroid_norm = (centroids ** 2).sum(dim=1)
+    return torch.cat([(centroid_norm - 2 * chunk @ centroids.T).argmin(dim=1) for chunk in x.split(chunk_size)])
+
+
+def exact_search(queries, database, k, chunk_size=4096):
+    # (score, index) brute-force cosine top-k
+    database = normalize(database)
+    scores, indices = [], []
+    for chunk in normalize(queries).split(chunk_size):
+        chunk_scores, chunk_indices = (chunk @ database.T).topk(min(k, database.size(0)), dim=1)
+        scores.append(chunk_scores)
+        indices.append(chunk_indices)
+    return torch.cat(scores), torch.cat(indices)
+
+
+class IVFPQIndex:
+    def __init__(self, dimension, num_lists=1024, num_subquantizers=16, num_bits=8, device='cpu'):
+        assert (num_bits <= 8), "PQ codes are stored as uint8 (num_bits <= 8)"
+        self.dimension = dimension
+        self.num_lists = num_lists
+        self.num_subquantizers = num_subquantizers
+        self.num_codewords = 2 ** num_bits
+        # subspace 크기가 같도록 0으로 padding
+        self.sub_dimension = math.ceil(dimension / num_subquantizers)
+        self.device = torch.device(device)
+        self.coarse_centroids = None
+        self.codebooks = None  # (M, codeword, sub_dimension)
+        self.codes = torch.zeros(0, num_subquantizers, dtype=torch.uint8, device=self.device)
+        self.list_assignment = torch.zeros(0, dtype=torch.long, device=self.device)
+        self.ids = torch.zeros(0, dtype=torch.long, device=self.device)
+        self.list_offsets = None
+
+    @property
+    def is_trained(self):
+        return self.coarse_centroids is not None
+
+    def __len__(self):
+        return self.ids.numel()
+
+    def split_subspaces(self, x):
+        padding = self.sub_dimension * self.num_subquantizers - self.dimension
+        return F.pad(x, (0, padding)).view(x.size(0), self.num_subquantizers, self.sub_dimension)
+
+    def train(self, x, iterations=20, seed=0):
+        assert (x.size(0) >= max(self.num_lists, self.num_codewords)), \
+            "{} training vectors for {} lists / {} codewords".format(x.size(0), self.num_lists, self.num_codewords)
+        x = normalize(x.to(self.device))
+        self.coarse_centroids = kmeans(x, self.num_lists, iterations=iterations, seed=seed)
+        residuals = self.split_subspaces(x - self.coarse_centroids[nearest_centroid(x, self.coarse_centroids)])
+        self.codebooks = torch.stack([kmeans(residuals[:, m], self.num_codewords, iterations=iterations, seed=seed + m)
+                                      for m in range(self.num_subquantizers)])
+        return self
+
+    def encode(self, x):
+        # (list assignment, PQ codes)
+        assignment = nearest_centroid(x, self.coarse_centroids)
+        residuals = self.split_subspaces(x - self.coarse_centroids[assignment])
+        codes = torch.stack([nearest_centroid(residuals[:, m], self.codebooks[m])
+                             for m in range(self.num_subquantizers)], dim=1)
+        return assignment, codes.to(torch.uint8)
+
+    def add(self, x, ids=None, chunk_size=65536):
+        assert (self.is_trained), "train the index before adding vectors"
+        if ids is None:
+            ids = torch.arange(len(self), len(self) + x.size(0))
+        assignments, codes = zip(*[self.encode(normalize(chunk.to(self.device))) for chunk in x.split(chunk_size)])
+        self.list_assignment = torch.cat([self.list_assignment] + list(assignments))
+        self.codes = torch.cat([self.codes] + list(codes))
+        self.ids = torch.cat([self.ids, ids.to(self.device, torch.long)])
+        # list 순서로 정렬해서 list마다 연속된 구간 (offset)으로 읽음
+        order = torch.argsort(self.list_assignment, stable=True)
+        self.list_assignment, self.codes, self.ids = self.list_assignment[order], self.codes[order], self.ids[order]
+        counts = torch.bincount(self.list_assignment, minlength=self.num_lists)
+        self.list_offsets = torch.cat([counts.new_zeros(1), counts.cumsum(0)])
+        return self
+
+    def search(self, queries, k=10, nprobe=16, max_candidates=2 ** 19):
+        # (score (query, k), id (query, k)), 후보가 k개보다 적으면 score -inf, id -1
+        # query chunk마다 probe한 list의 후보 구간을 가장 긴 list 길이로 padding해서 한번에 gather / topk
+        # chunk의 query 수는 padding된 후보 (query x nprobe x 가장 긴 list)가 max_candidates를 넘지 않게 정함
+        queries = normalize(queries.to(self.device))
+        nprobe = min(nprobe, self.num_lists)
+        list_sizes = self.list_offsets[1:] - self.list_offsets[:-1]
+        chunk_size = max(1, max_candidates // (nprobe * max(int(list_sizes.max()), 1)))
+        scores, ids = [], []
+        for chunk in queries.split(chunk_size):
+            coarse_scores, probe_lists = (chunk @ self.coarse_centroids.T).topk(nprobe, dim=1)
+            # lookup table (query, M, codeword): q_m . codeword_m, list와 관계 없이 query마다 한번만 계산
+            lookup_tables = torch.einsum('qms,mcs->qmc', self.split_subspaces(chunk), self.codebooks)
+            sizes = list_sizes[probe_lists]
+            max_size = max(int(sizes.max()), 1)
+            position = torch.arange(max_size, device=self.device)
+            # (query, nprobe, max_size): probe한 list 안의 위치, list 길이를 넘는 위치는 padding
+            valid = position < sizes.unsqueeze(2)
+            candidates = (self.list_offsets[probe_lists].unsqueeze(2) + position).clamp_max(max(len(self) - 1, 0))
+            candidates = candidates.flatten(1)
+            codes = self.codes[candidates].long()  # (query, nprobe * max_size, M)
+            residual_scores = lookup_tables.gather(2, codes.transpose(1, 2)).sum(dim=1)
+            candidate_scores = coarse_scores.repeat_interleave(max_size, dim=1) + residual_scores
+            candidate_scores = candidate_scores.masked_fill(~valid.flatten(1), -float('inf'))
+            top_scores, top_positions = candidate_scores.topk(min(k, candidate_scores.size(1)), dim=1)
+            top_ids = self.ids[candidates.gather(1, top_positions)].masked_fill(top_scores == -float('inf'), -1)
+            if top_scores.size(1) < k:
+                padding = k - top_scores.size(1)
+                top_scores = F.pad(top_scores, (0, padding), value=-float('inf'))
+                top_ids = F.pad(top_ids, (0, padding), value=-1)
+            scores.append(top_scores)
+            ids.append(top_ids)
+        return torch.cat(scores), torch.cat(ids)
+
+    def nbytes(self):
+        # 저장되는 vector 당 code + id와 centroid / codebook 크기 (bytes)
+        return sum(tensor.numel() * tensor.element_size() for tensor in
+                   [self.coarse_centroids, self.codebooks, self.codes, self.ids, self.list_assignment])
+
+    def save(self, path):
+        np.savez(path, dimension=self.dimension, num_lists=self.num_lists, num_subquantizers=self.num_subquantizers,
+                 num_codewords=self.num_codewords, coarse_centroids=self.coarse_centroids.cpu().numpy(),
+                 codebooks=self.codebooks.cpu().numpy(), codes=self.codes.cpu().numpy(),
+                 list_assignment=self.list_assignment.cpu().numpy(), ids=self.ids.cpu().numpy())
+        return path
+
+    @classmethod
+    def load(cls, path, device='cpu'):
+        with np.load(path) as saved:
+            index = cls(int(saved['dimension']), num_lists=int(saved['num_lists']),
+                        num_subquantizers=int(saved['num_subquantizers']),
+                        num_bits=int(saved['num_codewords']).bit_length() - 1, device=device)
+            index.coarse_centroids = torch.from_numpy(saved['coarse_centroids']).to(index.device)
+            index.codebooks = torch.from_numpy(saved['codebooks']).to(index.device)
+            index.codes = torch.from_numpy(saved['codes']).to(index.device)
+            index.list_assignment = torch.from_numpy(saved['list_assignment']).to(index.device)
+            index.ids = torch.from_numpy(saved['ids']).to(index.device)
+        counts = torch.bincount(index.list_assignment, minlength=index.num_lists)
+        index.list_offsets = torch.cat([counts.new_zeros(1), counts.cumsum(0)])
+        return index
+
+
+def recall_at_k(approximate_ids, exact_ids):
+    # exact top-k 중 approximate top-k에 들어간 비율의 평균
+    k = exact_ids.size(1)
+    matches = (approximate_ids[:, :k].unsqueeze(2) == exact_ids.unsqueeze(1)).any(dim=1)
+    return matches.float().mean().item()
+
+
+def knn_accuracy(neighbour_ids, neighbour_scores, gallery_labels, query_labels, num_classes):
+    # top-k neighbour label의 similarity 가중 투표, 찾지 못한 neighbour (id -1)는 무시
+    valid = neighbour_ids >= 0
+    labels = gallery_labels[neighbour_ids.clamp_min(0)]
+    weights = torch.where(valid, neighbour_scores.clamp_min(0) + 1e-6, torch.zeros_like(neighbour_scores))
+    votes = torch.zeros(neighbour_ids.size(0), num_classes, device=neighbour_ids.device).scatter_add_(1, labels, weights)
+    return (votes.argmax(dim=1) == query_labels).float().mean().item()
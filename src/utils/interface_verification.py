@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import torch
+import torch.nn.functional as F
+import src.utils.interface_embedding_store as embedding_store
+
+
+# speaker verification trial scoring (cosine) + EER / minDCF
+# trial list: VoxCeleb1 형식 "<label 1/0> <enrol path> <test path>" (path는 id10270/5r0dWxy17C8/00001.wav 같은 상대 경로)
+# embedding store entry의 file_list와 경로 끝 (speaker/video/utterance, 확장자 제외)으로 맞춤
+
+
+def path_key(path, depth=3):
+    parts = os.path.splitext(path.strip())[0].replace('\\', '/').split('/')
+    return '/'.join(parts[-depth:])
+
+
+def read_trials(trial_path):
+    # (label (trial,) int64, enrol path list, test path list)
+    labels, enrol_paths, test_paths = [], [], []
+    with open(trial_path, 'r') as trial_file:
+        for line in trial_file:
+            if len(line.strip()) == 0:
+                continue
+            label, enrol_path, test_path = line.split()
+            labels.append(int(label))
+            enrol_paths.append(enrol_path)
+            test_paths.append(test_path)
+    return np.array(labels, dtype=np.int64), enrol_paths, test_paths
+
+
+def file_embeddings(entry_path, depth=3):
+    # (file별 L2 normalize된 embedding (file, dim), path key -> row), crop이 여러개면 crop 평균
+    embeddings, _, file_index, metadata = embedding_store.load_entry(entry_path)
+    x = torch.from_numpy(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+    file_index = torch.from_numpy(file_index)
+    num_files = len(metadata['file_list'])
+    sums = torch.zeros(num_files, x.size(1)).index_add_(0, file_index, x)
+    counts = torch.bincount(file_index, minlength=num_files).clamp_min(1).unsqueeze(1)
+    rows = {path_key(path, depth): row for row, path in enumerate(metadata['file_list'])}
+    return F.normalize(sums / counts, dim=1), rows
+
+
+def trial_rows(paths, rows):
+    missing = [path for path in paths if path_key(path) not in rows]
+    assert (len(missing) == 0), "{} trial files are not in the embedding store (e.g. {})".format(
+        len(missing), missing[0] if len(missing) > 0 else None)
+    return torch.tensor([rows[path_key(path)] for path in paths], dtype=torch.long)
+
+
+def score_trials(embeddings, enrol_rows, test_rows, chunk_size=1024):
+    # trial별 cosine score, enrol file chunk (chunk, dim) x 사용되는 test file (dim, test)만 한번에 계산
+    # working set은 chunk_size x test file 수, trial이 많아도 score matrix 전체를 만들지 않음
+    test_files, test_position = torch.unique(test_rows, return_inverse=True)
+    test_embeddings = embeddings[test_files].T.contiguous()
+    enrol_files, enrol_position = torch.unique(enrol_rows, return_inverse=True)
+    order = torch.argsort(enrol_position)
+    boundaries = torch.searchsorted(enrol_position[order], torch.arange(0, len(enrol_files) + chunk_size, chunk_size))
+    scores = torch.empty(len(enrol_rows))
+    for chunk_index, start in enumerate(range(0, len(enrol_files), chunk_size)):
+        trials = order[boundaries[chunk_index]:boundaries[chunk_index + 1]]
+        chunk_scores = embeddings[enrol_files[start:start + chunk_size]] @ test_embeddings
+        scores[trials] = chunk_scores[enrol_position[trials] - start, test_position[trials]]
+    return scores
+
+
+def error_rates(scores, labels):
+    # threshold를 score 내림차순으로 한번에 sweep: (false negative rate, false positive rate), threshold 개수 + 1
+    scores = torch.as_tensor(scores, dtype=torch.float64)
+    labels = torch.as_tensor(labels, dtype=torch.float64)
+    sorted_scores, order = torch.sort(scores, descending=True)
+    sorted_labels = labels[order]
+    # 같은 score는 같이 accept 되므로 마지막 위치만 사용
+    last = torch.cat([sorted_scores[1:] != sorted_scores[:-1], torch.ones(1, dtype=torch.bool)])
+    true_positive = torch.cumsum(sorted_labels, dim=0)[last]
+    false_positive = torch.cumsum(1 - sorted_labels, dim=0)[last]
+    num_target, num_nontarget = labels.sum(), (1 - labels).sum()
+    assert (num_target > 0 and num_nontarget > 0), "trials need both target and non-target pairs"
+    false_negative_rate = torch.cat([torch.ones(1, dtype=torch.float64), 1 - true_positive / num_target])
+    false_positive_rate = torch.cat([torch.zeros(1, dtype=torch.float64), false_positive / num_nontarget])
+    thresholds = torch.cat([torch.full((1,), float('inf'), dtype=torch.float64), sorted_scores[last]])
+    return false_negative_rate, false_positive_rate, thresholds
+
+
+def compute_eer(false_negative_rate, false_positive_rate, thresholds):
+    # (EER, threshold): fnr과 fpr이 가장 가까운 지점
+    index = torch.argmin(torch.abs(false_negative_rate - false_positive_rate))
+    eer = (false_negative_rate[index] + false_positive_rate[index]) / 2
+    return eer.item(), thresholds[index].item()
+
+
+def compute_min_dcf(false_negative_rate, false_positive_rate, thresholds, p_target=0.01, c_miss=1.0, c_fa=1.0):
+    # (normalized minDCF, threshold)
+    detection_cost = c_miss * false_negative_rate * p_target + c_fa * false_positive_rate * (1 - p_target)
+    index = torch.argmin(detection_cost)
+    default_cost = min(c_miss * p_target, c_fa * (1 - p_target))
+    return (detection_cost[index] / default_cost).item(), thresholds[index].item()
@@ -0,0 +1,149 @@
+import os
+import json
+import fcntl
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import torch
+
+
+# pretrained weight를 content hash(sha256)로 저장하는 local store
+# <root>/index.json: backbone name -> sha256, <root>/objects/<sha[:2]>/<sha>.pt: torch.save로 저장된 state_dict
+# 같은 host의 training process들은 같은 object를 mmap으로 읽기 때문에 page cache 하나를 공유함
+WEIGHT_STORE_ENV = 'WEIGHT_STORE_DIR'
+DEFAULT_WEIGHT_STORE = os.path.join(os.path.expanduser('~'), '.cache', 'waverdeep', 'weight_store')
+
+
+def torch_version_at_least(major, minor):
+    version = tuple(int(part) for part in torch.__version__.split('+')[0].split('.')[:2])
+    return version >= (major, minor)
+
+
+# torch.load(mmap=True), load_state_dict(assign=True), torch.device('meta') context는 torch 2.1부터
+# 이전 version에서는 store의 state_dict를 메모리에 읽어서 일반적인 load_state_dict로 복사
+SUPPORTS_MMAP_LOAD = torch_version_at_least(2, 1)
+
+
+def get_store_root(root=None):
+    return root or os.environ.get(WEIGHT_STORE_ENV, DEFAULT_WEIGHT_STORE)
+
+
+def get_object_path(sha256, root=None):
+    return os.path.join(get_store_root(root), 'objects', sha256[:2], '{}.pt'.format(sha256))
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as weight_file:
+        for chunk in iter(lambda: weight_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def locked_index(root=None):
+    # index.json read-modify-write는 process 간 file lock으로 보호
+    root = get_store_root(root)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'index.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            index = read_index(root)
+            yield index
+            write_index(index, root)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_index(root=None):
+    index_path = os.path.join(get_store_root(root), 'index.json')
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, 'r') as index_file:
+        return json.load(index_file)
+
+
+def write_index(index, root=None):
+    root = get_store_root(root)
+    with tempfile.NamedTemporaryFile('w', dir=root, delete=False) as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+    os.replace(index_file.name, os.path.join(root, 'index.json'))
+
+
+def import_state_dict(name, state_dict, root=None):
+    # state_dict를 zip 형식(torch.save)으로 다시 저장해야 torch.load(mmap=True)로 읽을 수 있음
+    root = get_store_root(root)
+    os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.join(root, 'objects'), suffix='.pt', delete=False) as object_file:
+        torch.save({key: value.detach().cpu().contiguous() for key, value in state_dict.items()}, object_file)
+    sha256 = file_sha256(object_file.name)
+    object_path = get_object_path(sha256, root)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    if os.path.exists(object_path):  # 같은 content는 한번만 저장
+        os.remove(object_file.name)
+    else:
+        os.replace(object_file.name, object_path)
+    with locked_index(root) as index:
+        index[name] = sha256
+    return sha256
+
+
+def import_weight_file(name, file_path, root=None):
+    # torchvision/efficientnet에서 받은 .pth 파일 등 (checkpoint 안에 state_dict가 있는 경우도 처리)
+    state_dict = torch.load(file_path, map_location='cpu')
+    if 'model_state_dict' in state_dict:
+        state_dict = state_dict['model_state_dict']
+    elif 'state_dict' in state_dict:
+        state_dict = state_dict['state_dict']
+    return import_state_dict(name, state_dict, root)
+
+
+def has_weight(name, root=None):
+    sha256 = read_index(root).get(name, None)
+    return sha256 is not None and os.path.exists(get_object_path(sha256, root))
+
+
+def load_weight(name, root=None, verify=False):
+    sha256 = read_index(root).get(name, None)
+    assert (sha256 is not None), "{} is not in the weight store ({})".format(name, get_store_root(root))
+    object_path = get_object_path(sha256, root)
+    if verify:
+        assert (file_sha256(object_path) == sha256), "{} is corrupted ({})".format(name, object_path)
+    if not SUPPORTS_MMAP_LOAD:
+        return torch.load(object_path, map_location='cpu')
+    return torch.load(object_path, map_location='cpu', mmap=True, weights_only=True)
+
+
+def load_into(module, name, root=None, strict=True):
+    # mmap된 tensor를 그대로 parameter로 사용 (복사 없이 page cache를 공유, 쓰기가 일어난 page만 copy-on-write)
+    if not SUPPORTS_MMAP_LOAD:
+        module.load_state_dict(load_weight(name, root), strict=strict)
+        return module
+    module.load_state_dict(load_weight(name, root), strict=strict, assign=True)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description='waverdeep - pretrained weight store')
+    parser.add_argument('task', choices=['import', 'list', 'verify'])
+    parser.add_argument('--name', required=False, help='backbone name (e.g. resnet50, efficientnet-b4)')
+    parser.add_argument('--file', required=False, help='weight file to import')
+    parser.add_argument('--root', required=False, default=None)
+    args = parser.parse_args()
+
+    if args.task == 'import':
+        sha256 = import_weight_file(args.name, args.file, args.root)
+        print("{} -> {}".format(args.name, get_object_path(sha256, args.root)))
+    elif args.task == 'list':
+        for name, sha256 in sorted(read_index(args.root).items()):
+            print("{:>20s} {}".format(name, sha256))
+    elif args.task == 'verify':
+        for name, sha256 in sorted(read_index(args.root).items()):
+            object_path = get_object_path(sha256, args.root)
+            valid = os.path.exists(object_path) and file_sha256(object_path) == sha256
+            print("{:>20s} {}".format(name, 'ok' if valid else 'CORRUPTED'))
+
+
+if __name__ == '__main__':
+    main()
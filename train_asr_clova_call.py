@@ -33,6 +33,7 @@ from src.data.dataset_clova_call import AudioDataLoader, SpectrogramDataset, Buc
 from src.models.model_clova_call import EncoderRNN, DecoderRNN, Seq2Seq
 import src.utils.interface_tensorboard as tensorboard
 import src.utils.interface_train_tool as train_tool
+import src.utils.interface_device as device_pack
 
 # os.environ["CUDA_VISIBLE_DEVICES"] = "1"
 random_seed = 777
@@ -99,7 +100,9 @@ def get_distance(ref_labels, hyp_labels):
 
 
 def train(model, data_loader, criterion, optimizer, device, epoch, train_sampler, max_norm=400,
-          teacher_forcing_ratio=1, writer=None):
+          teacher_forcing_ratio=1, writer=None, device_context=None):
+    # device_context가 없으면 device에서 amp 없이 실행
+    device_context = device_context or device_pack.DeviceContext(device)
     total_loss = 0.
     total_num = 0
     total_dist = 0
@@ -119,18 +122,20 @@ def train(model, data_loader, criterion, optimizer, device, epoch, train_sampler
         src_len = scripts.size(1)
         target = scripts[:, 1:]
 
-        logit = model(feats, feat_lengths, scripts, teacher_forcing_ratio=teacher_forcing_ratio)
+        with device_context.autocast():
+            logit = model(feats, feat_lengths, scripts, teacher_forcing_ratio=teacher_forcing_ratio)
 
-        logit = torch.stack(logit, dim=1).to(device)
-        y_hat = logit.max(-1)[1]
+            logit = torch.stack(logit, dim=1).to(device)
+            y_hat = logit.max(-1)[1]
 
-        loss = criterion(logit.contiguous().view(-1, logit.size(-1)), target.contiguous().view(-1))
+            loss = criterion(logit.contiguous().view(-1, logit.size(-1)), target.contiguous().view(-1))
         total_loss += loss.item()
         total_num += sum(feat_lengths).item()
 
-        loss.backward()
+        device_context.backward(loss)
+        device_context.unscale_(optimizer)
         torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm)
-        optimizer.step()
+        device_context.step(optimizer)
 
         dist, length, _ = get_distance(target, y_hat)
         total_dist += dist
@@ -154,7 +159,8 @@ def train(model, data_loader, criterion, optimizer, device, epoch, train_sampler
     return total_loss / total_num, (total_dist / total_length) * 100
 
 
-def evaluate(epoch, model, data_loader, criterion, device, writer, save_output=False):
+def evaluate(epoch, model, data_loader, criterion, device, writer, save_output=False, device_context=None):
+    device_context = device_context or device_pack.DeviceContext(device)
     total_loss = 0.
     total_num = 0
     total_dist = 0
@@ -174,12 +180,13 @@ def evaluate(epoch, model, data_loader, criterion, device, writer, save_output=F
             src_len = scripts.size(1)
             target = scripts[:, 1:]
 
-            logit = model(feats, feat_lengths, None, teacher_forcing_ratio=0.0)
-            logit = torch.stack(logit, dim=1).to(device)
-            y_hat = logit.max(-1)[1]
+            with device_context.autocast():
+                logit = model(feats, feat_lengths, None, teacher_forcing_ratio=0.0)
+                logit = torch.stack(logit, dim=1).to(device)
+                y_hat = logit.max(-1)[1]
 
-            logit = logit[:, :target.size(1), :]  # cut over length to calculate loss
-            loss = criterion(logit.contiguous().view(-1, logit.size(-1)), target.contiguous().view(-1))
+                logit = logit[:, :target.size(1), :]  # cut over length to calculate loss
+                loss = criterion(logit.contiguous().view(-1, logit.size(-1)), target.contiguous().view(-1))
             total_loss += loss.item()
             total_num += sum(feat_lengths).item()
 
@@ -246,6 +253,8 @@ def main():
     parser.add_argument('--model-path', default='models/las_final.pth', help='Location to save best validation model')
     parser.add_argument('--log-path', default='log/', help='path to predict log about valid and test dataset')
     parser.add_argument('--cuda', action='store_true', default=False, help='disables CUDA training')
+    parser.add_argument('--amp', default=None, choices=['bfloat16', 'float16'],
+                        help='mixed precision training (float16 uses a grad scaler)')
     parser.add_argument('--seed', type=int, default=777, help='random seed (default: 123456)')
     parser.add_argument('--mode', type=str, default='train', help='Train or Test')
     parser.add_argument('--load-model', action='store_true', default=False, help='Load model')
@@ -266,7 +275,8 @@ def main():
     EOS_token = char2index['</s>']
     PAD_token = char2index['_']
 
-    device = torch.device('cuda' if args.cuda else 'cpu')
+    device_context = device_pack.DeviceContext('cuda' if args.cuda else 'cpu', amp=args.amp)
+    device = device_context.device
 
     audio_conf = dict(sample_rate=args.sample_rate,
                       window_size=args.window_size,
@@ -348,8 +358,8 @@ def main():
     if args.mode != "train":
         for test_file in args.test_file_list:
             test_loader = testLoader_dict[test_file]
-            test_loss, test_cer, transcripts_list = evaluate(model, test_loader, criterion, device, writer,
-                                                             save_output=True)
+            test_loss, test_cer, transcripts_list = evaluate(0, model, test_loader, criterion, device, writer,
+                                                             save_output=True, device_context=device_context)
 
             for line in transcripts_list:
                 print(line)
@@ -363,13 +373,13 @@ def main():
             train_loss, train_cer = train(train_model, train_loader, criterion, optimizer, device=device, epoch=epoch,
                                           train_sampler=train_sampler,
                                           max_norm=args.max_norm, teacher_forcing_ratio=args.teacher_forcing,
-                                          writer=writer)
+                                          writer=writer, device_context=device_context)
 
             cer_list = []
             for test_file in args.test_file_list:
                 test_loader = testLoader_dict[test_file]
                 test_loss, test_cer, _ = evaluate(epoch, model, test_loader, criterion, device=device, writer=writer,
-                                                  save_output=True)
+                                                  save_output=True, device_context=device_context)
                 test_log = 'Test({name}) Summary Epoch: [{0}]\tAverage Loss {loss:.3f}\tAverage CER {cer:.3f}\t'.format(
                     epoch + 1, name=test_file, loss=test_loss, cer=test_cer)
                 # print(test_log)
@@ -9,11 +9,11 @@ import src.optimizers.optimizer as optimizers
 import src.data.dataset as dataset
 import src.models.model as model_pack
 import src.utils.interface_logger as logger
+import src.utils.interface_device as device_pack
 import src.utils.interface_tensorboard as tensorboard
 import src.utils.interface_plot as plots
 import src.utils.interface_train_tool as train_tool
 from apex.parallel import DistributedDataParallel as DDP
-os.environ["CUDA_VISIBLE_DEVICES"] = "2"
 
 
 def main():
@@ -38,6 +38,9 @@ def main():
 
     # gpu check
     format_logger.info("GPU: {}".format(torch.cuda.is_available()))
+    # config의 device / precision (GPU가 없으면 CPU)
+    device_context = device_pack.get_device_context(config)
+    format_logger.info("device: {}".format(device_context))
     args.distributed = False
     if 'WORLD_SIZE' in os.environ:
         args.distributed = int(os.environ['WORLD_SIZE']) > 1
@@ -65,9 +68,8 @@ def main():
     format_logger.info("load_model ...")
     model = model_pack.load_model(config, model_name=config['pretext_model_name'])
 
-    # if gpu available: load gpu
-    if config['use_cuda']:
-        model = model.cuda()
+    # config의 device / precision으로 model 이동
+    model = device_context.to_module(model)
 
     # if ditributed training available:
     if args.distributed:
@@ -94,9 +96,9 @@ def main():
     for epoch in range(num_of_epoch):
         epoch = epoch + 1
         format_logger.info("start train ... [ {}/{} epoch ]".format(epoch, num_of_epoch))
-        train(config, writer, epoch, model, train_loader, optimizer, format_logger)
+        train(config, writer, epoch, model, train_loader, optimizer, format_logger, device_context)
         format_logger.info("start test ... [ {}/{} epoch ]".format(epoch, num_of_epoch))
-        test_accuracy, test_loss = test(config, writer, epoch, model, test_loader, format_logger)
+        test_accuracy, test_loss = test(config, writer, epoch, model, test_loader, format_logger, device_context)
         # speaker_tsne(config, model, train_dataset, epoch, writer)
 
         if test_accuracy > best_accuracy:
@@ -109,19 +111,19 @@ def main():
     tensorboard.close_tensorboard_writer(writer)
 
 
-def train(config, writer, epoch, model, train_loader, optimizer, format_logger):
+def train(config, writer, epoch, model, train_loader, optimizer, format_logger, device_context):
     model.train()
     total_loss = 0.0
     total_accuracy = 0.0
     with torch.autograd.set_detect_anomaly(True):
         for batch_idx, (waveform, filename, speaker_id) in enumerate(train_loader):
-            if config['use_cuda']:
-                data = waveform.cuda()
-            loss, accuracy, z, c = model(data)
+            data = device_context.to(waveform)
+            with device_context.autocast():
+                loss, accuracy, z, c = model(data)
             # optimizer.zero_grad()
             model.zero_grad()
-            loss.backward()
-            optimizer.step()
+            device_context.backward(loss)
+            device_context.step(optimizer)
             writer.add_scalar('Loss/train_step', loss, (epoch - 1) * len(train_loader) + batch_idx)
             writer.add_scalar('Accuracy/train_step', accuracy * 100, (epoch - 1) * len(train_loader) + batch_idx)
             total_loss += len(data) * loss
@@ -161,16 +163,16 @@ def train(config, writer, epoch, model, train_loader, optimizer, format_logger):
                                  layer.bias_hh_l0, global_step=(epoch - 1) * len(train_loader) + batch_idx)
 
 
-def test(config, writer, epoch, model, test_loader, format_logger):
+def test(config, writer, epoch, model, test_loader, format_logger, device_context):
     model.eval()
     total_loss = 0.0
     total_accuracy = 0.0
 
     with torch.no_grad():
         for batch_idx, (waveform, filename, speaker_id) in enumerate(test_loader):
-            if config['use_cuda']:
-                data = waveform.cuda()
-            loss, accuracy, z, c = model(data)
+            data = device_context.to(waveform)
+            with device_context.autocast():
+                loss, accuracy, z, c = model(data)
 
             writer.add_scalar('Loss/test_step', loss, (epoch - 1) * len(test_loader) + batch_idx)
             writer.add_scalar('Accuracy/test_step', accuracy * 100, (epoch - 1) * len(test_loader) + batch_idx)
@@ -210,17 +212,18 @@ def speaker_tsne(config, model, dataset, epoch, writer):
     input_size = (batch_size, 1, audio_window)
 
     model.eval()
+    device = device_pack.module_device(model)
     with torch.no_grad():
         latent_rep_size, latent_rep_len = model.get_latent_size(input_size)
-        features = torch.zeros(tsne_cluster, batch_size, latent_rep_size * latent_rep_len).cuda()
-        labels = torch.zeros(tsne_cluster, batch_size).cuda()
+        features = torch.zeros(tsne_cluster, batch_size, latent_rep_size * latent_rep_len, device=device)
+        labels = torch.zeros(tsne_cluster, batch_size, device=device)
 
         for index, speaker_idx in enumerate(dataset.speaker_align):
             if index == tsne_cluster:
                 break
 
             input_data = dataset.get_audio_by_speaker(speaker_idx, batch_size=batch_size)
-            input_data = input_data.cuda()
+            input_data = input_data.to(device)
             z, c = model.get_latent_representations(input_data)
 
             z_representation = z.permute(0, 2, 1)
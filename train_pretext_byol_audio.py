@@ -1,8 +1,8 @@
 import argparse
-import os
 import torch
 import json
 import src.utils.interface_logger as logger
+import src.utils.interface_device as device_pack
 import src.utils.interface_train_tool as train_tool
 import src.utils.interface_tensorboard as tensorboard
 import src.data.dataset as dataset
@@ -10,7 +10,6 @@ import src.models.model as model_pack
 import src.optimizers.optimizer as optimizers
 import src.utils.interface_audio_augmentation as audio_augmentation
 import src.optimizers.ExponentialMovingAverage as ema
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
 
 
 def main():
@@ -35,6 +34,9 @@ def main():
 
     # gpu check
     format_logger.info("GPU: {}".format(torch.cuda.is_available()))
+    # config의 device / precision (GPU가 없으면 CPU)
+    device_context = device_pack.get_device_context(config)
+    format_logger.info("device: {}".format(device_context))
 
     # print configuration 출력
     format_logger.info('configurations: {}'.format(config))
@@ -48,9 +50,11 @@ def main():
     format_logger.info("load_model ...")
     model = model_pack.load_model(config, model_name=config['pretext_model_name'])
 
-    # if gpu available: load gpu
-    if config['use_cuda']:
-        model = model.cuda()
+    # config의 device / precision으로 model 이동
+    model = device_context.to_module(model)
+
+    # target network exponential moving average (per epoch or per step)
+    target_ema = ema.get_target_ema(config, steps_per_epoch=len(train_loader))
 
     # setup optimizer
     optimizer = optimizers.get_optimizer(model_parameter=model.parameters(),
@@ -73,9 +77,13 @@ def main():
     for epoch in range(num_of_epoch):
         epoch = epoch + 1
         format_logger.info("start train ... [ {}/{} epoch - {} iter ]".format(epoch, num_of_epoch, len(train_loader)))
-        train(config, writer, epoch, model, train_loader, optimizer, format_logger)
+        train(config, writer, epoch, model, train_loader, optimizer, format_logger, target_ema, device_context)
+        if epoch == 1 and target_ema.storage_dtype is not None:
+            # low precision target/modest network가 절약한 메모리 (module: float32 MB, stored MB, saved MB)
+            format_logger.info("target storage {}: {}".format(target_ema.storage_dtype, target_ema.memory_report()))
         format_logger.info("start test ... [ {}/{} epoch - {} iter ]".format(epoch, num_of_epoch, len(test_loader)))
-        test_loss = test(config, writer, epoch, model, test_loader, format_logger)
+        test_loss = test(config, writer, epoch, model, test_loader, format_logger, device_context,
+                         train_dataset.batch_transforms)
 
         if test_loss < best_loss:
             best_loss = test_loss
@@ -87,23 +95,33 @@ def main():
     tensorboard.close_tensorboard_writer(writer)
 
 
-def train(config, writer, epoch, model, train_loader, optimizer, format_logger):
+def get_views(batch, batch_augmentation, device_context, update_memory=True):
+    # per item augmentation: dataset이 [(B,1,F,T), (B,1,F,T)] 두 view를 반환
+    # batch augmentation: dataset은 정규화만 한 (B,1,F,T) 하나를 반환 -> training device에서 두 view로 augmentation
+    if batch_augmentation is None:
+        return batch
+    return batch_augmentation(device_context.to(batch), update_memory=update_memory)
+
+
+def train(config, writer, epoch, model, train_loader, optimizer, format_logger, target_ema, device_context):
     model.train()
     total_loss = 0.0
     post_norm = audio_augmentation.NormalizeBatch()
-    target_ema = ema.EMA(config['ema_decay'])
-    for batch_idx, (waveform, filename, speaker_id) in enumerate(train_loader):
+    batch_augmentation = train_loader.dataset.batch_transforms
+    for batch_idx, batch in enumerate(train_loader):
+        waveform = get_views(batch, batch_augmentation, device_context)
         bs = int(waveform[0].shape[0])
         waveform = torch.cat(waveform)  # [(B,1,F,T), (B,1,F,T)] -> (2*B,1,F,T)
         waveform = post_norm(waveform)
 
-        if config['use_cuda']:
-            data = waveform.cuda()
+        data = device_context.to(waveform)
 
-        _, loss = model(data[:bs], data[bs:])
+        with device_context.autocast():
+            _, loss = model(data[:bs], data[bs:])
         model.zero_grad()
-        loss.backward()
-        optimizer.step()
+        device_context.backward(loss)
+        device_context.step(optimizer)
+        target_ema.on_step(model)
         writer.add_scalar('Loss/train_step', loss, (epoch - 1) * len(train_loader) + batch_idx)
         total_loss += len(data) * loss
 
@@ -129,24 +147,25 @@ def train(config, writer, epoch, model, train_loader, optimizer, format_logger):
             conv2 += 1
 
     # exponential moving average 적용
-    ema.update_moving_average(target_ema, model.target_encoder, model.online_encoder)
-    ema.update_moving_average(target_ema, model.target_projector, model.online_projector)
+    target_ema.on_epoch(model)
 
 
-def test(config, writer, epoch, model, test_loader, format_logger):
+def test(config, writer, epoch, model, test_loader, format_logger, device_context, batch_augmentation=None):
+    # batch_augmentation: train dataset의 module, test batch는 memory bank에 넣지 않고 train batch를 mixing 배경으로만 사용
     model.eval()
     total_loss = 0.0
     post_norm = audio_augmentation.NormalizeBatch()
     with torch.no_grad():
-        for batch_idx, (waveform, filename, speaker_id) in enumerate(test_loader):
+        for batch_idx, batch in enumerate(test_loader):
+            waveform = get_views(batch, batch_augmentation, device_context, update_memory=False)
             bs = int(waveform[0].shape[0])
             waveform = torch.cat(waveform)  # [(B,1,F,T), (B,1,F,T)] -> (2*B,1,F,T)
             waveform = post_norm(waveform)
 
-            if config['use_cuda']:
-                data = waveform.cuda()
+            data = device_context.to(waveform)
 
-            _, loss = model(data[:bs], data[bs:])
+            with device_context.autocast():
+                _, loss = model(data[:bs], data[bs:])
 
             writer.add_scalar('Loss/test_step', loss, (epoch - 1) * len(test_loader) + batch_idx)
             total_loss += len(data) * loss
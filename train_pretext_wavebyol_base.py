@@ -1,8 +1,8 @@
 import argparse
-import os
 import torch
 import json
 import src.utils.interface_logger as logger
+import src.utils.interface_device as device_pack
 import src.utils.interface_train_tool as train_tool
 import src.utils.interface_tensorboard as tensorboard
 import src.data.dataset as dataset
@@ -11,7 +11,6 @@ import src.optimizers.optimizer as optimizers
 import src.utils.interface_audio_augmentation as audio_augmentation
 import src.optimizers.ExponentialMovingAverage as ema
 import src.losses.criterion_metrics as metrics
-os.environ['CUDA_VISIBLE_DEVICES'] = '1'
 
 
 def main():
@@ -31,6 +30,9 @@ def main():
 
     # gpu check
     format_logger.info("GPU: {}".format(torch.cuda.is_available()))
+    # config의 device / precision (GPU가 없으면 CPU)
+    device_context = device_pack.get_device_context(config)
+    format_logger.info("device: {}".format(device_context))
 
     # print configuration 출력
     format_logger.info('configurations: {}'.format(config))
@@ -44,9 +46,11 @@ def main():
     format_logger.info("load_model ...")
     model = model_pack.load_model(config, model_name=config['pretext_model_name'])
 
-    # if gpu available: load gpu
-    if config['use_cuda']:
-        model = model.cuda()
+    # config의 device / precision으로 model 이동
+    model = device_context.to_module(model)
+
+    # target network exponential moving average (per epoch or per step)
+    target_ema = ema.get_target_ema(config, steps_per_epoch=len(train_loader))
 
     # setup optimizer
     optimizer = optimizers.get_optimizer(model_parameter=model.parameters(), config=config)
@@ -66,9 +70,12 @@ def main():
     for epoch in range(num_of_epoch):
         epoch = epoch + 1
         format_logger.info("start train ... [ {}/{} epoch - {} iter ]".format(epoch, num_of_epoch, len(train_loader)))
-        train_loss = train(config, writer, epoch, model, train_loader, optimizer)
+        train_loss = train(config, writer, epoch, model, train_loader, optimizer, target_ema, device_context)
+        if epoch == 1 and target_ema.storage_dtype is not None:
+            # low precision target/modest network가 절약한 메모리 (module: float32 MB, stored MB, saved MB)
+            format_logger.info("target storage {}: {}".format(target_ema.storage_dtype, target_ema.memory_report()))
         format_logger.info("start test ... [ {}/{} epoch - {} iter ]".format(epoch, num_of_epoch, len(test_loader)))
-        test_loss = test(config, writer, epoch, model, test_loader)
+        test_loss = test(config, writer, epoch, model, test_loader, device_context)
 
         if best_loss is None:
             best_loss = test_loss
@@ -82,21 +89,20 @@ def main():
     tensorboard.close_tensorboard_writer(writer)
 
 
-def train(config, writer, epoch, model, train_loader, optimizer):
+def train(config, writer, epoch, model, train_loader, optimizer, target_ema, device_context):
     model.train()
     total_loss = 0.0
-    target_ema = ema.EMA(config['ema_decay'])
     tensorboard.add_dataset_figure_by_byol(writer, train_loader, "Train", epoch)
     for batch_idx, (waveform01, waveform02) in enumerate(train_loader):
-        if config['use_cuda']:
-            data01 = waveform01.cuda()
-            data02 = waveform02.cuda()
-        online_representation, target_representation, loss = model(data01, data02)
+        data01, data02 = device_context.to(waveform01, waveform02)
+        with device_context.autocast():
+            online_representation, target_representation, loss = model(data01, data02)
         model.zero_grad()
-        loss.backward()
-        optimizer.step()
+        device_context.backward(loss)
+        device_context.step(optimizer)
+        target_ema.on_step(model)
         writer.add_scalar('Loss/train_step', loss, (epoch - 1) * len(train_loader) + batch_idx)
-        total_loss += len(data01) * loss
+        total_loss += (len(data01) if data02 is not None else len(data01) // 2) * loss
 
         if batch_idx % 50 == 0:
             online01_output = online_representation[0][0].detach()
@@ -133,9 +139,12 @@ def train(config, writer, epoch, model, train_loader, optimizer):
 
     writer.add_scalar('Loss/train', total_loss, (epoch - 1))
 
-    ema.update_moving_average(target_ema, model.target_pre_network, model.online_pre_network)
-    ema.update_moving_average(target_ema, model.target_encoder_network, model.online_encoder_network)
-    ema.update_moving_average(target_ema, model.target_projector_network, model.online_projector_network)
+    # per-effect augmentation time of every DataLoader worker
+    profiler = getattr(train_loader.dataset, 'profiler', None)
+    if profiler is not None:
+        tensorboard.add_augmentation_profile(writer, profiler.collect(), epoch)
+
+    target_ema.on_epoch(model)
 
     conv1d = 0
     conv2d = 0
@@ -155,18 +164,17 @@ def train(config, writer, epoch, model, train_loader, optimizer):
     return total_loss
 
 
-def test(config, writer, epoch, model, test_loader):
+def test(config, writer, epoch, model, test_loader, device_context):
     model.eval()
     total_loss = 0.0
     tensorboard.add_dataset_figure_by_byol(writer, test_loader, "Test", epoch)
     with torch.no_grad():
         for batch_idx, (waveform01, waveform02) in enumerate(test_loader):
-            if config['use_cuda']:
-                data01 = waveform01.cuda()
-                data02 = waveform02.cuda()
-            online_representation, target_representation, loss = model(data01, data02)
+            data01, data02 = device_context.to(waveform01, waveform02)
+            with device_context.autocast():
+                online_representation, target_representation, loss = model(data01, data02)
             writer.add_scalar('Loss/test_step', loss, (epoch - 1) * len(test_loader) + batch_idx)
-            total_loss += len(data01) * loss
+            total_loss += (len(data01) if data02 is not None else len(data01) // 2) * loss
 
             if batch_idx % 50 == 0:
                 online01_output = online_representation[0][0].detach()
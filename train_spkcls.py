@@ -7,11 +7,11 @@ import torch
 import random
 import torch.nn as nn
 import src.utils.interface_logger as logger
+import src.utils.interface_device as device_pack
 import src.data.dataset as dataset
 import src.models.model as model_pack
 import src.optimizers.optimizer as optimizers
 import src.utils.interface_tensorboard as tensorboard
-os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 random_seed = 777
 torch.manual_seed(random_seed)
 # torch.backends.cudnn.deterministic = True # 연산 속도가 느려질 수 있음
@@ -39,6 +39,9 @@ def main():
     format_logger = logger.setup_log(save_filename="{}-{}.log".format(config['log_filename'], timestamp))
     # gpu check
     format_logger.info("GPU: {}".format(torch.cuda.is_available()))
+    # config의 device / precision (GPU가 없으면 CPU)
+    device_context = device_pack.get_device_context(config)
+    format_logger.info("device: {}".format(device_context))
 
     # print configuration 출력
     format_logger.info('configurations: {}'.format(config))
@@ -53,15 +56,18 @@ def main():
     format_logger.info("speaker_num: {}".format(len(speaker_dict.keys())))
 
     format_logger.info("load_model ...")
-    pretext_model = model_pack.load_model(config, config['pretext_model_name'], config['pretext_checkpoint'])
+    # train/test_embedding_store가 있으면 extract_embeddings.py로 저장한 embedding으로 학습 (pretext model 없음)
+    pretext_model = None
+    if not dataset.use_embedding_store(config):
+        pretext_model = model_pack.load_model(config, config['pretext_model_name'], config['pretext_checkpoint'])
     downstream_model = model_pack.load_model(config, config['downstream_model_name'], config['downstream_checkpoint'])
 
     optimizer = optimizers.get_optimizer(downstream_model.parameters(), config)
 
-    # if gpu available: load gpu
-    if config['use_cuda']:
-        pretext_model = pretext_model.cuda()
-        downstream_model = downstream_model.cuda()
+    # config의 device / precision으로 model 이동
+    if pretext_model is not None:
+        pretext_model = device_context.to_module(pretext_model)
+    downstream_model = device_context.to_module(downstream_model)
 
     writer = tensorboard.set_tensorboard_writer(
         "{}-{}_{}_{}_{}_{}_{}".format(config['tensorboard_writer_name'],
@@ -70,10 +76,11 @@ def main():
         )
 
     # print model information
-    format_logger.info(">>> pretext_model_structure <<<")
-    model_params = sum(p.numel() for p in pretext_model.parameters() if p.requires_grad)
-    format_logger.info("pretext model parameters: {}".format(model_params))
-    format_logger.info("{}".format(pretext_model))
+    if pretext_model is not None:
+        format_logger.info(">>> pretext_model_structure <<<")
+        model_params = sum(p.numel() for p in pretext_model.parameters() if p.requires_grad)
+        format_logger.info("pretext model parameters: {}".format(model_params))
+        format_logger.info("{}".format(pretext_model))
 
     format_logger.info(">>> downstream_model_structure <<<")
     model_params = sum(p.numel() for p in downstream_model.parameters() if p.requires_grad)
@@ -87,10 +94,10 @@ def main():
         epoch = epoch + 1
         format_logger.info("start train ... [ {}/{} epoch ]".format(epoch, num_of_epoch))
         train(config, writer, epoch, pretext_model, downstream_model, train_loader, optimizer, format_logger,
-              speaker_dict)
+              speaker_dict, device_context)
         format_logger.info("start test ... [ {}/{} epoch ]".format(epoch, num_of_epoch))
         test_accuracy, test_loss = test(config, writer, epoch, pretext_model, downstream_model,
-                                        test_loader, optimizer, format_logger, speaker_dict)
+                                        test_loader, optimizer, format_logger, speaker_dict, device_context)
 
         if test_accuracy > best_accuracy:
             best_accuracy = test_accuracy
@@ -101,8 +108,9 @@ def main():
                                                             now.minute, now.second))
 
 
-def train(config, writer, epoch, pretext_model, downstream_model, train_loader, optimizer, format_logger, speaker_dict):
-    pretext_model.eval()
+def train(config, writer, epoch, pretext_model, downstream_model, train_loader, optimizer, format_logger, speaker_dict, device_context):
+    if pretext_model is not None:
+        pretext_model.eval()
     downstream_model.train()
     criterion = nn.CrossEntropyLoss()
     total_loss = 0.0
@@ -112,19 +120,22 @@ def train(config, writer, epoch, pretext_model, downstream_model, train_loader,
     ))
     for batch_idx, (waveform, filename, speaker_id) in enumerate(train_loader):
         targets = make_target(speaker_id, speaker_dict)
-        if config['use_cuda']:
-            data = waveform.cuda()
-            targets = targets.cuda()
-        with torch.no_grad():
-            loss, accuracy, z, c = pretext_model(data)
+        data, targets = device_context.to(waveform, targets)
+        if pretext_model is None:
+            c = data
+        else:
+            with torch.no_grad():
+                with device_context.autocast():
+                    loss, accuracy, z, c = pretext_model(data)
         # targets = torch.nn.functional.one_hot(targets, num_classes=251)
         c = c.detach()
-        embeds, preds = downstream_model(c)
-        loss = criterion(preds, targets)
+        with device_context.autocast():
+            embeds, preds = downstream_model(c)
+            loss = criterion(preds, targets)
 
         downstream_model.zero_grad()
-        loss.backward()
-        optimizer.step()
+        device_context.backward(loss)
+        device_context.step(optimizer)
 
         accuracy = torch.zeros(1)
         _, predicted = torch.max(preds.data, 1)
@@ -149,8 +160,9 @@ def train(config, writer, epoch, pretext_model, downstream_model, train_loader,
     writer.add_scalar('Accuracy/train', total_accuracy * 100, (epoch - 1))
 
 
-def test(config, writer, epoch, pretext_model, downstream_model, test_loader, optimizer, format_logger, speaker_dict):
-    pretext_model.eval()
+def test(config, writer, epoch, pretext_model, downstream_model, test_loader, optimizer, format_logger, speaker_dict, device_context):
+    if pretext_model is not None:
+        pretext_model.eval()
     downstream_model.eval()
     criterion = nn.CrossEntropyLoss()
     total_loss = 0.0
@@ -163,15 +175,18 @@ def test(config, writer, epoch, pretext_model, downstream_model, test_loader, op
     with torch.no_grad():
         for batch_idx, (waveform, filename, speaker_id) in enumerate(test_loader):
             targets = make_target(speaker_id, speaker_dict)
-            if config['use_cuda']:
-                data = waveform.cuda()
-                targets = targets.cuda()
+            data, targets = device_context.to(waveform, targets)
 
-            loss, accuracy, z, c = pretext_model(data)
+            if pretext_model is None:
+                c = data
+            else:
+                with device_context.autocast():
+                    loss, accuracy, z, c = pretext_model(data)
             # targets = torch.nn.functional.one_hot(targets, num_classes=251)
             c = c.detach()
-            embeds, preds = downstream_model(c)
-            loss = criterion(preds, targets)
+            with device_context.autocast():
+                embeds, preds = downstream_model(c)
+                loss = criterion(preds, targets)
 
             accuracy = torch.zeros(1)
             _, predicted = torch.max(preds.data, 1)
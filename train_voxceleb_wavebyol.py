@@ -1,4 +1,3 @@
-import os
 import argparse
 import json
 import numpy as np
@@ -6,13 +5,14 @@ import torch
 import random
 import torch.nn as nn
 import src.utils.interface_logger as logger
+import src.utils.interface_device as device_pack
 import src.data.dataset as dataset
 import src.models.model as model_pack
+import src.models.model_inference as inference_pack
 import src.losses.criterion as losses
 import src.optimizers.optimizer as optimizers
 import src.utils.interface_tensorboard as tensorboard
 import src.utils.interface_train_tool as train_tool
-os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 # 41444
 
 def main():
@@ -32,6 +32,9 @@ def main():
     format_logger = logger.setup_log(save_filename="{}-{}.log".format(config['log_filename'], now))
     # gpu check
     format_logger.info("GPU: {}".format(torch.cuda.is_available()))
+    # config의 device / precision (GPU가 없으면 CPU)
+    device_context = device_pack.get_device_context(config)
+    format_logger.info("device: {}".format(device_context))
 
     # print configuration 출력
     format_logger.info('configurations: {}'.format(config))
@@ -42,7 +45,10 @@ def main():
     test_loader, test_dataset = dataset.get_dataloader(config=config, mode='test')
 
     format_logger.info("load_model ...")
-    pretext_model = model_pack.load_model(config, config['pretext_model_name'], config['pretext_checkpoint'])
+    # train/test_embedding_store가 있으면 extract_embeddings.py로 저장한 embedding으로 학습 (pretext model 없음)
+    pretext_model = None
+    if not dataset.use_embedding_store(config):
+        pretext_model = model_pack.load_model(config, config['pretext_model_name'], config['pretext_checkpoint'])
     downstream_model = model_pack.load_model(config, config['downstream_model_name'], config['downstream_checkpoint'])
 
     # setup speaker classfication label
@@ -51,20 +57,23 @@ def main():
 
     optimizer = optimizers.get_optimizer(downstream_model.parameters(), config)
 
-    # if gpu available: load gpu
-    if config['use_cuda']:
-        pretext_model = pretext_model.cuda()
-        downstream_model = downstream_model.cuda()
+    # config의 device / precision으로 model 이동
+    downstream_model = device_context.to_module(downstream_model)
+    if pretext_model is not None:
+        pretext_model = device_context.to_module(pretext_model)
+        # config의 inference_backend (trace / compile)면 pretext model의 online branch만 compile해서 사용
+        pretext_model = inference_pack.get_inference_model(pretext_model, config, methods=['get_projection'])
 
     writer = tensorboard.set_tensorboard_writer(
         "{}-{}".format(config['tensorboard_writer_name'], now)
     )
 
     # print model information
-    format_logger.info(">>> pretext_model_structure <<<")
-    model_params = sum(p.numel() for p in pretext_model.parameters() if p.requires_grad)
-    format_logger.info("pretext model parameters: {}".format(model_params))
-    format_logger.info("{}".format(pretext_model))
+    if pretext_model is not None:
+        format_logger.info(">>> pretext_model_structure <<<")
+        model_params = sum(p.numel() for p in pretext_model.parameters() if p.requires_grad)
+        format_logger.info("pretext model parameters: {}".format(model_params))
+        format_logger.info("{}".format(pretext_model))
 
     format_logger.info(">>> downstream_model_structure <<<")
     model_params = sum(p.numel() for p in downstream_model.parameters() if p.requires_grad)
@@ -78,10 +87,10 @@ def main():
         epoch = epoch + 1
         format_logger.info("start train ... [ {}/{} epoch ]".format(epoch, num_of_epoch))
         train_accuracy, train_loss = train(config, writer, epoch, pretext_model, downstream_model, train_loader, optimizer, format_logger,
-                                           acoustic_dict)
+                                           acoustic_dict, device_context)
         format_logger.info("start test ... [ {}/{} epoch ]".format(epoch, num_of_epoch))
         test_accuracy, test_loss = test(config, writer, epoch, pretext_model, downstream_model,
-                                        test_loader, optimizer, format_logger, acoustic_dict)
+                                        test_loader, optimizer, format_logger, acoustic_dict, device_context)
 
         if test_accuracy > best_accuracy:
             best_accuracy = test_accuracy
@@ -91,28 +100,32 @@ def main():
                                        date='{}'.format(now))
 
 
-def train(config, writer, epoch, pretext_model, downstream_model, data_loader, optimizer, format_logger, acoustic_dict):
+def train(config, writer, epoch, pretext_model, downstream_model, data_loader, optimizer, format_logger, acoustic_dict, device_context):
     total_loss = 0.0
     total_accuracy = 0.0
-    pretext_model.eval()
+    if pretext_model is not None:
+        pretext_model.eval()
     downstream_model.train()
     criterion = losses.set_criterion(config["loss_function"])
     for batch_idx, (waveform, acoustic_id) in enumerate(data_loader):
         # 데이터로더의 변경이 필요한가?
         targets = make_target(acoustic_id, acoustic_dict)
-        if config['use_cuda']:
-            data = waveform.cuda()
-            targets = targets.cuda()
-        with torch.no_grad():
-            representation, vec = pretext_model.get_projection(data)
+        data, targets = device_context.to(waveform, targets)
+        if pretext_model is None:
+            representation = data
+        else:
+            with torch.no_grad():
+                with device_context.autocast():
+                    representation, vec = pretext_model.get_projection(data)
         representation = representation.detach()
         # print(representation.size())
-        predictions = downstream_model(representation)
-        loss = criterion(predictions, targets)
+        with device_context.autocast():
+            predictions = downstream_model(representation)
+            loss = criterion(predictions, targets)
 
         downstream_model.zero_grad()
-        loss.backward()
-        optimizer.step()
+        device_context.backward(loss)
+        device_context.step(optimizer)
 
         accuracy = torch.zeros(1)
         _, predicted = torch.max(predictions.data, 1)
@@ -145,28 +158,32 @@ def train(config, writer, epoch, pretext_model, downstream_model, data_loader, o
     return total_accuracy, total_loss
 
 
-def test(config, writer, epoch, pretext_model, downstream_model, data_loader, optimizer, format_logger, acoustic_dict):
+def test(config, writer, epoch, pretext_model, downstream_model, data_loader, optimizer, format_logger, acoustic_dict, device_context):
     total_loss = 0.0
     total_accuracy = 0.0
-    pretext_model.eval()
+    if pretext_model is not None:
+        pretext_model.eval()
     downstream_model.eval()
     criterion = losses.set_criterion(config["loss_function"])
     with torch.no_grad():
         for batch_idx, (waveform, acoustic_id) in enumerate(data_loader):
             # 데이터로더의 변경이 필요한가?
             targets = make_target(acoustic_id, acoustic_dict)
-            if config['use_cuda']:
-                data = waveform.cuda()
-                targets = targets.cuda()
+            data, targets = device_context.to(waveform, targets)
 
-            representation, vec  = pretext_model.get_projection(data)
+            if pretext_model is None:
+                representation = data
+            else:
+                with device_context.autocast():
+                    representation, vec = pretext_model.get_projection(data)
             # representation = representation.detach()
             # B, T, D, C = representation.shape
             # # shape 변경 (batch, time, frequency * channel)
             # representation = representation.reshape((B, T * C * D))
 
-            predictions = downstream_model(representation)
-            loss = criterion(predictions, targets)
+            with device_context.autocast():
+                predictions = downstream_model(representation)
+                loss = criterion(predictions, targets)
 
             accuracy = torch.zeros(1)
             _, predicted = torch.max(predictions.data, 1)
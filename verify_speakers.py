@@ -0,0 +1,42 @@
+import argparse
+import json
+import time
+import src.utils.interface_verification as verification
+
+
+def main():
+    # embedding store entry (extract_embeddings.py 결과)로 speaker verification trial을 scoring 해서 EER / minDCF 출력
+    parser = argparse.ArgumentParser(description='waverdeep - speaker verification EER / minDCF on stored embeddings')
+    parser.add_argument('--configuration', required=False,
+                        default='./config/config-downstream-WaveBYOL-VoxCeleb.json')
+    parser.add_argument('--trials', required=True, help='trial list: "<1/0> <enrol path> <test path>" per line')
+    parser.add_argument('--entry', default=None, help='embedding store entry (default: test_embedding_store)')
+    parser.add_argument('--chunk_size', default=1024, type=int)
+    parser.add_argument('--p_target', default=[0.01, 0.05], nargs='+', type=float)
+    args = parser.parse_args()
+    with open(args.configuration, 'r') as configuration:
+        config = json.load(configuration)
+    entry_path = args.entry or config['test_embedding_store']
+
+    start = time.perf_counter()
+    labels, enrol_paths, test_paths = verification.read_trials(args.trials)
+    embeddings, rows = verification.file_embeddings(entry_path)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = verification.score_trials(embeddings, verification.trial_rows(enrol_paths, rows),
+                                       verification.trial_rows(test_paths, rows), args.chunk_size)
+    rates = verification.error_rates(scores, labels)
+    eer, eer_threshold = verification.compute_eer(*rates)
+    min_dcfs = [verification.compute_min_dcf(*rates, p_target=p_target) for p_target in args.p_target]
+    score_time = time.perf_counter() - start
+
+    print("{} trials / {} files (load {:.2f} sec, scoring {:.2f} sec)".format(
+        len(labels), len(embeddings), load_time, score_time))
+    print("EER {:.3f}% (threshold {:.4f})".format(eer * 100, eer_threshold))
+    for p_target, (min_dcf, threshold) in zip(args.p_target, min_dcfs):
+        print("minDCF (p_target {:g}) {:.4f} (threshold {:.4f})".format(p_target, min_dcf, threshold))
+
+
+if __name__ == '__main__':
+    main()